@@ -15,6 +15,8 @@ from rich.table import Table
 
 from synthetic_data_kit.utils.config import load_config, get_vllm_config, get_openai_config, get_llm_provider, get_path_config
 from synthetic_data_kit.core.context import AppContext
+from synthetic_data_kit.models.endpoints import parse_endpoints
+from synthetic_data_kit.utils.deadline import set_deadline
 from synthetic_data_kit.server.app import run_server
 
 # Initialize Typer app
@@ -28,12 +30,29 @@ console = Console()
 # Create app context
 ctx = AppContext()
 
+
+def _vllm_server_available(api_base: str) -> bool:
+    """Check whether a vLLM server answers on its /models endpoint"""
+    try:
+        return requests.get(f"{api_base}/models", timeout=2).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+def _replaying_cassette(config: dict) -> bool:
+    """Check whether LLM traffic is served from a cassette, so no server is needed"""
+    return ((config.get("llm") or {}).get("cassette") or {}).get("mode") == "replay"
+
+
 # Define global options
 @app.callback()
 def callback(
     config: Optional[Path] = typer.Option(
         None, "--config", "-c", help="Path to configuration file"
     ),
+    deadline: Optional[float] = typer.Option(
+        None, "--deadline", help="Stop LLM requests after this many seconds and save partial results"
+    ),
 ):
     """
     Global options for the Synthetic Data Kit CLI
@@ -41,6 +60,7 @@ def callback(
     if config:
         ctx.config_path = config
     ctx.config = load_config(ctx.config_path)
+    set_deadline(deadline)
 
 
 @app.command("system-check")
@@ -134,24 +154,30 @@ def system_check(
         model = vllm_config.get("model")
         port = vllm_config.get("port", 8000)
         
-        with console.status(f"Checking vLLM server at {api_base}..."):
-            try:
-                response = requests.get(f"{api_base}/models", timeout=2)
-                if response.status_code == 200:
-                    console.print(f" vLLM server is running at {api_base}", style="green")
-                    console.print(f"Available models: {response.json()}")
-                    return 0
-                else:
-                    console.print(f"L vLLM server is not available at {api_base}", style="red")
-                    console.print(f"Error: Server returned status code: {response.status_code}")
-            except requests.exceptions.RequestException as e:
-                console.print(f"L vLLM server is not available at {api_base}", style="red")
-                console.print(f"Error: {str(e)}")
-                
-            # Show instruction to start the server
-            console.print("\nTo start the server, run:", style="yellow")
-            console.print(f"vllm serve {model} --port {port}", style="bold blue")
-            return 1
+        # Every replica is checked when several endpoints are configured
+        running = False
+        for endpoint in parse_endpoints(api_base):
+            with console.status(f"Checking vLLM server at {endpoint}..."):
+                try:
+                    response = requests.get(f"{endpoint}/models", timeout=2)
+                    if response.status_code == 200:
+                        console.print(f" vLLM server is running at {endpoint}", style="green")
+                        console.print(f"Available models: {response.json()}")
+                        running = True
+                    else:
+                        console.print(f"L vLLM server is not available at {endpoint}", style="red")
+                        console.print(f"Error: Server returned status code: {response.status_code}")
+                except requests.exceptions.RequestException as e:
+                    console.print(f"L vLLM server is not available at {endpoint}", style="red")
+                    console.print(f"Error: {str(e)}")
+        
+        if running:
+            return 0
+        
+        # Show instruction to start the server
+        console.print("\nTo start the server, run:", style="yellow")
+        console.print(f"vllm serve {model} --port {port}", style="bold blue")
+        return 1
 
 
 @app.command()
@@ -280,6 +306,10 @@ def create(
     chunk_overlap: Optional[int] = typer.Option(
         None, "--chunk-overlap", help="Overlap between chunks in characters (default: 200)"
     ),
+    summary_strategy: Optional[str] = typer.Option(
+        None, "--summary-strategy",
+        help="How to summarize documents [auto|single|map_reduce|extractive] (extractive makes no LLM call)"
+    ),
     verbose: bool = typer.Option(
         False, "--verbose", "-v", help="Show detailed output"
     ),
@@ -325,15 +355,9 @@ def create(
         api_base = api_base or vllm_config.get("api_base")
         model = model or vllm_config.get("model")
         
-        # Check vLLM server availability
-        try:
-            response = requests.get(f"{api_base}/models", timeout=2)
-            if response.status_code != 200:
-                console.print(f"❌ Error: VLLM server not available at {api_base}", style="red")
-                console.print("Please start the VLLM server with:", style="yellow")
-                console.print(f"vllm serve {model}", style="bold blue")
-                return 1
-        except requests.exceptions.RequestException:
+        # Check vLLM server availability (any one replica is enough; none when replaying a cassette)
+        if not _replaying_cassette(ctx.config) and \
+                not any(_vllm_server_available(endpoint) for endpoint in parse_endpoints(api_base)):
             console.print(f"❌ Error: VLLM server not available at {api_base}", style="red")
             console.print("Please start the VLLM server with:", style="yellow")
             console.print(f"vllm serve {model}", style="bold blue")
@@ -395,7 +419,8 @@ def create(
                 verbose=verbose,
                 provider=provider,
                 chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap
+                chunk_overlap=chunk_overlap,
+                summary_strategy=summary_strategy
             )
             
             # Return appropriate exit code
@@ -422,7 +447,8 @@ def create(
                     verbose,
                     provider=provider,
                     chunk_size=chunk_size,
-                    chunk_overlap=chunk_overlap
+                    chunk_overlap=chunk_overlap,
+                    summary_strategy=summary_strategy
                 )
             if output_path:
                 console.print(f"✅ Content saved to [bold]{output_path}[/bold]", style="green")
@@ -485,15 +511,9 @@ def curate(
         api_base = api_base or vllm_config.get("api_base")
         model = model or vllm_config.get("model")
         
-        # Check vLLM server availability
-        try:
-            response = requests.get(f"{api_base}/models", timeout=2)
-            if response.status_code != 200:
-                console.print(f"❌ Error: VLLM server not available at {api_base}", style="red")
-                console.print("Please start the VLLM server with:", style="yellow")
-                console.print(f"vllm serve {model}", style="bold blue")
-                return 1
-        except requests.exceptions.RequestException:
+        # Check vLLM server availability (any one replica is enough; none when replaying a cassette)
+        if not _replaying_cassette(ctx.config) and \
+                not any(_vllm_server_available(endpoint) for endpoint in parse_endpoints(api_base)):
             console.print(f"❌ Error: VLLM server not available at {api_base}", style="red")
             console.print("Please start the VLLM server with:", style="yellow")
             console.print(f"vllm serve {model}", style="bold blue")
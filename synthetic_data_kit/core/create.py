@@ -9,7 +9,7 @@ import json
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-from synthetic_data_kit.models.llm_client import LLMClient
+from synthetic_data_kit.models.client_registry import get_llm_client
 from synthetic_data_kit.generators.qa_generator import QAGenerator
 from synthetic_data_kit.generators.vqa_generator import VQAGenerator
 from synthetic_data_kit.utils.config import get_generation_config
@@ -21,6 +21,14 @@ def read_json(file_path):
     return document_text
 
 
+def _override_generation_config(generator, overrides: Dict[str, Any]):
+    """Apply per-call generation overrides, merging nested sections such as `summary`"""
+    for key, value in overrides.items():
+        if isinstance(value, dict):
+            value = {**(generator.generation_config.get(key) or {}), **value}
+        generator.generation_config[key] = value
+
+
 def process_file(
     file_path: str,
     output_dir: str,
@@ -33,6 +41,7 @@ def process_file(
     provider: Optional[str] = None,
     chunk_size: Optional[int] = None,
     chunk_overlap: Optional[int] = None,
+    summary_strategy: Optional[str] = None,
 ) -> str:
     """Process a file to generate content
     
@@ -45,6 +54,7 @@ def process_file(
         content_type: Type of content to generate (qa, summary, cot)
         num_pairs: Target number of QA pairs to generate
         threshold: Quality threshold for filtering (1-10)
+        summary_strategy: Override generation.summary.strategy (e.g. "extractive")
     
     Returns:
         Path to the output file
@@ -53,19 +63,25 @@ def process_file(
     # The reason for having this directory logic for now is explained in context.py
     os.makedirs(output_dir, exist_ok=True)
     
-    # Initialize LLM client
-    client = LLMClient(
+    # Get the LLM client, shared with other files using the same settings
+    client = get_llm_client(
         config_path=config_path,
         provider=provider,
         api_base=api_base,
         model_name=model
     )
     
-    # Override chunking config if provided
+    # The shared client's counters span every file; report only this file's share
+    metrics_before = client.get_metrics()
+    
+    # Chunking overrides go to this file's generator, not the shared client
+    generation_overrides = {}
     if chunk_size is not None:
-        client.config.setdefault('generation', {})['chunk_size'] = chunk_size
+        generation_overrides['chunk_size'] = chunk_size
     if chunk_overlap is not None:
-        client.config.setdefault('generation', {})['overlap'] = chunk_overlap
+        generation_overrides['overlap'] = chunk_overlap
+    if summary_strategy is not None:
+        generation_overrides['summary'] = {'strategy': summary_strategy}
     
     # Debug: Print which provider is being used
     print(f"L Using {client.provider} provider")
@@ -76,6 +92,7 @@ def process_file(
     # Generate content based on type
     if content_type == "qa":
         generator = QAGenerator(client, config_path)
+        _override_generation_config(generator, generation_overrides)
 
         document_text = read_json(file_path)
         
@@ -92,6 +109,11 @@ def process_file(
             verbose=verbose
         )
         
+        # Attach client run metrics (e.g. adaptive concurrency history)
+        llm_metrics = client.get_metrics(since=metrics_before)
+        if llm_metrics:
+            result.setdefault("metrics", {})["llm"] = llm_metrics
+        
         # Save output
         output_path = os.path.join(output_dir, f"{base_name}_qa_pairs.json")
         print(f"Saving result to {output_path}")
@@ -117,6 +139,7 @@ def process_file(
     
     elif content_type == "summary":
         generator = QAGenerator(client, config_path)
+        _override_generation_config(generator, generation_overrides)
 
         document_text = read_json(file_path)
         
@@ -139,6 +162,7 @@ def process_file(
         
         # Initialize the CoT generator
         generator = COTGenerator(client, config_path)
+        _override_generation_config(generator, generation_overrides)
 
         document_text = read_json(file_path)
         
@@ -155,6 +179,11 @@ def process_file(
             include_simple_steps=verbose  # More detailed if verbose is enabled
         )
         
+        # Attach client run metrics (e.g. adaptive concurrency history)
+        llm_metrics = client.get_metrics(since=metrics_before)
+        if llm_metrics:
+            result.setdefault("metrics", {})["llm"] = llm_metrics
+        
         # Save output
         output_path = os.path.join(output_dir, f"{base_name}_cot_examples.json")
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -177,6 +206,7 @@ def process_file(
         
         # Initialize the CoT generator
         generator = COTGenerator(client, config_path)
+        _override_generation_config(generator, generation_overrides)
 
         document_text = read_json(file_path)
         
@@ -10,10 +10,11 @@ import json
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 
-from synthetic_data_kit.models.llm_client import LLMClient
+from synthetic_data_kit.models.client_registry import get_llm_client
 from synthetic_data_kit.generators.qa_generator import QAGenerator
 from synthetic_data_kit.utils.config import get_curate_config, get_prompt
 from synthetic_data_kit.utils.llm_processing import convert_to_conversation_format, parse_ratings
+from synthetic_data_kit.utils.schemas import RATINGS_SCHEMA
 
 def curate_qa_pairs(
     input_path: str,
@@ -57,13 +58,15 @@ def curate_qa_pairs(
     if not qa_pairs:
         raise ValueError("No QA pairs found in the input file")
     
-    # Initialize LLM client
-    client = LLMClient(
+    # Get the LLM client, shared with other files using the same settings
+    client = get_llm_client(
         config_path=config_path,
         provider=provider,
         api_base=api_base,
         model_name=model
     )
+    # The shared client's counters span every file; report only this file's share
+    metrics_before = client.get_metrics()
     
     # Get threshold from args, then config, then default
     if threshold is None:
@@ -139,113 +142,98 @@ def curate_qa_pairs(
         progress_ctx = None
         rate_task = None
     
-    # Process in inference batches
-    for batch_start in range(0, len(all_messages), inference_batch):
-        batch_end = min(batch_start + inference_batch, len(all_messages))
-        current_batch = all_messages[batch_start:batch_end]
-        current_batch_size = len(current_batch)
-        
-        batch_num = batch_start//inference_batch + 1
-        total_batches = (len(all_messages) + inference_batch - 1)//inference_batch
-        
-        # Simple progress indicator for non-verbose mode
-        if not verbose:
-            print(f"Processing batch {batch_num}/{total_batches}...", end="\r")
-        else:
-            print(f"Processing batch {batch_num}/{total_batches}")
-        
-        try:
-            # Get ratings for the batch
-            if verbose:
-                print(f"Sending batch request with {len(current_batch)} items")
-                
-            batch_responses = client.batch_completion(
-                current_batch,
-                temperature=rating_temperature,
-                batch_size=inference_batch
-            )
+    # Stream rating requests with up to inference_batch in flight at once
+    completed = 0
+    responses = client.iter_completion(
+        all_messages,
+        temperature=rating_temperature,
+        max_in_flight=inference_batch,
+        cache=True,
+        json_schema=RATINGS_SCHEMA,
+        task="qa_rating",
+        items=batch_size
+    )
+    
+    try:
+        for original_batch_index, response in responses:
+            completed += 1
             
-            if verbose:
-                print(f"Received {len(batch_responses)} responses")
-                for i, resp in enumerate(batch_responses):
-                    print(f"Response {i+1}: {resp[:100]}...")
+            # Simple progress indicator for non-verbose mode
+            if not verbose:
+                print(f"Processed {completed}/{len(batches)} batches...", end="\r")
+            else:
+                print(f"Received response for batch {original_batch_index+1}: {response[:100]}...")
             
-            # Process each response
-            for j, response in enumerate(batch_responses):
-                original_batch_index = batch_start + j
-                if original_batch_index < len(batches):
-                    original_batch = batches[original_batch_index]
-                    
-                    # Parse the ratings with original batch for fallback
-                    try:
-                        if verbose:
-                            print(f"Processing batch {original_batch_index+1}")
-                            
-                        rated_batch = parse_ratings(response, original_batch)
-                        
-                        # Process the rated batch
-                        for pair in rated_batch:
-                            if "rating" in pair:
-                                rating = pair["rating"]
-                                total_score += rating
-                                total_evaluated += 1
-                                
-                                if rating >= threshold:
-                                    filtered_pairs.append(pair)
-                                    total_passed += 1
-                    except Exception as e:
-                        if verbose:
-                            print(f"Error processing batch {original_batch_index+1}: {str(e)}")
-                            print(f"First 100 chars of response: {response[:100]}")
+            original_batch = batches[original_batch_index]
+            
+            # Parse the ratings with original batch for fallback
+            try:
+                rated_batch = parse_ratings(response, original_batch)
+                
+                # Process the rated batch
+                for pair in rated_batch:
+                    if "rating" in pair:
+                        rating = pair["rating"]
+                        total_score += rating
+                        total_evaluated += 1
                         
-                        # Try processing one pair at a time as a fallback
+                        if rating >= threshold:
+                            filtered_pairs.append(pair)
+                            total_passed += 1
+            except Exception as e:
+                if verbose:
+                    print(f"Error processing batch {original_batch_index+1}: {str(e)}")
+                    print(f"First 100 chars of response: {response[:100]}")
+                
+                # Try processing one pair at a time as a fallback
+                try:
+                    if verbose:
+                        print("Attempting to process items individually...")
+                    
+                    for item in original_batch:
+                        item_json = json.dumps(item, indent=2)
+                        rating_prompt = rating_prompt_template.format(pairs=item_json)
+                        item_response = client.chat_completion(
+                            [{"role": "system", "content": rating_prompt}],
+                            temperature=rating_temperature,
+                            cache=True,
+                            json_schema=RATINGS_SCHEMA,
+                            task="qa_rating"
+                        )
                         try:
+                            # This should be a single item
+                            rated_item = parse_ratings(item_response, [item])
+                            if rated_item and len(rated_item) > 0:
+                                pair = rated_item[0]
+                                if "rating" in pair:
+                                    rating = pair["rating"]
+                                    total_score += rating
+                                    total_evaluated += 1
+                                    
+                                    if rating >= threshold:
+                                        filtered_pairs.append(pair)
+                                        total_passed += 1
+                                        if verbose:
+                                            print(f"Successfully processed individual item with rating {rating}")
+                        except Exception as inner_e:
                             if verbose:
-                                print("Attempting to process items individually...")
-                            
-                            for item in original_batch:
-                                item_json = json.dumps(item, indent=2)
-                                rating_prompt = rating_prompt_template.format(pairs=item_json)
-                                item_response = client.chat_completion(
-                                    [{"role": "system", "content": rating_prompt}],
-                                    temperature=rating_temperature
-                                )
-                                try:
-                                    # This should be a single item
-                                    rated_item = parse_ratings(item_response, [item])
-                                    if rated_item and len(rated_item) > 0:
-                                        pair = rated_item[0]
-                                        if "rating" in pair:
-                                            rating = pair["rating"]
-                                            total_score += rating
-                                            total_evaluated += 1
-                                            
-                                            if rating >= threshold:
-                                                filtered_pairs.append(pair)
-                                                total_passed += 1
-                                                if verbose:
-                                                    print(f"Successfully processed individual item with rating {rating}")
-                                except Exception as inner_e:
-                                    if verbose:
-                                        print(f"Failed to process individual item: {str(inner_e)}")
-                        except Exception as fallback_e:
-                            if verbose:
-                                print(f"Fallback processing failed: {str(fallback_e)}")
-                            
-                        # Continue processing other batches rather than failing completely
-                        pass
-            
-            # Update progress bar if in verbose mode
-            if progress_ctx and rate_task:
-                progress_ctx.update(rate_task, advance=current_batch_size)
-            
-        except Exception as e:
-            if verbose:
-                print(f"Error processing inference batch {batch_num}: {str(e)}")
+                                print(f"Failed to process individual item: {str(inner_e)}")
+                except Exception as fallback_e:
+                    if verbose:
+                        print(f"Fallback processing failed: {str(fallback_e)}")
+                    
+                # Continue processing other batches rather than failing completely
+                pass
             
             # Update progress bar if in verbose mode
-            if progress_ctx and rate_task:
-                progress_ctx.update(rate_task, advance=current_batch_size)
+            if progress_ctx:
+                progress_ctx.update(rate_task, advance=1)
+    
+    except Exception as e:
+        if verbose:
+            print(f"Error processing rating batches: {str(e)}")
+    finally:
+        responses.close()
     
     # Stop progress bar if in verbose mode
     if progress_ctx:
@@ -264,6 +252,11 @@ def curate_qa_pairs(
         "avg_score": round(total_score / total_evaluated, 1) if total_evaluated else 0
     }
     
+    # Attach client run metrics (e.g. adaptive concurrency history)
+    llm_metrics = client.get_metrics(since=metrics_before)
+    if llm_metrics:
+        metrics["llm"] = llm_metrics
+    
     # Always print basic stats, even in non-verbose mode
     print(f"Rated {total_evaluated} QA pairs")
     print(f"Retained {total_passed} pairs (threshold: {threshold})")
@@ -11,7 +11,11 @@ from typing import Dict, List, Any, Optional
 from pathlib import Path
 
 from synthetic_data_kit.models.llm_client import LLMClient
-from synthetic_data_kit.utils.config import get_prompt, get_generation_config
+from synthetic_data_kit.generators.summarizer import DocumentSummarizer
+from synthetic_data_kit.utils.config import get_prompt, get_generation_config, format_text_prompt
+from synthetic_data_kit.utils.llm_processing import parse_structured_output, IncrementalJSONArrayParser
+from synthetic_data_kit.utils.schemas import COT_EXAMPLES_SCHEMA
+from synthetic_data_kit.utils.text import estimate_tokens
 
 class COTGenerator:
     """Generates chain-of-thought reasoning examples"""
@@ -20,13 +24,22 @@ class COTGenerator:
         """Initialize the CoT Generator with an LLM client and optional config"""
         self.client = client
         self.config = client.config
-        self.generation_config = get_generation_config(self.config)
+        # A copy, since the client (and its config) may be shared between files
+        self.generation_config = dict(get_generation_config(self.config))
+        self.summarizer = DocumentSummarizer(client, self.config, self.generation_config)
+        # Chunk requests of the last chunked generation run
+        self.chunk_stats = {"chunks": 0, "completed": 0, "calls_avoided": 0}
     
     def parse_json_output(self, output_text: str) -> Optional[List[Dict]]:
         """Parse JSON from LLM output text"""
         verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
         output_text = output_text.strip()
         
+        # Structured output needs no repair
+        structured = parse_structured_output(output_text, "examples")
+        if structured is not None:
+            return structured
+        
         # Try to extract JSON array
         json_match = re.search(r"\[.*\]", output_text, re.DOTALL)
         if json_match:
@@ -63,7 +76,20 @@ class COTGenerator:
         # For small documents, use single call
         single_call_max_size = self.generation_config.get("single_call_max_size", 8000)
         if len(document_text) < single_call_max_size:
-            return self._generate_single_call(document_text, num_examples)
+            # Unless the prompt would not fit the context window
+            text_limit = self.client.text_token_limit(
+                format_text_prompt(
+                    get_prompt(self.config, "cot_generation"), "",
+                    layout=self.generation_config.get("prompt_layout", "inline"),
+                    num_examples=num_examples
+                ),
+                task="cot_generation",
+                items=num_examples
+            )
+            if text_limit is None or estimate_tokens(document_text) <= text_limit:
+                return self._generate_single_call(document_text, num_examples)
+            if verbose:
+                print("Document exceeds the context window for a single call, using chunking")
         
         # For large documents, use chunking (same logic as QA generator)
         return self._generate_with_chunking(document_text, num_examples)
@@ -76,23 +102,26 @@ class COTGenerator:
         prompt_template = get_prompt(self.config, "cot_generation")
         
         # Format the prompt
-        prompt = prompt_template.format(
-            num_examples=num_examples,
-            text=document_text
+        messages = format_text_prompt(
+            prompt_template,
+            document_text,
+            layout=self.generation_config.get("prompt_layout", "inline"),
+            num_examples=num_examples
         )
         
         # Generate examples
         temperature = self.generation_config.get("temperature", 0.7)
-        max_tokens = self.generation_config.get("max_tokens", 4096)
         
         if verbose:
             print(f"Generating {num_examples} CoT examples (single call)...")
         
-        messages = [{"role": "system", "content": prompt}]
+        # max_tokens comes from the output budget when one is configured
         response = self.client.chat_completion(
             messages, 
             temperature=temperature,
-            max_tokens=max_tokens
+            json_schema=COT_EXAMPLES_SCHEMA,
+            task="cot_generation",
+            items=num_examples
         )
         
         # Parse response
@@ -110,7 +139,7 @@ class COTGenerator:
     
     def _generate_with_chunking(self, document_text: str, num_examples: int) -> List[Dict[str, Any]]:
         """Generate CoT examples using chunking strategy (copied from QA generator)"""
-        from synthetic_data_kit.utils.text import split_into_chunks
+        from synthetic_data_kit.utils.text import split_into_chunks, split_oversized_chunks, CHARS_PER_TOKEN
         
         verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
         
@@ -119,6 +148,7 @@ class COTGenerator:
         temperature = self.generation_config.get("temperature", 0.7)
         overlap = self.generation_config.get("overlap", 200)
         batch_size = self.generation_config.get("batch_size", 32)
+        stream = self.generation_config.get("stream", False)
         
         # Split text into chunks
         chunks = split_into_chunks(
@@ -127,94 +157,119 @@ class COTGenerator:
             overlap=overlap
         )
         
+        # Get CoT generation prompt template
+        cot_prompt_template = get_prompt(self.config, "cot_generation")
+        prompt_layout = self.generation_config.get("prompt_layout", "inline")
+        
+        # Split chunks further if their prompts would not fit the context window
+        text_limit = self.client.text_token_limit(
+            format_text_prompt(cot_prompt_template, "", layout=prompt_layout, num_examples=num_examples),
+            task="cot_generation",
+            items=max(1, round(num_examples / len(chunks)))
+        )
+        if text_limit:
+            fitted_chunks = split_oversized_chunks(chunks, text_limit * CHARS_PER_TOKEN)
+            if len(fitted_chunks) > len(chunks):
+                print(f"Split oversized chunks to fit the context window ({len(chunks)} -> {len(fitted_chunks)} chunks)")
+            chunks = fitted_chunks
+        
         if verbose:
             print(f"Generating CoT examples using chunking...")
             print(f"Document split into {len(chunks)} chunks")
-            print(f"Using batch size of {batch_size}")
+            print(f"Keeping up to {batch_size} requests in flight")
         
-        all_examples = []
         examples_per_chunk = max(1, round(num_examples / len(chunks)))
         
-        # Get CoT generation prompt template
-        cot_prompt_template = get_prompt(self.config, "cot_generation")
-        
         # Prepare all message batches
         all_messages = []
         for i, chunk in enumerate(chunks):
             # Format the prompt with text
-            cot_prompt = cot_prompt_template.format(
-                num_examples=examples_per_chunk,
-                text=chunk
+            messages = format_text_prompt(
+                cot_prompt_template,
+                chunk,
+                layout=prompt_layout,
+                num_examples=examples_per_chunk
             )
-            
-            messages = [
-                {"role": "system", "content": cot_prompt}
-            ]
             all_messages.append(messages)
         
         print(f"Processing {len(chunks)} chunks to generate CoT examples...")
         
-        # Process in batches (same logic as QA generator)
-        for batch_start in range(0, len(chunks), batch_size):
-            # Check if we've already generated enough examples
-            if len(all_examples) >= num_examples:
-                if verbose:
-                    print(f"Reached target of {num_examples} examples. Stopping processing.")
-                break
-                
-            batch_end = min(batch_start + batch_size, len(chunks))
-            batch_messages = all_messages[batch_start:batch_end]
-            current_batch_size = len(batch_messages)
-            
-            batch_num = batch_start//batch_size + 1
-            total_batches = (len(chunks) + batch_size - 1)//batch_size
-            
-            # Simple progress indicator for non-verbose mode
-            if not verbose:
-                print(f"Processing batch {batch_num}/{total_batches}...", end="\r")
-            else:
-                print(f"Processing batch {batch_num}/{total_batches} with {current_batch_size} chunks")
-            
-            try:
-                # Process the batch
-                batch_responses = self.client.batch_completion(
-                    batch_messages,
-                    temperature=temperature,
-                    batch_size=batch_size
-                )
-                
-                # Process each response in the batch
-                for j, response in enumerate(batch_responses):
-                    # Check if we've reached the target before processing more
-                    if len(all_examples) >= num_examples:
-                        if verbose:
-                            print(f"  Reached target of {num_examples} examples. Stopping batch processing.")
-                        break
-                        
-                    chunk_index = batch_start + j
-                    chunk_examples = self.parse_json_output(response)
-                    
-                    if chunk_examples:
-                        # Only add examples up to the target limit
-                        remaining_examples = num_examples - len(all_examples)
-                        if remaining_examples > 0:
-                            examples_to_add = chunk_examples[:remaining_examples]
-                            all_examples.extend(examples_to_add)
-                            
+        # Stream the chunk requests through a sliding window (same logic as QA generator)
+        chunk_examples = {}
+        total_examples = 0
+        completed = 0
+        early_stop_before = dict(self.client.early_stop)
+        responses = self.client.iter_completion(
+            all_messages,
+            temperature=temperature,
+            max_in_flight=batch_size,
+            json_schema=COT_EXAMPLES_SCHEMA,
+            stream=stream,
+            task="cot_generation",
+            items=examples_per_chunk
+        )
+        # With streaming, examples are taken as soon as each JSON object closes
+        parsers = {}
+        streamed_text = {}
+        
+        try:
+            for event in responses:
+                if stream:
+                    chunk_index, delta, finished = event
+                    if not finished:
+                        streamed_text[chunk_index] = streamed_text.get(chunk_index, "") + delta
+                        parser = parsers.setdefault(chunk_index, IncrementalJSONArrayParser())
+                        examples_to_add = parser.feed(delta)[:num_examples - total_examples]
+                        chunk_examples.setdefault(chunk_index, []).extend(examples_to_add)
+                        total_examples += len(examples_to_add)
+                        if total_examples >= num_examples:
                             if verbose:
-                                print(f"  Generated {len(examples_to_add)} examples from chunk {chunk_index+1} (total: {len(all_examples)}/{num_examples})")
+                                print(f"Reached target of {num_examples} examples mid-stream. Cancelling remaining requests.")
+                            break
+                        continue
+                    response = delta or streamed_text.pop(chunk_index, "")
+                else:
+                    chunk_index, response = event
+                completed += 1
+                # Examples streamed from this chunk are already in
+                parsed_examples = None if chunk_examples.get(chunk_index) else self.parse_json_output(response)
+                
+                if parsed_examples:
+                    # Only add examples up to the target limit
+                    remaining_examples = num_examples - total_examples
+                    examples_to_add = parsed_examples[:remaining_examples]
+                    chunk_examples.setdefault(chunk_index, []).extend(examples_to_add)
+                    total_examples += len(examples_to_add)
                     
-                    # Break if we've reached the target
-                    if len(all_examples) >= num_examples:
-                        break
+                    if verbose:
+                        print(f"  Generated {len(examples_to_add)} examples from chunk {chunk_index+1} (total: {total_examples}/{num_examples})")
                 
-                # Break outer loop if we've reached the target
-                if len(all_examples) >= num_examples:
-                    break
+                if not verbose:
+                    print(f"Processed {completed}/{len(chunks)} chunks...", end="\r")
                 
-            except Exception as e:
-                if verbose:
-                    print(f"  Error processing batch {batch_num}: {str(e)}")
+                # Stop as soon as we've reached the target
+                if total_examples >= num_examples:
+                    if verbose:
+                        print(f"Reached target of {num_examples} examples. Stopping processing.")
+                    break
+        
+        except Exception as e:
+            if verbose:
+                print(f"  Error processing chunks: {str(e)}")
+        finally:
+            # Cancel chunk requests that are still queued or in flight
+            responses.close()
+        
+        # Only requests that produced nothing were saved, not a chunk whose streamed examples were taken
+        calls_avoided = sum(self.client.early_stop[key] - early_stop_before[key] for key in early_stop_before)
+        if calls_avoided:
+            print(f"Reached the target of {num_examples} examples; cancelled {calls_avoided} outstanding chunk requests")
+        self.chunk_stats = {"chunks": len(chunks), "completed": completed, "calls_avoided": calls_avoided}
+        
+        # Keep examples in document order regardless of completion order
+        all_examples = []
+        for chunk_index in sorted(chunk_examples):
+            all_examples.extend(chunk_examples[chunk_index])
         
         # Clear the progress line in non-verbose mode
         if not verbose:
@@ -245,7 +300,6 @@ class COTGenerator:
         
         # Generate enhanced conversations
         temperature = self.generation_config.get("temperature", 0.2)
-        max_tokens = self.generation_config.get("max_tokens", 4096)
         
         if verbose:
             print(f"Enhancing {len(conversations)} conversations with CoT...")
@@ -254,7 +308,8 @@ class COTGenerator:
         response = self.client.chat_completion(
             messages, 
             temperature=temperature,
-            max_tokens=max_tokens
+            task="cot_enhancement",
+            items=len(conversations)
         )
         
         # Parse response
@@ -281,13 +336,10 @@ class COTGenerator:
             os.environ['SDK_VERBOSE'] = 'false'
         
         # Generate summary first (helpful context)
-        summary = self.client.chat_completion(
-            [{"role": "system", "content": "Summarize this document in 2-3 sentences."},
-             {"role": "user", "content": document_text}], 
-            temperature=0.1
-        )
+        summary = self.summarizer.summarize(document_text, "Summarize this document in 2-3 sentences.")
         
         # Generate CoT examples
+        self.chunk_stats = {"chunks": 0, "completed": 0, "calls_avoided": 0}
         examples = self.generate_cot_examples(document_text, num_examples)
         
         # Format into simple conversation format as well
@@ -308,6 +360,10 @@ class COTGenerator:
             "conversations": conversations
         }
         
+        # Report chunk requests cancelled once the target was met
+        if self.chunk_stats["calls_avoided"]:
+            result["metrics"] = {"early_stop": dict(self.chunk_stats)}
+        
         # Print stats
         print(f"Generated {len(examples)} chain-of-thought examples")
         
@@ -7,15 +7,24 @@
 
 from typing import Dict, List, Any, Optional, Tuple
 import json
-import time
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from rich.progress import Progress, BarColumn, TextColumn, TimeElapsedColumn, TimeRemainingColumn
 
 from synthetic_data_kit.models.llm_client import LLMClient
-from synthetic_data_kit.utils.text import split_into_chunks
-from synthetic_data_kit.utils.llm_processing import parse_qa_pairs, parse_ratings, convert_to_conversation_format
-from synthetic_data_kit.utils.config import load_config, get_generation_config, get_curate_config, get_prompt
+from synthetic_data_kit.generators.summarizer import DocumentSummarizer
+from synthetic_data_kit.utils.extractive import NUMPY_AVAILABLE
+from synthetic_data_kit.utils.deadline import deadline_exceeded
+from synthetic_data_kit.utils.text import split_into_chunks, split_oversized_chunks, select_chunks, CHARS_PER_TOKEN
+from synthetic_data_kit.utils.llm_processing import (
+    parse_qa_pairs, parse_ratings, convert_to_conversation_format, IncrementalJSONArrayParser
+)
+from synthetic_data_kit.utils.config import (
+    load_config, get_generation_config, get_curate_config, get_prompt, format_text_prompt
+)
+from synthetic_data_kit.utils.schemas import QA_PAIRS_SCHEMA, RATINGS_SCHEMA
 
 class QAGenerator:
     def __init__(self, 
@@ -30,9 +39,15 @@ class QAGenerator:
         # Get specific configurations
         self.generation_config = get_generation_config(self.config)
         self.curate_config = get_curate_config(self.config)
+        self.summarizer = DocumentSummarizer(client, self.config, self.generation_config)
+        
+        # Counters for the last generate_qa_pairs run (see `_repair_chunks`)
+        self.repair_stats = {"failed": 0, "repaired": 0, "repair_requests": 0, "repair_rate": 0}
+        # Chunks requested by the last generate_qa_pairs run (see `select_chunks`)
+        self.selection_stats = {"chunks": 0, "requested": 0, "top_up_rounds": 0, "calls_avoided": 0}
     
     def generate_summary(self, document_text: str) -> str:
-        """Generate a summary of the document"""
+        """Generate a summary of the document (map-reduce for long documents, see `DocumentSummarizer`)"""
         verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
         if verbose:
             print("Generating document summary...")
@@ -40,15 +55,7 @@ class QAGenerator:
         # Get summary prompt from config
         prompt = get_prompt(self.config, "summary")
         
-        messages = [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": document_text}
-        ]
-        
-        summary = self.client.chat_completion(
-            messages, 
-            temperature=0.1  # Use lower temperature for summaries
-        )
+        summary = self.summarizer.summarize(document_text, prompt)
         
         if verbose:
             print(f"Summary generated ({len(summary)} chars)")
@@ -58,7 +65,7 @@ class QAGenerator:
                         document_text: str, 
                         summary: str, 
                         num_pairs: int = 25) -> List[Dict[str, str]]:
-        """Generate QA pairs from the document using batched processing"""
+        """Generate QA pairs from the document, streaming chunk requests concurrently"""
         verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
         
         # Get generation config
@@ -66,6 +73,7 @@ class QAGenerator:
         temperature = self.generation_config.get("temperature", 0.7)
         overlap = self.generation_config.get("overlap", 200)
         batch_size = self.generation_config.get("batch_size", 32)
+        stream = self.generation_config.get("stream", False)
         
         # Split text into chunks
         chunks = split_into_chunks(
@@ -74,33 +82,70 @@ class QAGenerator:
             overlap=overlap
         )
         
+        # Get QA generation prompt template
+        qa_prompt_template = get_prompt(self.config, "qa_generation")
+        prompt_layout = self.generation_config.get("prompt_layout", "inline")
+        
+        # Split chunks further if their prompts would not fit the context window
+        text_limit = self.client.text_token_limit(
+            format_text_prompt(qa_prompt_template, "", layout=prompt_layout,
+                               num_pairs=num_pairs, summary=summary[:100]),
+            task="qa_generation",
+            items=max(1, round(num_pairs / len(chunks)))
+        )
+        if text_limit:
+            fitted_chunks = split_oversized_chunks(chunks, text_limit * CHARS_PER_TOKEN)
+            if len(fitted_chunks) > len(chunks):
+                print(f"Split oversized chunks to fit the context window ({len(chunks)} -> {len(fitted_chunks)} chunks)")
+            chunks = fitted_chunks
+        
         if verbose:
             print(f"Generating QA pairs...")
             print(f"Document split into {len(chunks)} chunks")
-            print(f"Using batch size of {batch_size}")
+            print(f"Keeping up to {batch_size} requests in flight")
         
-        all_qa_pairs = []
         pairs_per_chunk = max(1, round(num_pairs / len(chunks)))
         
-        # Get QA generation prompt template
-        qa_prompt_template = get_prompt(self.config, "qa_generation")
+        # One response only yields so many pairs. Rather than resending a chunk,
+        # sample it several times in one request (the `n` parameter), so the
+        # server processes the prompt once. Streaming takes one sample.
+        max_pairs_per_response = self.generation_config.get("max_pairs_per_response")
+        samples = 1
+        if max_pairs_per_response and pairs_per_chunk > max_pairs_per_response and not stream:
+            samples = math.ceil(pairs_per_chunk / max_pairs_per_response)
+            pairs_per_chunk = math.ceil(pairs_per_chunk / samples)
+            if verbose:
+                print(f"Sampling {samples} responses of {pairs_per_chunk} pairs per chunk")
         
         # Prepare all message batches
         all_messages = []
         for i, chunk in enumerate(chunks):
             # Format the prompt with summary and text
-            qa_prompt = qa_prompt_template.format(
+            messages = format_text_prompt(
+                qa_prompt_template,
+                chunk,
+                layout=prompt_layout,
                 num_pairs=pairs_per_chunk,
-                summary=summary[:100],
-                text=chunk
+                summary=summary[:100]
             )
-            
-            messages = [
-                {"role": "system", "content": qa_prompt}
-            ]
             all_messages.append(messages)
         
-        print(f"Processing {len(chunks)} chunks to generate QA pairs...")
+        # When fewer pairs are wanted than the chunks would give, request only as
+        # many chunks as the target needs, spread over the whole document
+        selection_config = self.generation_config.get("chunk_selection") or {}
+        selection = selection_config.get("strategy", "coverage")
+        if selection not in ("coverage", "sequential"):
+            raise ValueError(f"Unknown chunk_selection strategy '{selection}', expected 'coverage' or 'sequential'")
+        max_top_ups = selection_config.get("top_up_rounds", 2)
+        if selection == "coverage":
+            batch = select_chunks(chunks, math.ceil(num_pairs / (pairs_per_chunk * samples)))
+        else:
+            batch = list(range(len(chunks)))
+        
+        if len(batch) < len(chunks):
+            print(f"Processing {len(batch)} of {len(chunks)} chunks to generate QA pairs...")
+        else:
+            print(f"Processing {len(chunks)} chunks to generate QA pairs...")
         
         # Set up progress tracking based on verbose mode
         if verbose:
@@ -115,80 +160,130 @@ class QAGenerator:
             ]
             
             progress_ctx = Progress(*progress_columns)
-            generate_task = progress_ctx.add_task(f"Generating QA pairs", total=len(chunks))
+            generate_task = progress_ctx.add_task(f"Generating QA pairs", total=len(batch))
             progress_ctx.start()
         else:
             progress_ctx = None
             generate_task = None
         
-        # Process in batches
-        for batch_start in range(0, len(chunks), batch_size):
-            # Check if we've already generated enough pairs
-            if len(all_qa_pairs) >= num_pairs:
-                if verbose:
-                    print(f"Reached target of {num_pairs} pairs. Stopping processing.")
-                break
-                
-            batch_end = min(batch_start + batch_size, len(chunks))
-            batch_messages = all_messages[batch_start:batch_end]
-            current_batch_size = len(batch_messages)
+        chunk_pairs = {}
+        unparseable = {}
+        total_pairs = 0
+        completed = 0
+        requested = set()
+        top_ups = 0
+        calls_avoided = 0
+        while batch:
+            requested.update(batch)
+            early_stop_before = dict(self.client.early_stop)
             
-            batch_num = batch_start//batch_size + 1
-            total_batches = (len(chunks) + batch_size - 1)//batch_size
-            
-            # Simple progress indicator for non-verbose mode
-            if not verbose:
-                print(f"Processing batch {batch_num}/{total_batches}...", end="\r")
-            else:
-                print(f"Processing batch {batch_num}/{total_batches} with {current_batch_size} chunks")
+            # Stream the chunk requests through a sliding window: a new request
+            # starts as soon as any finishes instead of waiting for a whole batch
+            responses = self.client.iter_completion(
+                [all_messages[i] for i in batch],
+                temperature=temperature,
+                max_in_flight=batch_size,
+                json_schema=QA_PAIRS_SCHEMA,
+                stream=stream,
+                n=samples,
+                task="qa_generation",
+                items=pairs_per_chunk
+            )
+            # With streaming, pairs are taken as soon as each JSON object closes
+            parsers = {}
+            streamed_text = {}
             
             try:
-                # Process the batch
-                batch_responses = self.client.batch_completion(
-                    batch_messages,
-                    temperature=temperature,
-                    batch_size=batch_size
-                )
-                
-                # Process each response in the batch
-                for j, response in enumerate(batch_responses):
-                    # Check if we've reached the target before processing more
-                    if len(all_qa_pairs) >= num_pairs:
-                        if verbose:
-                            print(f"  Reached target of {num_pairs} pairs. Stopping batch processing.")
-                        break
-                        
-                    chunk_index = batch_start + j
-                    chunk_pairs = parse_qa_pairs(response)
+                for event in responses:
+                    if stream:
+                        position, delta, finished = event
+                        chunk_index = batch[position]
+                        if not finished:
+                            streamed_text[chunk_index] = streamed_text.get(chunk_index, "") + delta
+                            parser = parsers.setdefault(chunk_index, IncrementalJSONArrayParser())
+                            pairs_to_add = parser.feed(delta)[:num_pairs - total_pairs]
+                            chunk_pairs.setdefault(chunk_index, []).extend(pairs_to_add)
+                            total_pairs += len(pairs_to_add)
+                            if total_pairs >= num_pairs:
+                                if verbose:
+                                    print(f"Reached target of {num_pairs} pairs mid-stream. Cancelling remaining requests.")
+                                break
+                            continue
+                        # The final event carries the error of a failed request
+                        response = delta or streamed_text.pop(chunk_index, "")
+                    else:
+                        position, response = event
+                        chunk_index = batch[position]
+                    completed += 1
                     
-                    # Only add pairs up to the target limit
-                    remaining_pairs = num_pairs - len(all_qa_pairs)
-                    if remaining_pairs > 0:
-                        pairs_to_add = chunk_pairs[:remaining_pairs]
-                        all_qa_pairs.extend(pairs_to_add)
-                        
-                        if verbose:
-                            print(f"  Generated {len(pairs_to_add)} pairs from chunk {chunk_index+1} (total: {len(all_qa_pairs)}/{num_pairs})")
+                    # Only add pairs up to the target limit. Pairs streamed from this
+                    # chunk are already in; otherwise parse the whole response.
+                    if not chunk_pairs.get(chunk_index):
+                        parsed_pairs, broken = self._parse_samples(response)
+                        if not parsed_pairs and broken is not None:
+                            unparseable[chunk_index] = broken
+                        pairs_to_add = parsed_pairs[:num_pairs - total_pairs]
+                        chunk_pairs[chunk_index] = pairs_to_add
+                        total_pairs += len(pairs_to_add)
+                    
+                    if verbose:
+                        print(f"  Generated {len(chunk_pairs[chunk_index])} pairs from chunk {chunk_index+1} (total: {total_pairs}/{num_pairs})")
+                    else:
+                        print(f"Processed {completed}/{len(requested)} chunks...", end="\r")
+                    
+                    # Update progress bar if in verbose mode
+                    if progress_ctx:
+                        progress_ctx.update(generate_task, advance=1)
                     
-                    # Break if we've reached the target
-                    if len(all_qa_pairs) >= num_pairs:
+                    # Stop as soon as we've reached the target
+                    if total_pairs >= num_pairs:
+                        if verbose:
+                            print(f"Reached target of {num_pairs} pairs. Stopping processing.")
                         break
-                
-                # Update progress bar if in verbose mode
-                if progress_ctx and generate_task:
-                    progress_ctx.update(generate_task, advance=current_batch_size)
-                
-                # Break outer loop if we've reached the target
-                if len(all_qa_pairs) >= num_pairs:
-                    break
-                
+            
             except Exception as e:
                 if verbose:
-                    print(f"  Error processing batch {batch_num}: {str(e)}")
-                
-                # Update progress bar if in verbose mode
-                if progress_ctx and generate_task:
-                    progress_ctx.update(generate_task, advance=current_batch_size)
+                    print(f"  Error processing chunks: {str(e)}")
+            finally:
+                # Cancel chunk requests that are still queued or in flight
+                responses.close()
+            
+            # Only requests that produced nothing were saved; a chunk whose
+            # streamed pairs were taken did its work
+            cancelled = sum(self.client.early_stop[key] - early_stop_before[key] for key in early_stop_before)
+            if cancelled:
+                calls_avoided += cancelled
+                print(f"Reached the target of {num_pairs} pairs; cancelled {cancelled} outstanding chunk requests")
+            
+            # Top up from the unused chunks if the selected ones yielded too few pairs,
+            # sized by the pairs per request observed so far
+            shortfall = num_pairs - total_pairs
+            if shortfall <= 0 or top_ups >= max_top_ups or len(requested) == len(chunks):
+                break
+            top_ups += 1
+            observed_yield = total_pairs / len(requested)
+            extra = math.ceil(shortfall / observed_yield) if observed_yield else len(batch)
+            batch = select_chunks(chunks, extra, exclude=requested)
+            print(f"{shortfall} pairs short of the target; requesting {len(batch)} more chunks")
+            if progress_ctx:
+                progress_ctx.update(generate_task, total=len(requested) + len(batch))
+        
+        self.selection_stats = {
+            "chunks": len(chunks),
+            "requested": len(requested),
+            "top_up_rounds": top_ups,
+            "calls_avoided": calls_avoided
+        }
+        
+        # Re-ask only the chunks whose responses could not be parsed
+        self.repair_stats = {"failed": len(unparseable), "repaired": 0, "repair_requests": 0, "repair_rate": 0}
+        if unparseable and total_pairs < num_pairs:
+            self._repair_chunks(unparseable, all_messages, chunk_pairs, num_pairs - total_pairs, batch_size)
+        
+        # Keep pairs in document order regardless of completion order
+        all_qa_pairs = []
+        for chunk_index in sorted(chunk_pairs):
+            all_qa_pairs.extend(chunk_pairs[chunk_index])
         
         # Stop progress bar if in verbose mode
         if progress_ctx:
@@ -203,6 +298,97 @@ class QAGenerator:
         print(f"Generated {len(all_qa_pairs)} QA pairs total (requested: {num_pairs})")
         return all_qa_pairs
     
+    def _parse_samples(self, response) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Parse the pairs from one response or a list of sampled responses
+        
+        Questions repeated across samples are kept once.
+        
+        Returns:
+            Tuple of (pairs, an unparseable response to repair or None)
+        """
+        pairs = []
+        seen = set()
+        broken = None
+        for sample in response if isinstance(response, list) else [response]:
+            sample_pairs = parse_qa_pairs(sample)
+            if not sample_pairs and not sample.startswith("ERROR:"):
+                broken = sample
+            for pair in sample_pairs:
+                question = str(pair.get("question", "")).strip().lower()
+                if question not in seen:
+                    seen.add(question)
+                    pairs.append(pair)
+        return pairs, broken
+    
+    def _repair_chunks(self,
+                       unparseable: Dict[int, str],
+                       all_messages: List[List[Dict[str, str]]],
+                       chunk_pairs: Dict[int, List[Dict[str, str]]],
+                       needed: int,
+                       batch_size: int):
+        """Retry chunks whose responses could not be parsed, up to `repair_retries` rounds
+        
+        With `repair_mode: "fix"` the broken output is sent back with the short
+        `qa_repair` prompt, which is much cheaper than resending the chunk.
+        With `repair_mode: "resample"` the original request is sent again.
+        Both use `repair_temperature`. Recovered pairs are added to `chunk_pairs` and
+        the counts to `self.repair_stats`.
+        """
+        verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
+        max_rounds = self.generation_config.get("repair_retries", 0)
+        mode = self.generation_config.get("repair_mode", "fix")
+        temperature = self.generation_config.get("repair_temperature", 0.3)
+        if mode not in ("fix", "resample"):
+            raise ValueError(f"Unknown repair_mode '{mode}', expected 'fix' or 'resample'")
+        repair_prompt = get_prompt(self.config, "qa_repair") if mode == "fix" and max_rounds > 0 else None
+        
+        pending = dict(unparseable)
+        for round_number in range(max_rounds):
+            if not pending or needed <= 0:
+                break
+            indices = sorted(pending)
+            if mode == "fix":
+                # Plain replace: the broken output may itself contain braces
+                messages = [
+                    [{"role": "system", "content": repair_prompt.replace("{output}", pending[i])}]
+                    for i in indices
+                ]
+            else:
+                messages = [all_messages[i] for i in indices]
+            
+            if verbose:
+                print(f"Repair round {round_number+1}/{max_rounds}: re-asking {len(indices)} chunks ({mode})")
+            self.repair_stats["repair_requests"] += len(indices)
+            
+            responses = self.client.iter_completion(
+                messages,
+                temperature=temperature,
+                max_in_flight=batch_size,
+                json_schema=QA_PAIRS_SCHEMA
+            )
+            try:
+                for position, response in responses:
+                    chunk_index = indices[position]
+                    pairs = parse_qa_pairs(response)
+                    if not pairs:
+                        # Keep the latest broken output for the next fix attempt
+                        if not response.startswith("ERROR:"):
+                            pending[chunk_index] = response
+                        continue
+                    del pending[chunk_index]
+                    self.repair_stats["repaired"] += 1
+                    chunk_pairs.setdefault(chunk_index, []).extend(pairs[:needed])
+                    needed -= len(pairs[:needed])
+                    if needed <= 0:
+                        break
+            finally:
+                responses.close()
+        
+        stats = self.repair_stats
+        stats["repair_rate"] = round(stats["repaired"] / stats["failed"], 2) if stats["failed"] else 0
+        print(f"Repaired {stats['repaired']} of {stats['failed']} unparseable chunks "
+              f"with {stats['repair_requests']} repair requests")
+    
     def rate_qa_pairs(self, 
                     qa_pairs: List[Dict[str, str]], 
                     summary: str, 
@@ -260,7 +446,11 @@ class QAGenerator:
                 try:
                     response = self.client.chat_completion(
                         messages, 
-                        temperature=temperature
+                        temperature=temperature,
+                        cache=True,
+                        json_schema=RATINGS_SCHEMA,
+                        task="qa_rating",
+                        items=len(batch)
                     )
                     
                     rated_batch = parse_ratings(response)
@@ -275,7 +465,6 @@ class QAGenerator:
                     if verbose:
                         print(f"Error rating batch {i+1}: {str(e)}")
                 
-                time.sleep(0.5)  # Avoid rate limits
                 progress.update(rating_task, advance=1)
         
         # Calculate metrics
@@ -302,11 +491,42 @@ class QAGenerator:
         else:
             os.environ['SDK_VERBOSE'] = 'false'
         
-        # Generate summary
-        summary = self.generate_summary(document_text)
-        
-        # Generate QA pairs
-        qa_pairs = self.generate_qa_pairs(document_text, summary, num_pairs=num_pairs)
+        summary_config = self.generation_config.get("summary") or {}
+        concurrent = summary_config.get("concurrent", False) and summary_config.get("strategy") != "extractive"
+        if concurrent and not NUMPY_AVAILABLE:
+            print("NumPy is not installed, so there is no provisional summary; summarizing first")
+            concurrent = False
+        if concurrent:
+            # Summarize while the chunk requests run; chunk prompts get a local
+            # extractive summary instead of waiting for the LLM one
+            provisional = self.summarizer.provisional_summary(document_text)
+            if verbose:
+                print(f"Generating summary concurrently with QA pairs (provisional summary: {len(provisional)} chars)")
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary") as executor:
+                summary_future = executor.submit(self.generate_summary, document_text)
+                qa_pairs = self.generate_qa_pairs(document_text, provisional, num_pairs=num_pairs)
+                try:
+                    summary = summary_future.result()
+                except Exception as e:
+                    # The pairs are already paid for (e.g. the deadline passed
+                    # mid-summary), so keep them with the provisional summary
+                    print(f"Summary failed ({e}); keeping the provisional summary")
+                    summary = provisional
+                    self.summarizer.stats = {"strategy": "provisional", "error": str(e)}
+        else:
+            # Generate summary
+            try:
+                summary = self.generate_summary(document_text)
+            except Exception as e:
+                if not deadline_exceeded():
+                    raise
+                # Stop cleanly: save what can still be saved, with a local summary
+                print(f"Deadline reached during the summary ({e}); saving partial results")
+                summary = self.summarizer.provisional_summary(document_text)
+                self.summarizer.stats = {"strategy": "provisional", "error": str(e)}
+            
+            # Generate QA pairs
+            qa_pairs = self.generate_qa_pairs(document_text, summary, num_pairs=num_pairs)
         
         # Prepare result - no rating at this stage
         result = {
@@ -314,4 +534,15 @@ class QAGenerator:
             "qa_pairs": qa_pairs
         }
         
+        # Report how many unparseable chunks were recovered
+        if self.repair_stats["failed"]:
+            result.setdefault("metrics", {})["repair"] = dict(self.repair_stats)
+        # how many chunk requests were skipped or cancelled once the target was met
+        stats = self.selection_stats
+        if stats["requested"] < stats["chunks"] or stats["calls_avoided"]:
+            result.setdefault("metrics", {})["chunk_selection"] = dict(self.selection_stats)
+        # and how the summary was made (map-reduce, or the provisional one if it failed)
+        if self.summarizer.stats.get("strategy") in ("map_reduce", "provisional"):
+            result.setdefault("metrics", {})["summary"] = dict(self.summarizer.stats)
+        
         return result
\ No newline at end of file
@@ -0,0 +1,233 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Document summaries: one request for short documents, map-reduce for long ones
+import os
+from typing import Dict, List, Any, Optional
+
+from synthetic_data_kit.models.llm_client import LLMClient
+from synthetic_data_kit.utils.extractive import extractive_summary, NUMPY_AVAILABLE
+from synthetic_data_kit.utils.text import (
+    split_into_chunks,
+    split_oversized_chunks,
+    truncate_to_tokens,
+    estimate_tokens,
+    CHARS_PER_TOKEN,
+)
+
+# Used when the config has no `summary_reduce` prompt (e.g. older config files)
+DEFAULT_REDUCE_PROMPT = (
+    "These are summaries of consecutive parts of one document. Combine them into a "
+    "single summary of the whole document in 3-5 sentences, focusing on the main "
+    "topic and key concepts."
+)
+
+SUMMARY_STRATEGIES = ("auto", "single", "map_reduce", "extractive")
+
+
+class DocumentSummarizer:
+    """Summarize documents for the QA and CoT generators
+
+    Strategies (`generation.summary.strategy`):
+    - "single": the whole document in one request (truncated if it does not
+      fit the context window)
+    - "map_reduce": chunks are summarized concurrently, then the partial
+      summaries are combined `fan_in` at a time until one remains
+    - "auto": map_reduce for documents longer than `map_reduce_threshold`
+      characters or too long for the context window, otherwise single
+    - "extractive": the most central sentences, picked locally without any
+      LLM request (see `extractive_summary`)
+    """
+
+    def __init__(
+        self, client: LLMClient, config: Dict[str, Any], generation_config: Dict[str, Any]
+    ):
+        self.client = client
+        self.config = config
+        self.generation_config = generation_config
+        # Requests made for the last summary, for run metrics
+        self.stats = {}
+
+    @property
+    def summary_config(self) -> Dict[str, Any]:
+        """The `generation.summary` section"""
+        return self.generation_config.get("summary") or {}
+
+    def summarize(self, document_text: str, prompt: str) -> str:
+        """Summarize `document_text` following the `prompt` instructions"""
+        verbose = os.environ.get("SDK_VERBOSE", "false").lower() == "true"
+        strategy = self.summary_config.get("strategy", "auto")
+        if strategy not in SUMMARY_STRATEGIES:
+            raise ValueError(
+                f"Unknown summary strategy '{strategy}', expected one of {SUMMARY_STRATEGIES}"
+            )
+
+        if strategy == "extractive":
+            self.stats = {
+                "strategy": strategy,
+                "map_requests": 0,
+                "reduce_requests": 0,
+                "levels": 0,
+            }
+            return extractive_summary(
+                document_text,
+                max_sentences=self.summary_config.get("extractive_sentences", 5),
+                max_chars=self.summary_config.get("extractive_max_chars", 600),
+            )
+
+        text_limit = self.client.text_token_limit(
+            [{"role": "system", "content": prompt}, {"role": "user", "content": ""}], task="summary"
+        )
+        if strategy == "auto":
+            threshold = self.summary_config.get(
+                "map_reduce_threshold"
+            ) or self.generation_config.get("single_call_max_size", 8000)
+            too_long = len(document_text) > threshold or (
+                text_limit is not None and estimate_tokens(document_text) > text_limit
+            )
+            strategy = "map_reduce" if too_long else "single"
+
+        self.stats = {"strategy": strategy, "map_requests": 0, "reduce_requests": 0, "levels": 0}
+        if verbose:
+            print(f"Summarizing document ({len(document_text)} chars, {strategy})...")
+        if strategy == "single":
+            return self._summarize_single(document_text, prompt, text_limit)
+        return self._summarize_map_reduce(document_text, prompt, text_limit)
+
+    def provisional_summary(self, document_text: str) -> str:
+        """Cheap local stand-in for the summary while the real one is generated
+
+        The extractive summary when NumPy is available, otherwise "" (the
+        summary is then left out of prompts that use it).
+        """
+        if not NUMPY_AVAILABLE:
+            return ""
+        return extractive_summary(
+            document_text,
+            max_sentences=self.summary_config.get("extractive_sentences", 5),
+            max_chars=self.summary_config.get("extractive_max_chars", 600),
+        )
+
+    def _summarize_single(self, document_text: str, prompt: str, text_limit: Optional[int]) -> str:
+        """Summarize in one request, from as much of the document as fits the context window"""
+        if text_limit is not None and estimate_tokens(document_text) > text_limit:
+            print(
+                f"Document (~{estimate_tokens(document_text)} tokens) exceeds the context window; "
+                f"summarizing its first ~{text_limit} tokens"
+            )
+            document_text = truncate_to_tokens(document_text, text_limit)
+
+        return self.client.chat_completion(
+            [{"role": "system", "content": prompt}, {"role": "user", "content": document_text}],
+            temperature=0.1,  # Use lower temperature for summaries
+            cache=True,
+            task="summary",
+        )
+
+    def _summarize_map_reduce(
+        self, document_text: str, prompt: str, text_limit: Optional[int]
+    ) -> str:
+        """Summarize chunks concurrently, then combine the partial summaries in a tree"""
+        verbose = os.environ.get("SDK_VERBOSE", "false").lower() == "true"
+
+        # Map: one summary per chunk, in document order
+        chunk_size = self.summary_config.get("chunk_size", 16000)
+        if text_limit:
+            chunk_size = min(chunk_size, text_limit * CHARS_PER_TOKEN)
+        chunks = split_into_chunks(document_text, chunk_size=chunk_size, overlap=0)
+        if text_limit:
+            chunks = split_oversized_chunks(chunks, text_limit * CHARS_PER_TOKEN)
+
+        mapped = self._complete_all(
+            [
+                [{"role": "system", "content": prompt}, {"role": "user", "content": chunk}]
+                for chunk in chunks
+            ]
+        )
+        summaries = [summary for summary in mapped if summary is not None]
+        if not summaries:
+            raise Exception("Failed to summarize document: every chunk summary request failed")
+        self.stats["map_requests"] = len(chunks)
+        if verbose:
+            print(f"Summarized {len(summaries)}/{len(chunks)} chunks")
+
+        # Reduce: combine up to fan_in partial summaries per request until one is left
+        reduce_prompt = self.config.get("prompts", {}).get("summary_reduce", DEFAULT_REDUCE_PROMPT)
+        fan_in = max(2, self.summary_config.get("fan_in", 8))
+        reduce_limit = self.client.text_token_limit(
+            [{"role": "system", "content": reduce_prompt}, {"role": "user", "content": ""}],
+            task="summary",
+        )
+        while len(summaries) > 1:
+            groups = self._group_summaries(summaries, fan_in, reduce_limit)
+            reduced = self._complete_all(
+                [
+                    [
+                        {"role": "system", "content": reduce_prompt},
+                        {
+                            "role": "user",
+                            "content": "\n\n".join(
+                                f"Part {i + 1}: {summary}" for i, summary in enumerate(group)
+                            ),
+                        },
+                    ]
+                    for group in groups
+                    if len(group) > 1
+                ]
+            )
+            # A group of one (the last, odd one out) is carried up unchanged, and
+            # a group whose request failed carries up its parts joined together
+            reduced_iter = iter(reduced)
+            summaries = []
+            for group in groups:
+                combined = group[0] if len(group) == 1 else next(reduced_iter)
+                summaries.append("\n\n".join(group) if combined is None else combined)
+            self.stats["reduce_requests"] += sum(1 for group in groups if len(group) > 1)
+            self.stats["levels"] += 1
+            if verbose:
+                print(
+                    f"Reduce level {self.stats['levels']}: {len(summaries)} partial summaries left"
+                )
+
+        return summaries[0]
+
+    @staticmethod
+    def _group_summaries(
+        summaries: List[str], fan_in: int, text_limit: Optional[int]
+    ) -> List[List[str]]:
+        """Split consecutive summaries into groups of up to `fan_in` that fit the context window"""
+        max_tokens = text_limit if text_limit else None
+        groups = [[]]
+        tokens = 0
+        for summary in summaries:
+            group = groups[-1]
+            summary_tokens = estimate_tokens(summary)
+            # Always pair at least two summaries, so every level makes progress
+            full = len(group) >= fan_in or (
+                max_tokens is not None and len(group) >= 2 and tokens + summary_tokens > max_tokens
+            )
+            if full:
+                groups.append([])
+                tokens = 0
+            groups[-1].append(summary)
+            tokens += summary_tokens
+        return groups
+
+    def _complete_all(self, message_batches: List[List[Dict[str, str]]]) -> List[Optional[str]]:
+        """Run summary requests concurrently, returning results in order and None for failures"""
+        responses = self.client.batch_completion(
+            message_batches,
+            temperature=0.1,
+            batch_size=self.generation_config.get("batch_size", 32),
+            cache=True,
+            task="summary",
+        )
+        summaries = [None if response.startswith("ERROR:") else response for response in responses]
+        failed = summaries.count(None)
+        if failed:
+            print(
+                f"Warning: {failed} of {len(responses)} summary requests failed: {responses[summaries.index(None)]}"
+            )
+        return summaries
@@ -0,0 +1,168 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Record/replay of LLM traffic for deterministic benchmark runs
+import os
+import json
+import random
+import threading
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from synthetic_data_kit.models.response_cache import cache_key
+
+CASSETTE_MODES = ("record", "replay")
+LATENCY_MODES = ("none", "recorded", "sampled")
+# Request fields hashed directly; any others (e.g. guided_json) count as extras
+_REQUEST_FIELDS = ("model", "messages", "temperature", "top_p", "max_tokens")
+
+
+class CassetteMissError(KeyError):
+    """Raised in replay mode when a request was never recorded"""
+
+
+class Cassette:
+    """JSON Lines file of request/response pairs with their latency
+
+    In record mode every successful completion is appended to the file. In
+    replay mode requests are answered from the file without contacting the
+    provider. Repeated identical requests are served their recordings in
+    order, cycling once exhausted. Replayed calls can wait for the latency
+    that was recorded for them (`recorded`), or for a latency drawn from all
+    recordings (`sampled`), scaled by `latency_scale`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str,
+        simulate_latency: str = "none",
+        latency_scale: float = 1.0,
+        seed: Optional[int] = None,
+    ):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}. Use one of {CASSETTE_MODES}")
+        if simulate_latency not in LATENCY_MODES:
+            raise ValueError(
+                f"Unknown latency simulation: {simulate_latency}. Use one of {LATENCY_MODES}"
+            )
+        self.path = os.path.expanduser(path)
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._positions: Dict[str, int] = defaultdict(int)
+        self._latencies: List[float] = []
+
+        if mode == "replay":
+            self._load()
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._entries[entry["key"]].append(entry)
+                self._latencies.append(entry.get("latency", 0.0))
+
+    def record(
+        self,
+        request: Dict[str, Any],
+        response: str,
+        latency: float,
+        key_request: Optional[Dict[str, Any]] = None,
+    ):
+        """Append one completed request to the cassette
+
+        `key_request` is the request as it should be matched on replay, when
+        that differs from what was sent (e.g. without an adaptive max_tokens).
+        """
+        entry = {
+            "key": self._key(key_request or request),
+            "request": request,
+            "response": response,
+            "latency": round(latency, 4),
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+    def play(
+        self, request: Dict[str, Any], key_request: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, float]:
+        """Return the recorded response and the delay to simulate for a request (see `record`)"""
+        key = self._key(key_request or request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMissError(f"Request not found in cassette {self.path}")
+            entry = entries[self._positions[key] % len(entries)]
+            self._positions[key] += 1
+            self.replayed += 1
+
+            if self.simulate_latency == "recorded":
+                delay = entry.get("latency", 0.0)
+            elif self.simulate_latency == "sampled":
+                delay = self._random.choice(self._latencies)
+            else:
+                delay = 0.0
+        return entry["response"], delay * self.latency_scale
+
+    @staticmethod
+    def _key(request: Dict[str, Any]) -> str:
+        return cache_key(
+            request.get("model"),
+            request["messages"],
+            request.get("temperature"),
+            request.get("top_p"),
+            request.get("max_tokens"),
+            {k: v for k, v in request.items() if k not in _REQUEST_FIELDS},
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cassette mode and counters, for run metrics"""
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+            "simulate_latency": self.simulate_latency,
+        }
+
+
+def create_cassette(cassette_config: Optional[Dict[str, Any]]) -> Optional[Cassette]:
+    """Build a cassette from the `llm.cassette` section of the config"""
+    cassette_config = cassette_config or {}
+    mode = cassette_config.get("mode")
+    if not mode:
+        return None
+    if not cassette_config.get("path"):
+        raise ValueError("llm.cassette.path is required when a cassette mode is set")
+    return Cassette(
+        cassette_config["path"],
+        mode,
+        simulate_latency=cassette_config.get("simulate_latency") or "none",
+        latency_scale=cassette_config.get("latency_scale", 1.0),
+        seed=cassette_config.get("seed"),
+    )
@@ -0,0 +1,100 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Shared LLM clients, so batches of files reuse one client and connection pool
+import os
+import atexit
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from synthetic_data_kit.models.endpoints import parse_endpoints
+from synthetic_data_kit.models.llm_client import LLMClient
+from synthetic_data_kit.utils.config import resolve_config_path
+
+_clients: Dict[tuple, LLMClient] = {}
+_lock = threading.Lock()
+
+
+def _client_key(
+    config_path: Optional[Path],
+    provider: Optional[str],
+    api_base: Union[str, List[str], None],
+    api_key: Optional[str],
+    model_name: Optional[str],
+) -> tuple:
+    """Everything the client's effective configuration is built from
+
+    The config file is identified by path and modification time, so editing
+    it gives a new client. The API key may also come from the environment.
+    `api_base` may be a list of replicas, so it is keyed as a tuple of URLs.
+    """
+    path = os.path.abspath(resolve_config_path(config_path))
+    mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    endpoints = tuple(parse_endpoints(api_base))
+    return (
+        path,
+        mtime,
+        provider,
+        endpoints,
+        api_key,
+        model_name,
+        os.environ.get("API_ENDPOINT_KEY"),
+    )
+
+
+def get_llm_client(
+    config_path: Optional[Path] = None,
+    provider: Optional[str] = None,
+    api_base: Union[str, List[str], None] = None,
+    api_key: Optional[str] = None,
+    model_name: Optional[str] = None,
+) -> LLMClient:
+    """Return the shared LLMClient for these settings, creating it on first use
+
+    Takes the same overrides as `LLMClient`. A reused vLLM client re-checks
+    the server at most every `health_check_ttl` seconds (see
+    `LLMClient.ensure_available`); if the server is gone the client is dropped
+    and the ConnectionError raised. Callers must not close the client.
+    """
+    key = _client_key(config_path, provider, api_base, api_key, model_name)
+    with _lock:
+        client = _clients.get(key)
+    if client is None:
+        # Built outside the lock: the vLLM server check must not hold up other callers
+        created = LLMClient(
+            config_path=config_path,
+            provider=provider,
+            api_base=api_base,
+            api_key=api_key,
+            model_name=model_name,
+        )
+        with _lock:
+            client = _clients.setdefault(key, created)
+        if client is created:
+            return client
+        # Another caller registered one first
+        created.close()
+
+    try:
+        client.ensure_available()
+    except ConnectionError:
+        with _lock:
+            if _clients.get(key) is client:
+                del _clients[key]
+        raise
+    return client
+
+
+def close_llm_clients():
+    """Close and forget every shared client (also run at interpreter exit)"""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+atexit.register(close_llm_clients)
@@ -0,0 +1,139 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Adaptive concurrency control for LLM requests
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, List
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header value into a number of seconds
+
+    The header is either a delay in seconds or an HTTP date.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD controller for the number of requests kept in flight
+
+    The limit grows by roughly one per round trip (1/limit per healthy
+    completion) while latency stays within `latency_tolerance` times the best
+    smoothed latency seen so far. Overload signals (HTTP 429/503, timeouts)
+    multiply it by `backoff_factor`. Each request remembers the epoch it
+    started in, so a burst of failures from the same window only backs off
+    once.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        backoff_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        history_size: int = 200,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff_factor = backoff_factor
+        self.latency_tolerance = latency_tolerance
+        self.history_size = history_size
+
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._epoch = 0
+        self._latency_ewma = None
+        self._best_latency = None
+        self._paused_until = 0.0
+        self._started_at = time.monotonic()
+        self._history: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._record("initial")
+
+    @property
+    def limit(self) -> int:
+        """Current number of requests allowed in flight"""
+        return int(self._limit)
+
+    @property
+    def epoch(self) -> int:
+        """Identifier of the current window, captured when a request starts"""
+        return self._epoch
+
+    def on_success(self, epoch: int, latency: float):
+        """Record a completed request and grow the limit if the endpoint is healthy"""
+        with self._lock:
+            if self._latency_ewma is None:
+                self._latency_ewma = latency
+            else:
+                self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * latency
+            if self._best_latency is None or self._latency_ewma < self._best_latency:
+                self._best_latency = self._latency_ewma
+
+            # Hold the limit while latency is degraded or a backoff is in effect
+            if self._latency_ewma > self._best_latency * self.latency_tolerance:
+                return
+            if epoch != self._epoch or time.monotonic() < self._paused_until:
+                return
+
+            previous = self.limit
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            if self.limit != previous:
+                self._record("increase")
+
+    def on_overload(
+        self, epoch: int, retry_after: Optional[float] = None, reason: str = "overload"
+    ):
+        """Back off after an overload signal, honoring Retry-After if given"""
+        with self._lock:
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+            # Only the first signal from a window shrinks the limit
+            if epoch != self._epoch:
+                return
+            self._epoch += 1
+            self._limit = max(float(self.min_limit), self._limit * self.backoff_factor)
+            self._record(reason)
+
+    def pause_remaining(self) -> float:
+        """Seconds to wait before starting new requests (from Retry-After)"""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current limit and its history, for run metrics"""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "history": list(self._history),
+            }
+
+    def _record(self, reason: str):
+        self._history.append(
+            {
+                "time": round(time.monotonic() - self._started_at, 3),
+                "limit": self.limit,
+                "reason": reason,
+            }
+        )
+        if len(self._history) > self.history_size:
+            del self._history[0]
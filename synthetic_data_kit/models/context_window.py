@@ -0,0 +1,143 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Pre-flight checks that keep prompts inside the model's context window
+import threading
+from typing import Dict, Any, List, Optional
+
+from synthetic_data_kit.models.retry import error_status
+from synthetic_data_kit.utils.text import estimate_message_tokens
+
+# Phrases servers use when rejecting a prompt that is too long for the model
+_OVERFLOW_PHRASES = (
+    "maximum context length",
+    "context length",
+    "context_length_exceeded",
+    "context window",
+    "prompt is too long",
+    "too many tokens",
+)
+
+
+class ContextWindowExceeded(ValueError):
+    """Raised instead of sending (or retrying) a request whose prompt does not fit the context window"""
+
+
+def is_context_overflow(message: str) -> bool:
+    """Check whether an error message says the prompt was too long for the model"""
+    message = (message or "").lower()
+    return any(phrase in message for phrase in _OVERFLOW_PHRASES)
+
+
+def check_context_overflow(error: Exception):
+    """Re-raise a request error as `ContextWindowExceeded` if the server rejected the prompt length
+
+    Retrying such a request can only fail again, so callers check this
+    before their retry logic.
+    """
+    if isinstance(error, ContextWindowExceeded):
+        raise error
+    if error_status(error) != 400:
+        return
+    message = str(error)
+    response = getattr(error, "response", None)
+    if isinstance(getattr(response, "text", None), str):
+        message += " " + response.text
+    if is_context_overflow(message):
+        raise ContextWindowExceeded(message) from error
+
+
+def context_length_from_models(info: Any, model: Optional[str]) -> Optional[int]:
+    """Read the model's context length from a /models response, if it reports one
+
+    vLLM reports `max_model_len` for each served model; some other
+    OpenAI-compatible servers use `context_length` or `context_window`.
+    """
+    entries = info.get("data") if isinstance(info, dict) else None
+    if not isinstance(entries, list):
+        return None
+    entries = [entry for entry in entries if isinstance(entry, dict)]
+    matching = [entry for entry in entries if entry.get("id") == model] or entries[:1]
+    for entry in matching:
+        for field in ("max_model_len", "context_length", "context_window"):
+            if isinstance(entry.get(field), int):
+                return entry[field]
+    return None
+
+
+class ContextWindow:
+    """Estimate prompt tokens before sending and keep requests inside the context window
+
+    Prompt sizes are estimated from character counts (see `estimate_tokens`),
+    so `margin` of the window is kept free for estimation error. A request
+    whose prompt leaves less room than its max_tokens gets a smaller
+    max_tokens, down to `min_output_tokens`; below that it is rejected with
+    `ContextWindowExceeded` before anything is sent.
+    """
+
+    def __init__(self, context_length: int, margin: float = 0.1, min_output_tokens: int = 256):
+        self.context_length = context_length
+        self.margin = margin
+        self.min_output_tokens = min_output_tokens
+        self.shrunk = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def usable_tokens(self) -> int:
+        """Tokens available for prompt and output after the safety margin"""
+        return int(self.context_length * (1 - self.margin))
+
+    def prompt_limit(self, max_tokens: int) -> int:
+        """Largest estimated prompt that still leaves room for `max_tokens` of output"""
+        return max(0, self.usable_tokens - max_tokens)
+
+    def fit(self, messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Return the max_tokens to send `messages` with
+
+        Raises:
+            ContextWindowExceeded: If the prompt leaves less than `min_output_tokens` of room
+        """
+        prompt_tokens = estimate_message_tokens(messages)
+        room = self.usable_tokens - prompt_tokens
+        if room >= max_tokens:
+            return max_tokens
+        if room >= min(self.min_output_tokens, max_tokens):
+            with self._lock:
+                self.shrunk += 1
+            return room
+        with self._lock:
+            self.rejected += 1
+        raise ContextWindowExceeded(
+            f"Prompt of about {prompt_tokens} tokens does not fit the {self.context_length}-token "
+            f"context window with room for output; split or shorten the input"
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Context length and pre-flight outcomes, for run metrics"""
+        with self._lock:
+            return {
+                "context_length": self.context_length,
+                "shrunk_max_tokens": self.shrunk,
+                "rejected": self.rejected,
+            }
+
+
+def create_context_window(
+    provider_config: Dict[str, Any], detected: Optional[int] = None
+) -> Optional[ContextWindow]:
+    """Build the context window guard from a provider config section
+
+    `context_length` from the config wins over the length `detected` from the
+    server. Returns None when neither is known, which disables the guard.
+    """
+    context_length = provider_config.get("context_length") or detected
+    if not context_length:
+        return None
+    return ContextWindow(
+        context_length=context_length,
+        margin=provider_config.get("context_margin", 0.1),
+        min_output_tokens=provider_config.get("min_output_tokens", 256),
+    )
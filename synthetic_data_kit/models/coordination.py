@@ -0,0 +1,223 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Cross-process coordination of rate limits and in-flight requests on one host
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+DEFAULT_COORDINATION_PATH = os.path.join("~", ".cache", "synthetic-data-kit", "coordination.sqlite")
+
+
+def _pid_alive(pid: int) -> bool:
+    """Check whether a process on this host is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class SQLiteCoordinator:
+    """Token buckets and in-flight slots stored in a SQLite file
+
+    Every `synthetic-data-kit` process pointed at the same file and namespace
+    shares one budget. Each operation runs in its own `BEGIN IMMEDIATE`
+    transaction, which serializes writers across processes. Buckets use wall
+    clock time because monotonic clocks are not comparable between processes.
+    Slots held by processes that have exited, or for longer than
+    `slot_lease`, are reclaimed.
+
+    A transaction can wait up to 30s for another process's lock, so the
+    `*_async` variants run on one worker thread instead of the event loop.
+    """
+
+    def __init__(self, path: str, namespace: str, slot_lease: float = 900.0):
+        self.path = os.path.expanduser(path)
+        self.namespace = namespace
+        self.slot_lease = slot_lease
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "namespace TEXT, name TEXT, level REAL, updated REAL, "
+                "PRIMARY KEY (namespace, name))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS slots ("
+                "holder TEXT PRIMARY KEY, namespace TEXT, pid INTEGER, acquired REAL)"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _load_bucket(
+        self, conn: sqlite3.Connection, name: str, per_minute: float, now: float
+    ) -> float:
+        row = conn.execute(
+            "SELECT level, updated FROM buckets WHERE namespace = ? AND name = ?",
+            (self.namespace, name),
+        ).fetchone()
+        if row is None:
+            return float(per_minute)
+        level, updated = row
+        return min(float(per_minute), level + max(0.0, now - updated) * per_minute / 60.0)
+
+    def _store_bucket(self, conn: sqlite3.Connection, name: str, level: float, now: float):
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (namespace, name, level, updated) VALUES (?, ?, ?, ?)",
+            (self.namespace, name, level, now),
+        )
+
+    def reserve(self, requests: List[Tuple[str, float, float]]) -> float:
+        """Atomically take `amount` from every bucket, or return seconds to wait
+
+        Args:
+            requests: List of (bucket name, budget per minute, amount)
+        """
+        with self._transaction() as conn:
+            now = time.time()
+            levels = {}
+            wait = 0.0
+            for name, per_minute, amount in requests:
+                levels[name] = self._load_bucket(conn, name, per_minute, now)
+                needed = min(amount, per_minute)
+                if levels[name] < needed:
+                    wait = max(wait, (needed - levels[name]) / (per_minute / 60.0))
+            if wait == 0:
+                for name, _, amount in requests:
+                    levels[name] -= amount
+            for name, level in levels.items():
+                self._store_bucket(conn, name, level, now)
+            return wait
+
+    def adjust(self, name: str, per_minute: float, delta: float):
+        """Charge (positive) or refund (negative) a bucket after the fact"""
+        with self._transaction() as conn:
+            now = time.time()
+            level = self._load_bucket(conn, name, per_minute, now)
+            self._store_bucket(conn, name, min(float(per_minute), level - delta), now)
+
+    def try_acquire_slot(self, limit: int) -> Optional[str]:
+        """Take one of `limit` host-wide in-flight slots, returning its holder id"""
+        with self._transaction() as conn:
+            now = time.time()
+            for holder, pid, acquired in conn.execute(
+                "SELECT holder, pid, acquired FROM slots WHERE namespace = ?", (self.namespace,)
+            ).fetchall():
+                if not _pid_alive(pid) or now - acquired > self.slot_lease:
+                    conn.execute("DELETE FROM slots WHERE holder = ?", (holder,))
+
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM slots WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            if count >= limit:
+                return None
+
+            holder = f"{os.getpid()}-{uuid.uuid4().hex}"
+            conn.execute(
+                "INSERT INTO slots (holder, namespace, pid, acquired) VALUES (?, ?, ?, ?)",
+                (holder, self.namespace, os.getpid(), now),
+            )
+            return holder
+
+    def release_slot(self, holder: str):
+        """Give back an in-flight slot"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM slots WHERE holder = ?", (holder,))
+
+    def _run_async(self, func, *args) -> "asyncio.Future":
+        """Start `func` on the worker thread, which serializes this process's transactions"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="sdk-coordination"
+                )
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def reserve_async(self, requests: List[Tuple[str, float, float]]) -> float:
+        """Async variant of `reserve` that keeps the event loop free while waiting for the lock"""
+        return await self._run_async(self.reserve, requests)
+
+    async def adjust_async(self, name: str, per_minute: float, delta: float):
+        """Async variant of `adjust`"""
+        await asyncio.shield(self._run_async(self.adjust, name, per_minute, delta))
+
+    async def try_acquire_slot_async(self, limit: int) -> Optional[str]:
+        """Async variant of `try_acquire_slot`
+
+        A caller cancelled while the transaction runs never sees the holder id,
+        so a slot taken for it is given straight back.
+        """
+        future = self._run_async(self.try_acquire_slot, limit)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(self._release_abandoned_slot)
+            raise
+
+    def _release_abandoned_slot(self, future: "asyncio.Future"):
+        if not future.cancelled() and future.exception() is None and future.result():
+            self._executor.submit(self.release_slot, future.result())
+
+    async def release_slot_async(self, holder: str):
+        """Async variant of `release_slot`; finishes even if the caller is cancelled"""
+        await asyncio.shield(self._run_async(self.release_slot, holder))
+
+    def slots_in_use(self) -> int:
+        """Number of in-flight slots currently held across all processes"""
+        with self._transaction() as conn:
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM slots WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            return count
+
+
+def coordination_namespace(*parts: Optional[str]) -> str:
+    """Derive a namespace from the provider identity without storing secrets"""
+    return hashlib.sha256("|".join(part or "" for part in parts).encode("utf-8")).hexdigest()[:16]
+
+
+def create_coordinator(
+    provider_config: Dict[str, Any], namespace: str
+) -> Optional[SQLiteCoordinator]:
+    """Build a coordinator from the `coordination` section of a provider config"""
+    coordination_config = provider_config.get("coordination") or {}
+    backend = coordination_config.get("backend")
+    if not backend:
+        return None
+    if backend != "sqlite":
+        raise ValueError(f"Unknown coordination backend: {backend}")
+    return SQLiteCoordinator(
+        coordination_config.get("path") or DEFAULT_COORDINATION_PATH,
+        namespace,
+        slot_lease=coordination_config.get("slot_lease", 900.0),
+    )
@@ -0,0 +1,159 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Load balancing across several replicas of an OpenAI-compatible server
+import time
+import random
+import threading
+from typing import Dict, Any, List, Optional, Union
+
+
+def parse_endpoints(api_base: Union[str, List[str], None]) -> List[str]:
+    """Normalize an `api_base` setting into a list of base URLs
+
+    Accepts a single URL, a comma-separated string (as given on the command
+    line) or a list of URLs.
+    """
+    if not api_base:
+        return []
+    if isinstance(api_base, str):
+        api_base = api_base.split(",")
+    return [url.strip().rstrip("/") for url in api_base if url and url.strip()]
+
+
+class Endpoint:
+    """One replica with its in-flight count, health state and statistics"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency_ewma: Optional[float] = None
+        self.ejected_until = 0.0
+        self.ejections = 0
+        # Ejections since the last success; non-zero means on probation
+        self.eject_streak = 0
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.is_available(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "latency_ewma": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+        }
+
+
+class EndpointPool:
+    """Least-outstanding-requests dispatch over replicas with ejection
+
+    A replica is ejected for `eject_seconds` after `failure_threshold`
+    consecutive failures or a failed health check. Once the period has passed
+    it is readmitted on probation: it takes traffic again, and a single
+    further failure ejects it for twice as long (up to `max_eject_seconds`).
+    When every replica is ejected, the one due back first is used anyway so
+    requests keep flowing and fail through the normal retry path.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        failure_threshold: int = 3,
+        eject_seconds: float = 30.0,
+        max_eject_seconds: float = 300.0,
+        health_check_interval: float = 10.0,
+    ):
+        if not urls:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.failure_threshold = max(1, failure_threshold)
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def acquire(self) -> Endpoint:
+        """Pick the available replica with the fewest requests in flight"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e.is_available(now)]
+            if not candidates:
+                candidates = [min(self.endpoints, key=lambda e: e.ejected_until)]
+            fewest = min(e.outstanding for e in candidates)
+            endpoint = random.choice([e for e in candidates if e.outstanding == fewest])
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, latency: Optional[float] = None, failed: bool = False):
+        """Return a replica after a request, recording its outcome"""
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if failed:
+                endpoint.errors += 1
+                endpoint.consecutive_failures += 1
+                # A replica on probation is ejected again on its first failure;
+                # failures still in flight after an ejection don't extend it
+                if endpoint.is_available(time.monotonic()) and (
+                    endpoint.eject_streak or endpoint.consecutive_failures >= self.failure_threshold
+                ):
+                    self._eject(endpoint)
+                return
+            endpoint.consecutive_failures = 0
+            endpoint.eject_streak = 0
+            if latency is not None:
+                if endpoint.latency_ewma is None:
+                    endpoint.latency_ewma = latency
+                else:
+                    endpoint.latency_ewma = 0.8 * endpoint.latency_ewma + 0.2 * latency
+
+    def report_health(self, endpoint: Endpoint, healthy: bool):
+        """Apply the result of a health check"""
+        with self._lock:
+            if healthy:
+                if not endpoint.is_available(time.monotonic()):
+                    endpoint.ejected_until = 0.0
+                    endpoint.consecutive_failures = 0
+            elif endpoint.is_available(time.monotonic()):
+                self._eject(endpoint)
+
+    def _eject(self, endpoint: Endpoint):
+        duration = min(self.max_eject_seconds, self.eject_seconds * (2**endpoint.eject_streak))
+        endpoint.ejections += 1
+        endpoint.eject_streak += 1
+        endpoint.ejected_until = time.monotonic() + duration
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Per-replica health, load, latency and error stats, for run metrics"""
+        with self._lock:
+            now = time.monotonic()
+            return [e.snapshot(now) for e in self.endpoints]
+
+
+def create_endpoint_pool(
+    api_base: Union[str, List[str], None], provider_config: Dict[str, Any]
+) -> Optional[EndpointPool]:
+    """Build a pool when more than one endpoint is configured"""
+    urls = parse_endpoints(api_base)
+    if len(urls) < 2:
+        return None
+    balancing_config = provider_config.get("load_balancing") or {}
+    return EndpointPool(
+        urls,
+        failure_threshold=balancing_config.get("failure_threshold", 3),
+        eject_seconds=balancing_config.get("eject_seconds", 30.0),
+        max_eject_seconds=balancing_config.get("max_eject_seconds", 300.0),
+        health_check_interval=balancing_config.get("health_check_interval", 10.0),
+    )
@@ -0,0 +1,81 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Hedged requests to cut tail latency
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+class HedgingPolicy:
+    """Decide when a slow request gets a duplicate and track the hedge budget
+
+    The hedge delay is the `percentile` of recently observed latencies, and
+    no hedges are sent until `min_samples` latencies have been seen. At most
+    `max_fraction` of all requests may be hedged, so hedging cannot amplify
+    load much when an endpoint is struggling.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_fraction: float = 0.05,
+        min_samples: int = 20,
+        window: int = 500,
+    ):
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging a new request, or None to not hedge"""
+        with self._lock:
+            self.requests += 1
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+        return ordered[index]
+
+    def record(self, latency: float):
+        """Record the latency of a completed request"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def try_hedge(self) -> bool:
+        """Take one hedge from the budget if it is not used up"""
+        with self._lock:
+            if self.hedges + 1 > self.requests * self.max_fraction:
+                return False
+            self.hedges += 1
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Hedge counts, for run metrics"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "percentile": self.percentile,
+                "max_fraction": self.max_fraction,
+            }
+
+
+def create_hedging_policy(provider_config: Dict[str, Any]) -> Optional[HedgingPolicy]:
+    """Build a hedging policy from the `hedging` section of a provider config"""
+    hedging_config = provider_config.get("hedging") or {}
+    if not hedging_config.get("enabled"):
+        return None
+    return HedgingPolicy(
+        percentile=hedging_config.get("percentile", 95.0),
+        max_fraction=hedging_config.get("max_fraction", 0.05),
+        min_samples=hedging_config.get("min_samples", 20),
+    )
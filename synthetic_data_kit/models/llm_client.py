@@ -4,16 +4,34 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 # Supports both vLLM and API endpoint (including OpenAI-compatible) providers
-from typing import List, Dict, Any, Optional, Union, Tuple
+from typing import List, Dict, Any, Optional, Union, Tuple, Iterator, Callable
 import requests
 import json
 import time
 import os
 import logging
 import asyncio
+import threading
+import queue
+from contextlib import contextmanager, asynccontextmanager
 from pathlib import Path
 
 from synthetic_data_kit.utils.config import load_config, get_vllm_config, get_openai_config, get_llm_provider
+from synthetic_data_kit.models.concurrency import AdaptiveConcurrencyLimiter, parse_retry_after
+from synthetic_data_kit.models.rate_limiter import create_rate_limiter
+from synthetic_data_kit.models.coordination import create_coordinator, coordination_namespace
+from synthetic_data_kit.models.response_cache import cache_key, create_response_cache
+from synthetic_data_kit.models.cassette import create_cassette
+from synthetic_data_kit.models.endpoints import create_endpoint_pool
+from synthetic_data_kit.models.hedging import create_hedging_policy
+from synthetic_data_kit.models.token_budget import create_output_budget, FLAT_JSON_ARRAY_TASKS
+from synthetic_data_kit.models.context_window import (
+    ContextWindowExceeded, check_context_overflow, context_length_from_models, create_context_window,
+    is_context_overflow
+)
+from synthetic_data_kit.models.retry import backoff_delay, create_circuit_breaker, error_status
+from synthetic_data_kit.utils.text import estimate_message_tokens
+from synthetic_data_kit.utils.deadline import DeadlineExceededError, time_remaining
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +46,80 @@ except ImportError:
     OPENAI_AVAILABLE = False
     logger.warning("OpenAI package not installed. To use API endpoint provider, install with 'pip install openai>=1.0.0'")
 
+# aiohttp provides the pooled async transport used for concurrent vLLM batches
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Request fields that carry a structured output schema (see `_request_fields`)
+STRUCTURED_OUTPUT_FIELDS = ("guided_json", "response_format")
+
+# Cumulative counters in `get_metrics`, per section; everything else is a current value
+COUNTER_METRICS = {
+    "rate_limit": ("total_wait_seconds",),
+    "cache": ("hits", "misses", "coalesced"),
+    "cassette": ("recorded", "replayed", "misses"),
+    "endpoints": ("requests", "errors", "ejections"),
+    "hedging": ("requests", "hedges", "hedge_wins"),
+    "circuit_breaker": ("opened", "rejected"),
+    "output_budget": ("requests", "truncated", "output_tokens"),
+    "context_window": ("shrunk_max_tokens", "rejected"),
+    "deadline": ("cancelled_requests",),
+    "early_stop": ("cancelled_in_flight", "not_sent"),
+}
+
+
+def _subtract_counters(after: Dict[str, Any], before: Dict[str, Any], counters) -> Dict[str, Any]:
+    delta = dict(after)
+    for name in counters:
+        if name in after:
+            delta[name] = round(after[name] - before.get(name, 0), 3)
+    return delta
+
+
+def metrics_since(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Metrics for the work done between two `get_metrics` snapshots of one client
+
+    Counters become differences and the adaptive concurrency history keeps
+    only the new changes; current values (limits, states, sizes) are taken
+    from `after`.
+    """
+    delta = {}
+    for section, metrics in after.items():
+        previous = before.get(section) or {}
+        counters = COUNTER_METRICS.get(section, ())
+        if section == "endpoints":
+            previous = {endpoint["url"]: endpoint for endpoint in previous}
+            delta[section] = [
+                _subtract_counters(endpoint, previous.get(endpoint["url"], {}), counters)
+                for endpoint in metrics
+            ]
+        elif section == "output_budget":
+            delta[section] = {
+                task: _subtract_counters(stats, previous.get(task, {}), counters)
+                for task, stats in metrics.items()
+            }
+        elif section == "concurrency":
+            seen = previous.get("history") or []
+            last_seen = seen[-1]["time"] if seen else float("-inf")
+            delta[section] = {
+                **metrics,
+                "history": [change for change in metrics["history"] if change["time"] > last_seen]
+            }
+        else:
+            delta[section] = _subtract_counters(metrics, previous, counters)
+        if section == "cache":
+            lookups = delta[section]["hits"] + delta[section]["misses"]
+            delta[section]["hit_rate"] = round(delta[section]["hits"] / lookups, 3) if lookups else 0.0
+    return delta
+
+
+class StructuredOutputRejected(Exception):
+    """Raised when an endpoint rejects a structured output request, so it can be resent without"""
+
+
 class LLMClient:
     def __init__(self, 
                  config_path: Optional[Path] = None,
@@ -51,6 +143,33 @@ class LLMClient:
         # Load config
         self.config = load_config(config_path)
         
+        # Async machinery shared by every batch_completion call. The event loop
+        # runs in a background thread so batches work even when the caller
+        # already has a running loop (e.g. Jupyter), and the async clients keep
+        # their connection pools alive between batches.
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+        self._async_openai_client = None
+        self._http_session = None
+        self._health_task = None
+        self.endpoint_pool = None
+        
+        # Optional on-disk response cache (`llm.cache`). In-flight requests are
+        # tracked by cache key so identical concurrent requests share one call.
+        cache_config = self.config.get('llm', {}).get('cache') or {}
+        self.response_cache = create_response_cache(cache_config)
+        self.cache_sampling = bool(cache_config.get('sampling', False))
+        self._inflight_responses = {}
+        
+        # Optional record/replay of all traffic (`llm.cassette`) for benchmarks
+        self.cassette = create_cassette(self.config.get('llm', {}).get('cassette'))
+        
+        # Per-task max_tokens for requests that name their task (`generation.output_budget`)
+        generation_config = self.config.get('generation', {})
+        self.output_budget = create_output_budget(generation_config)
+        self.stop_after_json = (generation_config.get('output_budget') or {}).get('stop_after_json', True)
+        
         # Determine provider (with CLI override taking precedence)
         self.provider = provider or get_llm_provider(self.config)
         
@@ -78,6 +197,11 @@ class LLMClient:
             self.model = model_name or api_endpoint_config.get('model')
             self.max_retries = max_retries or api_endpoint_config.get('max_retries')
             self.retry_delay = retry_delay or api_endpoint_config.get('retry_delay')
+            self.structured_output = api_endpoint_config.get('structured_output', False)
+            self.supports_n = api_endpoint_config.get('supports_n', True)
+            self._init_flow_control(api_endpoint_config)
+            # Only `context_length` from the config; the OpenAI /models API does not report it
+            self.context_window = create_context_window(api_endpoint_config)
             
             # Initialize OpenAI client
             self._init_openai_client()
@@ -85,17 +209,47 @@ class LLMClient:
             # Load vLLM configuration
             vllm_config = get_vllm_config(self.config)
             
-            # Set parameters, with CLI overrides taking precedence
+            # Set parameters, with CLI overrides taking precedence. Several
+            # replicas (a list or comma-separated URLs) are load balanced.
             self.api_base = api_base or vllm_config.get('api_base')
+            self.endpoint_pool = create_endpoint_pool(self.api_base, vllm_config)
+            if self.endpoint_pool:
+                self.api_base = self.endpoint_pool.endpoints[0].url
             self.model = model_name or vllm_config.get('model')
             self.max_retries = max_retries or vllm_config.get('max_retries')
             self.retry_delay = retry_delay or vllm_config.get('retry_delay')
+            self.max_concurrent_requests = vllm_config.get('max_concurrent_requests', 32)
+            self.structured_output = vllm_config.get('structured_output', False)
+            self.supports_n = vllm_config.get('supports_n', True)
+            self._init_flow_control(vllm_config)
             
             # No client to initialize for vLLM as we use requests directly
-            # Verify server is running
-            available, info = self._check_vllm_server()
-            if not available:
-                raise ConnectionError(f"VLLM server not available at {self.api_base}: {info}")
+            # Verify server is running (not needed when replaying a cassette).
+            # Reused clients re-check at most every `health_check_ttl` seconds.
+            self.health_check_ttl = vllm_config.get('health_check_ttl', 30.0)
+            self._last_health_check = time.monotonic()
+            detected_context_length = None
+            if self.cassette and self.cassette.replaying:
+                pass
+            elif self.endpoint_pool:
+                # Start with failing replicas ejected; at least one must be up
+                results = {}
+                for endpoint in self.endpoint_pool.endpoints:
+                    available, info = self._check_vllm_server(endpoint.url)
+                    self.endpoint_pool.report_health(endpoint, available)
+                    results[endpoint.url] = info
+                    if available and detected_context_length is None:
+                        detected_context_length = context_length_from_models(info, self.model)
+                if not any(e['healthy'] for e in self.endpoint_pool.snapshot()):
+                    raise ConnectionError(f"No VLLM server available: {results}")
+            else:
+                available, info = self._check_vllm_server()
+                if not available:
+                    raise ConnectionError(f"VLLM server not available at {self.api_base}: {info}")
+                detected_context_length = context_length_from_models(info, self.model)
+            
+            # Context window from `context_length`, else the server's max_model_len
+            self.context_window = create_context_window(vllm_config, detected_context_length)
     
     def _init_openai_client(self):
         """Initialize OpenAI client with appropriate configuration"""
@@ -116,10 +270,240 @@ class LLMClient:
         
         self.openai_client = OpenAI(**client_kwargs)
     
-    def _check_vllm_server(self) -> tuple:
-        """Check if the VLLM server is running and accessible"""
+    def _init_flow_control(self, provider_config: Dict[str, Any]):
+        """Set up rate limiting and adaptive concurrency for the selected provider"""
+        # Optional host-wide coordination so several processes share one budget
+        self.coordinator = create_coordinator(
+            provider_config,
+            coordination_namespace(self.provider, self.api_base, getattr(self, 'api_key', None), self.model)
+        )
+        coordination_config = provider_config.get('coordination') or {}
+        self.shared_max_in_flight = coordination_config.get('max_in_flight') if self.coordinator else None
+        
+        # RPM/TPM budgets from the provider's `rate_limit` section (None = unlimited)
+        self.rate_limiter = create_rate_limiter(provider_config, coordinator=self.coordinator)
+        
+        adaptive_config = provider_config.get('adaptive_concurrency') or {}
+        self.adaptive_concurrency = adaptive_config if adaptive_config.get('enabled', False) else None
+        # Created on the first batch, seeded with its requested concurrency
+        self._concurrency = None
+        
+        # Duplicate requests that run past a latency percentile (batches only)
+        self.hedging = create_hedging_policy(provider_config)
+        
+        # Retries back off with decorrelated jitter up to max_retry_delay, and
+        # the circuit breaker fails fast while the endpoint is down
+        self.max_retry_delay = provider_config.get('max_retry_delay', 30.0)
+        self.circuit_breaker = create_circuit_breaker(provider_config)
+        
+        # Per-request timeouts grow with max_tokens (see `_request_timeout`)
+        self.timeout_config = provider_config.get('request_timeout') or {}
+        self.deadline_cancelled = 0
+        # Requests that produced nothing because the caller closed `iter_completion` early
+        self.early_stop = {"cancelled_in_flight": 0, "not_sent": 0}
+    
+    def _request_timeout(self, max_tokens: int) -> float:
+        """Timeout for one request attempt, scaled with the expected output length
+        
+        Allows `base` seconds plus the time to generate `max_tokens` at
+        `min_tokens_per_second`, capped at `max` and at the time left before
+        the command's deadline.
+        
+        Raises:
+            DeadlineExceededError: If the deadline has already passed
+        """
+        timeout = self.timeout_config.get('base', 30.0) + \
+            max_tokens / self.timeout_config.get('min_tokens_per_second', 20.0)
+        timeout = min(timeout, self.timeout_config.get('max', 600.0))
+        
+        remaining = time_remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceededError("Deadline exceeded before the request was sent")
+            timeout = min(timeout, remaining)
+        return timeout
+    
+    @contextmanager
+    def _shared_slot(self):
+        """Hold one of the host-wide in-flight slots while a request runs"""
+        if not self.shared_max_in_flight:
+            yield
+            return
+        holder = self.coordinator.try_acquire_slot(self.shared_max_in_flight)
+        while holder is None:
+            time.sleep(0.05)
+            holder = self.coordinator.try_acquire_slot(self.shared_max_in_flight)
+        try:
+            yield
+        finally:
+            self.coordinator.release_slot(holder)
+    
+    @asynccontextmanager
+    async def _shared_slot_async(self):
+        """Async variant of `_shared_slot` for requests on the background loop"""
+        if not self.shared_max_in_flight:
+            yield
+            return
+        holder = await self.coordinator.try_acquire_slot_async(self.shared_max_in_flight)
+        while holder is None:
+            await asyncio.sleep(0.05)
+            holder = await self.coordinator.try_acquire_slot_async(self.shared_max_in_flight)
+        try:
+            yield
+        finally:
+            await self.coordinator.release_slot_async(holder)
+    
+    @contextmanager
+    def _endpoint(self):
+        """Pick the replica for one request attempt and record how it went
+        
+        Yields the base URL to use. Without load balancing this is always
+        `api_base`. Rate limiting (429) and over-long prompts are not held
+        against a replica.
+        """
+        if self.endpoint_pool is None:
+            yield self.api_base
+            return
+        endpoint = self.endpoint_pool.acquire()
+        started = time.monotonic()
         try:
-            response = requests.get(f"{self.api_base}/models", timeout=5)
+            yield endpoint.url
+        except Exception as e:
+            # Neither rate limiting (429) nor an over-long prompt is the replica's fault
+            self.endpoint_pool.release(
+                endpoint, failed=error_status(e) != 429 and not isinstance(e, ContextWindowExceeded)
+            )
+            raise
+        except BaseException:
+            # Cancelled, e.g. when a batch is closed early
+            self.endpoint_pool.release(endpoint)
+            raise
+        else:
+            self.endpoint_pool.release(endpoint, latency=time.monotonic() - started)
+    
+    def _ensure_health_checks(self):
+        """Start periodic replica health checks on the background loop"""
+        if self.endpoint_pool is None or (self._health_task is not None and not self._health_task.done()):
+            return
+        self._health_task = asyncio.ensure_future(self._health_check_loop())
+    
+    async def _health_check_loop(self):
+        """Probe every replica's /models endpoint, ejecting or readmitting it"""
+        async def probe(endpoint):
+            try:
+                async with self._get_http_session().get(
+                    f"{endpoint.url}/models", timeout=aiohttp.ClientTimeout(total=5)
+                ) as response:
+                    healthy = response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                healthy = False
+            self.endpoint_pool.report_health(endpoint, healthy)
+        
+        while True:
+            await asyncio.sleep(self.endpoint_pool.health_check_interval)
+            await asyncio.gather(*(probe(endpoint) for endpoint in self.endpoint_pool.endpoints))
+    
+    def _get_event_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the persistent background event loop, starting it on first use"""
+        with self._loop_lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="llm-client-event-loop",
+                    daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+    
+    def _run_async(self, coro):
+        """Run a coroutine on the background event loop and wait for its result"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._get_event_loop())
+        return future.result()
+    
+    def _get_async_openai_client(self):
+        """Return the long-lived AsyncOpenAI client, creating it on first use"""
+        if self._async_openai_client is None:
+            try:
+                from openai import AsyncOpenAI
+            except ImportError:
+                raise ImportError("The 'openai' package is required for this functionality. Please install it using 'pip install openai>=1.0.0'.")
+            
+            # Retries are handled by _complete_async so that every attempt is
+            # visible to the concurrency controller
+            client_kwargs = {'max_retries': 0}
+            if self.api_key:
+                client_kwargs['api_key'] = self.api_key
+            if self.api_base:
+                client_kwargs['base_url'] = self.api_base
+            
+            self._async_openai_client = AsyncOpenAI(**client_kwargs)
+        return self._async_openai_client
+    
+    def _get_http_session(self) -> 'aiohttp.ClientSession':
+        """Return the pooled keep-alive HTTP session used for vLLM requests
+        
+        Must be called from the background event loop.
+        """
+        if self._http_session is None or self._http_session.closed:
+            # Leave room for the adaptive controller to grow past the static limit
+            limit = self.max_concurrent_requests
+            if self.adaptive_concurrency:
+                limit = max(limit, self.adaptive_concurrency.get('max_concurrency', 256))
+            # The limit applies to each replica when load balancing
+            replicas = len(self.endpoint_pool) if self.endpoint_pool else 1
+            connector = aiohttp.TCPConnector(limit=limit * replicas, limit_per_host=limit)
+            timeout = aiohttp.ClientTimeout(total=180)
+            self._http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._http_session
+    
+    async def _close_async_clients(self):
+        """Close the async clients owned by the background event loop"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        self._http_session = None
+        if self._async_openai_client is not None:
+            await self._async_openai_client.close()
+        self._async_openai_client = None
+    
+    def close(self):
+        """Close pooled connections and stop the background event loop"""
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop, self._loop_thread = None, None
+        if loop is None or loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._close_async_clients(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    
+    def ensure_available(self):
+        """Check that the vLLM server is still up before reusing this client
+        
+        The check is skipped if the last one is less than `health_check_ttl`
+        seconds old. API endpoints have no health check, and load-balanced
+        replicas are probed by the endpoint pool instead.
+        
+        Raises:
+            ConnectionError: If the server does not answer
+        """
+        if self.provider == 'api-endpoint' or self.endpoint_pool or (self.cassette and self.cassette.replaying):
+            return
+        if time.monotonic() - self._last_health_check < self.health_check_ttl:
+            return
+        available, info = self._check_vllm_server()
+        if not available:
+            raise ConnectionError(f"VLLM server not available at {self.api_base}: {info}")
+        self._last_health_check = time.monotonic()
+    
+    def _check_vllm_server(self, api_base: Optional[str] = None) -> tuple:
+        """Check if the VLLM server (or one replica of it) is running and accessible"""
+        try:
+            response = requests.get(f"{api_base or self.api_base}/models", timeout=5)
             if response.status_code == 200:
                 return True, response.json()
             return False, f"Server returned status code: {response.status_code}"
@@ -130,7 +514,11 @@ class LLMClient:
                       messages: List[Dict[str, str]], 
                       temperature: float = None, 
                       max_tokens: int = None,
-                      top_p: float = None) -> str:
+                      top_p: float = None,
+                      cache: Optional[bool] = None,
+                      json_schema: Optional[Dict[str, Any]] = None,
+                      task: Optional[str] = None,
+                      items: int = 1) -> str:
         """Generate a chat completion using the selected provider
         
         Args:
@@ -138,48 +526,213 @@ class LLMClient:
             temperature: Sampling temperature (higher = more random)
             max_tokens: Maximum tokens to generate
             top_p: Nucleus sampling parameter
+            cache: Use the response cache for this request (see `_response_cache_key`)
+            json_schema: Named schema to constrain the output to when the provider's
+                `structured_output` setting is on (see `_request_fields`)
+            task: Prompt name (e.g. "qa_generation") used to size max_tokens when
+                it is not given (see `_max_tokens`)
+            items: Number of outputs (pairs, ratings...) the prompt asks for
             
         Returns:
             String containing the generated text
+            
+        Raises:
+            ContextWindowExceeded: If the prompt does not fit the model's context
+                window (checked before sending, see `_fit_context`)
         """
         # Get defaults from config if not provided
         generation_config = self.config.get('generation', {})
         temperature = temperature if temperature is not None else generation_config.get('temperature', 0.1)
-        max_tokens = max_tokens if max_tokens is not None else generation_config.get('max_tokens', 4096)
+        max_tokens = self._fit_context(messages, self._max_tokens(max_tokens, task, items))
         top_p = top_p if top_p is not None else generation_config.get('top_p', 0.95)
         
         verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
+        extra = self._request_fields(json_schema, task)
         
-        if self.provider == 'api-endpoint':
-            return self._openai_chat_completion(messages, temperature, max_tokens, top_p, verbose)
-        else:  # Default to vLLM
-            return self._vllm_chat_completion(messages, temperature, max_tokens, top_p, verbose)
+        key = self._response_cache_key(messages, temperature, max_tokens, top_p, cache, extra, task)
+        if key is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached
+        
+        request = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            **extra
+        }
+        if self.cassette and self.cassette.replaying:
+            content, delay = self.cassette.play(request, self._key_request(request, task))
+            time.sleep(delay)
+        else:
+            started = time.monotonic()
+            try:
+                if self.provider == 'api-endpoint':
+                    content = self._openai_chat_completion(messages, temperature, max_tokens, top_p, verbose, extra)
+                else:  # Default to vLLM
+                    content = self._vllm_chat_completion(messages, temperature, max_tokens, top_p, verbose, extra)
+            except StructuredOutputRejected:
+                return self.chat_completion(messages, temperature, max_tokens, top_p, cache, task=task, items=items)
+            if self.cassette:
+                self.cassette.record(request, content, time.monotonic() - started, self._key_request(request, task))
+        
+        self._record_output(task, items, content, max_tokens)
+        if key is not None:
+            self.response_cache.put(key, content)
+        return content
+    
+    def _response_cache_key(self,
+                            messages: List[Dict[str, str]],
+                            temperature: float,
+                            max_tokens: int,
+                            top_p: float,
+                            cache: Optional[bool],
+                            extra: Optional[Dict[str, Any]] = None,
+                            task: Optional[str] = None) -> Optional[str]:
+        """Return the response cache key for a request, or None if it is not cached
+        
+        Callers pass `cache=True` for deterministic stages such as summaries and
+        ratings, and `cache=False` to opt out. Otherwise only temperature 0
+        requests are cached, unless `llm.cache.sampling` is enabled. Budget-sized
+        max_tokens are keyed by task (see `_key_max_tokens`).
+        """
+        if self.response_cache is None or cache is False:
+            return None
+        if cache is None and temperature > 0 and not self.cache_sampling:
+            return None
+        # Several samples per prompt come back as a list, which is not cached
+        if extra and extra.get("n", 1) > 1:
+            return None
+        return cache_key(self.model, messages, temperature, top_p, self._key_max_tokens(max_tokens, task), extra)
+    
+    def _key_max_tokens(self, max_tokens: int, task: Optional[str]) -> Union[int, str]:
+        """max_tokens as it goes into cache and cassette keys
+        
+        A task's output budget follows the lengths of earlier responses, so it
+        depends on the order in which they arrived. Requests sized by it are
+        keyed by the task name instead, and re-runs and replays find them again.
+        """
+        if task and self.output_budget:
+            return f"budget:{task}"
+        return max_tokens
+    
+    def _key_request(self, request: Dict[str, Any], task: Optional[str]) -> Dict[str, Any]:
+        """The request as keyed in the cassette (see `_key_max_tokens`)"""
+        return {**request, "max_tokens": self._key_max_tokens(request["max_tokens"], task)}
+    
+    def _max_tokens(self, max_tokens: Optional[int], task: Optional[str], items: int) -> int:
+        """Resolve max_tokens: explicit value, else the task's output budget, else generation.max_tokens"""
+        if max_tokens is not None:
+            return max_tokens
+        if task and self.output_budget:
+            return self.output_budget.budget(task, items)
+        return self.config.get('generation', {}).get('max_tokens', 4096)
+    
+    def _fit_context(self, messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """max_tokens that keeps the request inside the context window (see `ContextWindow.fit`)"""
+        if self.context_window is None:
+            return max_tokens
+        return self.context_window.fit(messages, max_tokens)
+    
+    def text_token_limit(self,
+                         messages: List[Dict[str, str]],
+                         task: Optional[str] = None,
+                         items: int = 1,
+                         max_tokens: Optional[int] = None) -> Optional[int]:
+        """Tokens of text that can still be added to `messages` without overflowing the context
+        
+        Generators pass their prompt formatted with empty text to find out how
+        large a chunk (or document) may be. Returns None when the context
+        length of the model is unknown.
+        """
+        if self.context_window is None:
+            return None
+        max_tokens = self._max_tokens(max_tokens, task, items)
+        return max(0, self.context_window.prompt_limit(max_tokens) - estimate_message_tokens(messages))
+    
+    def _record_output(self, task: Optional[str], items: int, content: Union[str, List[str]], max_tokens: int):
+        """Feed a response's length back into the task's output budget"""
+        if not task or not self.output_budget:
+            return
+        for sample in content if isinstance(content, list) else [content]:
+            if sample and not sample.startswith("ERROR:"):
+                self.output_budget.record(task, items, sample, max_tokens)
+    
+    def _request_fields(self, json_schema: Optional[Dict[str, Any]], task: Optional[str] = None) -> Dict[str, Any]:
+        """Extra request fields for structured output or stop sequences
+        
+        vLLM takes the bare schema as `guided_json`; other OpenAI-compatible
+        endpoints take the named schema as a strict `response_format`. Schemas
+        are only sent when `structured_output` is on for the provider.
+        
+        Without a schema, vLLM requests for tasks that answer with a flat JSON
+        array stop at the array's closing bracket on its own line, dropping any
+        commentary after it. The bracket is kept in the output.
+        """
+        if json_schema and self.structured_output:
+            if self.provider == 'api-endpoint':
+                return {"response_format": {"type": "json_schema", "json_schema": {**json_schema, "strict": True}}}
+            return {"guided_json": json_schema["schema"]}
+        if self.provider != 'api-endpoint' and task in FLAT_JSON_ARRAY_TASKS and \
+                self.output_budget and self.stop_after_json:
+            return {"stop": ["\n]"], "include_stop_str_in_output": True}
+        return {}
+    
+    def _check_structured_output_rejected(self, error: Exception, extra: Dict[str, Any]):
+        """Turn structured output off if the endpoint rejected the request for it
+        
+        Raises:
+            StructuredOutputRejected: If structured output was requested and the
+                endpoint answered 400 Bad Request
+        """
+        if extra and any(field in extra for field in STRUCTURED_OUTPUT_FIELDS) and error_status(error) == 400:
+            logger.warning(f"Endpoint rejected structured output, falling back to free-form JSON: {error}")
+            self.structured_output = False
+            raise StructuredOutputRejected(str(error)) from error
     
     def _openai_chat_completion(self, 
                               messages: List[Dict[str, str]],
                               temperature: float,
                               max_tokens: int,
                               top_p: float,
-                              verbose: bool) -> str:
+                              verbose: bool,
+                              extra: Optional[Dict[str, Any]] = None) -> str:
         """Generate a chat completion using the OpenAI API or compatible APIs"""
         debug_mode = os.environ.get('SDK_DEBUG', 'false').lower() == 'true'
         if verbose:
             logger.info(f"Sending request to {self.provider} model {self.model}...")
             
+        estimated_tokens = estimate_message_tokens(messages)
+        delay = None
         for attempt in range(self.max_retries):
+            timeout = self._request_timeout(max_tokens)
+            probe = self.circuit_breaker.before_request() if self.circuit_breaker else False
             try:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire(estimated_tokens)
+                
                 # Create the completion request
-                response = self.openai_client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    top_p=top_p
-                )
+                with self._shared_slot():
+                    response = self.openai_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        top_p=top_p,
+                        timeout=timeout,
+                        **(extra or {})
+                    )
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_success()
                 
                 if verbose:
                     logger.info(f"Received response from {self.provider}")
                 
+                if self.rate_limiter:
+                    self.rate_limiter.reconcile(estimated_tokens, getattr(response, 'usage', None))
+                
                 # Log the full response in debug mode
                 if debug_mode:
                     if hasattr(response, 'model_dump'):
@@ -269,327 +822,900 @@ class LLMClient:
                 raise ValueError(f"Could not extract content from response using any known method")
                 
             except Exception as e:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_failure(e)
+                # An over-long prompt fails the same way on every attempt
+                check_context_overflow(e)
+                self._check_structured_output_rejected(e, extra)
                 if verbose:
                     logger.error(f"{self.provider} API error (attempt {attempt+1}/{self.max_retries}): {str(e)}")
                 
                 if attempt == self.max_retries - 1:
                     raise Exception(f"Failed to get {self.provider} completion after {self.max_retries} attempts: {str(e)}")
                 
-                time.sleep(self.retry_delay * (attempt + 1))  # Exponential backoff
+                delay = backoff_delay(delay, self.retry_delay, self.max_retry_delay)
+                time.sleep(delay)
+            finally:
+                if probe:
+                    self.circuit_breaker.release(probe)
     
     def _vllm_chat_completion(self, 
                             messages: List[Dict[str, str]],
                             temperature: float,
                             max_tokens: int,
                             top_p: float,
-                            verbose: bool) -> str:
+                            verbose: bool,
+                            extra: Optional[Dict[str, Any]] = None) -> str:
         """Generate a chat completion using the VLLM OpenAI-compatible API"""
         data = {
             "model": self.model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
-            "top_p": top_p
+            "top_p": top_p,
+            **(extra or {})
         }
         
+        estimated_tokens = estimate_message_tokens(messages)
+        delay = None
         for attempt in range(self.max_retries):
+            timeout = self._request_timeout(max_tokens)
+            probe = self.circuit_breaker.before_request() if self.circuit_breaker else False
             try:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire(estimated_tokens)
+                
                 # Only print if verbose mode is enabled
                 if verbose:
                     logger.info(f"Sending request to vLLM model {self.model}...")
                 
-                response = requests.post(
-                    f"{self.api_base}/chat/completions",
-                    headers={"Content-Type": "application/json"},
-                    data=json.dumps(data),
-                    timeout=180  # Increased timeout to 180 seconds
-                )
-                
-                if verbose:
-                    logger.info(f"Received response with status code: {response.status_code}")
-                
-                response.raise_for_status()
-                return response.json()["choices"][0]["message"]["content"]
+                with self._shared_slot(), self._endpoint() as api_base:
+                    response = requests.post(
+                        f"{api_base}/chat/completions",
+                        headers={"Content-Type": "application/json"},
+                        data=json.dumps(data),
+                        timeout=timeout
+                    )
+                    
+                    if verbose:
+                        logger.info(f"Received response with status code: {response.status_code}")
+                    
+                    response.raise_for_status()
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_success()
+                # `data` is the request payload, resent as-is on retry
+                result = response.json()
+                if self.rate_limiter:
+                    self.rate_limiter.reconcile(estimated_tokens, result.get("usage"))
+                return result["choices"][0]["message"]["content"]
             
             except (requests.exceptions.RequestException, KeyError, IndexError) as e:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_failure(e)
+                check_context_overflow(e)
+                self._check_structured_output_rejected(e, extra)
                 if attempt == self.max_retries - 1:
                     raise Exception(f"Failed to get vLLM completion after {self.max_retries} attempts: {str(e)}")
-                time.sleep(self.retry_delay * (attempt + 1))  # Exponential backoff
+                delay = backoff_delay(delay, self.retry_delay, self.max_retry_delay)
+                time.sleep(delay)
+            finally:
+                if probe:
+                    self.circuit_breaker.release(probe)
     
     def batch_completion(self, 
                        message_batches: List[List[Dict[str, str]]], 
                        temperature: float = None, 
                        max_tokens: int = None,
                        top_p: float = None,
-                       batch_size: int = None) -> List[str]:
-        """Process multiple message sets in batches
+                       batch_size: int = None,
+                       cache: Optional[bool] = None,
+                       json_schema: Optional[Dict[str, Any]] = None,
+                       n: int = 1,
+                       task: Optional[str] = None,
+                       items: int = 1) -> List[Union[str, List[str]]]:
+        """Process multiple message sets concurrently
         
-        Instead of sending requests one at a time, this method processes
-        multiple prompts in batches to maximize throughput.
+        Thin wrapper over `iter_completion` that keeps up to `batch_size`
+        requests in flight and returns the results in input order. With
+        `n` > 1 each successful result is a list of `n` sampled completions.
+        Requests cut off by the deadline come back as "ERROR: Deadline exceeded".
+        """
+        results = [None] * len(message_batches)
+        for index, content in self.iter_completion(
+            message_batches,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+            max_in_flight=batch_size,
+            cache=cache,
+            json_schema=json_schema,
+            n=n,
+            task=task,
+            items=items
+        ):
+            results[index] = content
+        # Requests cut off by the deadline never produced a result
+        return [content if content is not None else "ERROR: Deadline exceeded" for content in results]
+    
+    def iter_completion(self,
+                        message_batches: List[List[Dict[str, str]]],
+                        temperature: float = None,
+                        max_tokens: int = None,
+                        top_p: float = None,
+                        max_in_flight: int = None,
+                        cache: Optional[bool] = None,
+                        json_schema: Optional[Dict[str, Any]] = None,
+                        stream: bool = False,
+                        n: int = 1,
+                        task: Optional[str] = None,
+                        items: int = 1) -> Iterator[tuple]:
+        """Stream completions for many message sets as they finish
+        
+        A sliding window keeps `max_in_flight` requests running at all times
+        and starts the next one as soon as any request finishes, so a single
+        slow request never stalls the others.
+        
+        Args:
+            message_batches: List of message lists, one per request
+            temperature: Sampling temperature (higher = more random)
+            max_tokens: Maximum tokens to generate
+            top_p: Nucleus sampling parameter
+            max_in_flight: Number of concurrent requests (defaults to generation.batch_size),
+                per replica when load balancing across several vLLM endpoints
+            cache: Use the response cache for these requests (see `_response_cache_key`)
+            json_schema: Named schema to constrain the outputs to (see `chat_completion`)
+            stream: Yield text as it is generated instead of whole responses
+            n: Completions to sample per prompt (see `_sample_async`)
+            task: Prompt name used to size max_tokens (see `chat_completion`)
+            items: Number of outputs each prompt asks for
+            
+        Yields:
+            `(index, content)` tuples in completion order, where `index` is the
+            position in `message_batches`. Requests that still fail after all
+            retries yield content starting with "ERROR:". With `n` > 1 the
+            content of a successful request is a list of `n` strings.
+            
+            With `stream=True`, `(index, delta, finished)` tuples instead: text
+            fragments with `finished` False, then one final tuple per request
+            whose `delta` is "" on success or the "ERROR:" message on failure.
+            Streamed requests bypass the response cache and hedging, and are
+            only retried if they fail before any text has arrived.
+            
+        Closing the iterator early, e.g. by breaking out of a loop over it,
+        cancels every request that is still queued or in flight. Those that
+        had not yielded anything yet are counted in `self.early_stop`.
         """
         # Get defaults from config if not provided
         generation_config = self.config.get('generation', {})
         temperature = temperature if temperature is not None else generation_config.get('temperature', 0.1)
-        max_tokens = max_tokens if max_tokens is not None else generation_config.get('max_tokens', 4096)
+        max_tokens = self._max_tokens(max_tokens, task, items)
         top_p = top_p if top_p is not None else generation_config.get('top_p', 0.95)
-        batch_size = batch_size if batch_size is not None else generation_config.get('batch_size', 32)
+        max_in_flight = max_in_flight if max_in_flight is not None else generation_config.get('batch_size', 32)
+        
+        # With several replicas the window applies to each of them
+        if self.endpoint_pool:
+            max_in_flight *= len(self.endpoint_pool)
         
         verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
         
-        if self.provider == 'api-endpoint':
-            return self._openai_batch_completion(message_batches, temperature, max_tokens, top_p, batch_size, verbose)
-        else:  # Default to vLLM
-            return self._vllm_batch_completion(message_batches, temperature, max_tokens, top_p, batch_size, verbose)
-    
-    async def _process_message_async(self, 
-                                    messages: List[Dict[str, str]], 
-                                    temperature: float,
-                                    max_tokens: int,
-                                    top_p: float,
-                                    verbose: bool,
-                                    debug_mode: bool):
-        """Process a single message set asynchronously using the OpenAI API"""
-        try:
-            from openai import AsyncOpenAI
-        except ImportError:
-            raise ImportError("The 'openai' package is required for this functionality. Please install it using 'pip install openai>=1.0.0'.")
+        if stream and n > 1:
+            raise ValueError("Streaming supports a single completion per prompt (n=1)")
         
-        # Initialize the async OpenAI client
-        client_kwargs = {}
-        if self.api_key:
-            client_kwargs['api_key'] = self.api_key
-        if self.api_base:
-            client_kwargs['base_url'] = self.api_base
+        if self.provider != 'api-endpoint' and not AIOHTTP_AVAILABLE:
+            raise ImportError("The 'aiohttp' package is required for vLLM batch processing. Install with 'pip install aiohttp'")
+        
+        if self.adaptive_concurrency and self._concurrency is None:
+            self._concurrency = AdaptiveConcurrencyLimiter(
+                initial_limit=max_in_flight,
+                min_limit=self.adaptive_concurrency.get('min_concurrency', 1),
+                max_limit=self.adaptive_concurrency.get('max_concurrency', 256),
+                backoff_factor=self.adaptive_concurrency.get('backoff_factor', 0.5),
+                latency_tolerance=self.adaptive_concurrency.get('latency_tolerance', 2.0)
+            )
+        
+        if verbose:
+            logger.info(f"Scheduling {len(message_batches)} requests with up to {max_in_flight} in flight")
+        
+        # Results are handed over from the background loop through a thread-safe
+        # queue; None marks the end of the stream
+        results = queue.Queue()
+        # Requests that have streamed text (touched on the background loop only)
+        streaming = set()
+        if stream:
+            extra = self._request_fields(json_schema, task)
+            
+            def forward(index, delta):
+                streaming.add(index)
+                results.put((index, delta, False))
+            
+            async def complete(index, messages):
+                content = await self._complete_async(
+                    messages, temperature, max_tokens, top_p, verbose, extra,
+                    on_delta=lambda delta: forward(index, delta),
+                    task=task
+                )
+                self._record_output(task, items, content, max_tokens)
+                return ""
+            
+            emit = lambda item: results.put((item[0], item[1], True))
+        else:
+            if n > 1:
+                complete = lambda index, messages: self._sample_async(
+                    messages, temperature, max_tokens, top_p, verbose, json_schema, n, task
+                )
+            else:
+                complete = lambda index, messages: self._cached_complete_async(
+                    messages, temperature, max_tokens, top_p, verbose, cache, json_schema, task
+                )
             
-        async_client = AsyncOpenAI(**client_kwargs)
+            def emit(item):
+                self._record_output(task, items, item[1], max_tokens)
+                results.put(item)
         
-        for attempt in range(self.max_retries):
+        settled = threading.Event()
+        future = asyncio.run_coroutine_threadsafe(
+            self._schedule_async(message_batches, complete, max(1, max_in_flight), emit, streaming, settled),
+            self._get_event_loop()
+        )
+        future.add_done_callback(lambda _: results.put(None))
+        
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    break
+                yield item
+            # Surface unexpected scheduler errors
+            future.result()
+        finally:
+            if future.cancel():
+                # Closed early (so the scheduler is running): wait until it has
+                # stopped sending and counted what it dropped in `self.early_stop`
+                settled.wait(timeout=5.0)
+    
+    async def _schedule_async(self, message_batches, complete, max_in_flight: int, emit,
+                              streaming=frozenset(), settled: Optional[threading.Event] = None):
+        """Keep up to max_in_flight requests running, emitting results as they finish
+        
+        With adaptive concurrency enabled the window follows the controller's
+        current limit instead, and no new request starts while a Retry-After
+        backoff is in effect. Once the command's deadline passes, requests in
+        flight are cancelled and the rest are never sent. The same happens when
+        the caller stops early (the scheduler is cancelled); requests dropped
+        before producing anything, i.e. not in `streaming`, are counted in
+        `self.early_stop`. `settled` is set once the scheduler has stopped.
+        """
+        async def run_one(index: int, messages: List[Dict[str, str]]) -> Tuple[int, str]:
             try:
-                # Asynchronously call the API
-                response = await async_client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    top_p=top_p
-                )
+                return index, await complete(index, messages)
+            except Exception as e:
+                return index, f"ERROR: {str(e)}"
+        
+        pending = set()
+        indices = {}
+        next_index = 0
+        try:
+            while next_index < len(message_batches) or pending:
+                remaining = time_remaining()
+                if remaining is not None and remaining <= 0:
+                    self.deadline_cancelled += len(pending) + len(message_batches) - next_index
+                    logger.warning(f"Deadline reached with {self.deadline_cancelled} requests unfinished")
+                    break
                 
-                if verbose:
-                    logger.info(f"Received response from {self.provider}")
+                window = self._concurrency.limit if self._concurrency else max_in_flight
+                pause = self._concurrency.pause_remaining() if self._concurrency else 0
                 
-                # Log the full response in debug mode
-                if debug_mode:
-                    if hasattr(response, 'model_dump'):
-                        logger.debug(f"Full response: {response.model_dump()}")
-                    else:
-                        logger.debug(f"Response type: {type(response)}")
-                        logger.debug(f"Response attributes: {dir(response)}")
+                # Top the window up before waiting for the next result
+                while not pause and next_index < len(message_batches) and len(pending) < window:
+                    request = asyncio.ensure_future(run_one(next_index, message_batches[next_index]))
+                    indices[request] = next_index
+                    pending.add(request)
+                    next_index += 1
                 
-                content = None
+                # Wake up for the deadline even if nothing finishes
+                wait = pause or None
+                if remaining is not None:
+                    wait = min(wait or remaining, remaining)
                 
-                # Method 1: Try standard OpenAI API response format
-                try:
-                    if hasattr(response, 'choices') and response.choices is not None and len(response.choices) > 0:
-                        choice = response.choices[0]
-                        if hasattr(choice, 'message') and choice.message is not None:
-                            if hasattr(choice.message, 'content') and choice.message.content is not None:
-                                content = choice.message.content
-                except Exception as e:
-                    if verbose:
-                        logger.info(f"Standard format extraction failed: {e}, trying alternative formats...")
-                
-                # Method 2: Llama API format
-                if content is None:
-                    try:
-                        if hasattr(response, 'completion_message') and response.completion_message is not None:
-                            completion = response.completion_message
-                            # Handle dictionary case
-                            if isinstance(completion, dict) and 'content' in completion:
-                                content_obj = completion['content']
-                                # Different Llama API response formats
-                                if isinstance(content_obj, dict) and 'text' in content_obj:
-                                    content = content_obj['text']
-                                elif isinstance(content_obj, str):
-                                    content = content_obj
-                    except Exception as e:
-                        if verbose:
-                            logger.info(f"Llama API format extraction failed: {e}, trying dictionary access...")
+                if not pending:
+                    await asyncio.sleep(wait or 0)
+                    continue
                 
-                # Method 3: Try dictionary access for both formats
-                if content is None:
-                    try:
-                        # Convert to dictionary if possible
-                        response_dict = None
-                        if hasattr(response, 'model_dump'):
-                            response_dict = response.model_dump()
-                        elif hasattr(response, 'dict'):
-                            response_dict = response.dict()
-                        elif hasattr(response, '__dict__'):
-                            response_dict = response.__dict__
-                        elif isinstance(response, dict):
-                            response_dict = response
-                        
-                        if response_dict is not None:
-                            # Try Llama API format
-                            if 'completion_message' in response_dict and response_dict['completion_message'] is not None:
-                                comp = response_dict['completion_message']
-                                if isinstance(comp, dict) and 'content' in comp:
-                                    content_obj = comp['content']
-                                    if isinstance(content_obj, dict) and 'text' in content_obj:
-                                        content = content_obj['text']
-                                    elif isinstance(content_obj, str):
-                                        content = content_obj
-                            
-                            # Try OpenAI format
-                            if content is None and 'choices' in response_dict and response_dict['choices'] and len(response_dict['choices']) > 0:
-                                choice = response_dict['choices'][0]
-                                if isinstance(choice, dict) and 'message' in choice:
-                                    message = choice['message']
-                                    if isinstance(message, dict) and 'content' in message and message['content'] is not None:
-                                        content = message['content']
-                    except Exception as e:
-                        if verbose:
-                            logger.info(f"Dictionary access failed: {e}")
-                
-                # If content is still None, print detailed debug info
-                if content is None:
-                    if verbose or debug_mode:
-                        logger.error("Could not extract content from response using any known method")
-                        logger.error(f"Response: {response}")
-                        if isinstance(response, dict):
-                            for k, v in response.items():
-                                logger.error(f"Key: {k}, Value type: {type(v)}, Value: {v}")
-                        # Try to find any content-like fields
-                        all_attrs = dir(response)
-                        content_fields = [attr for attr in all_attrs if 'content' in attr.lower() or 'text' in attr.lower() or 'message' in attr.lower()]
-                        for field in content_fields:
-                            try:
-                                logger.error(f"Potential content field '{field}': {getattr(response, field, 'N/A')}")
-                            except:
-                                pass
-                    
-                    raise ValueError(f"Could not extract content from response using any known method")
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=wait,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    emit(task.result())
+        except asyncio.CancelledError:
+            # Finished requests were delivered and streaming ones yielded text
+            self.early_stop["cancelled_in_flight"] += sum(
+                1 for task in pending if not task.done() and indices[task] not in streaming
+            )
+            self.early_stop["not_sent"] += len(message_batches) - next_index
+            raise
+        finally:
+            # Reached on cancellation: drop everything still in flight
+            for task in pending:
+                task.cancel()
+            if settled is not None:
+                settled.set()
+    
+    async def _cached_complete_async(self,
+                                     messages: List[Dict[str, str]],
+                                     temperature: float,
+                                     max_tokens: int,
+                                     top_p: float,
+                                     verbose: bool,
+                                     cache: Optional[bool],
+                                     json_schema: Optional[Dict[str, Any]] = None,
+                                     task: Optional[str] = None) -> str:
+        """Serve a request from the response cache, or join an identical one in flight"""
+        extra = self._request_fields(json_schema, task)
+        key = self._response_cache_key(messages, temperature, max_tokens, top_p, cache, extra, task)
+        if key is None:
+            return await self._hedged_complete_async(messages, temperature, max_tokens, top_p, verbose, extra, task)
+        
+        while True:
+            cached = await self.response_cache.get_async(key)
+            if cached is not None:
+                return cached
+            shared = self._inflight_responses.get(key)
+            if shared is None:
+                break
+            self.response_cache.coalesced += 1
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                # Only retry if the request we joined was cancelled, not us
+                if not shared.cancelled():
+                    raise
+        
+        shared = asyncio.get_event_loop().create_future()
+        # Mark failures as retrieved so an unobserved error is not logged
+        shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight_responses[key] = shared
+        try:
+            content = await self._hedged_complete_async(messages, temperature, max_tokens, top_p, verbose, extra, task)
+        except asyncio.CancelledError:
+            shared.cancel()
+            raise
+        except Exception as e:
+            shared.set_exception(e)
+            raise
+        else:
+            # Waiters need not wait for the write
+            shared.set_result(content)
+            await self.response_cache.put_async(key, content)
+            return content
+        finally:
+            self._inflight_responses.pop(key, None)
+    
+    async def _sample_async(self,
+                            messages: List[Dict[str, str]],
+                            temperature: float,
+                            max_tokens: int,
+                            top_p: float,
+                            verbose: bool,
+                            json_schema: Optional[Dict[str, Any]],
+                            n: int,
+                            task: Optional[str] = None) -> List[str]:
+        """Sample `n` completions for one prompt
+        
+        Sent as a single request with the `n` parameter, so a server with
+        prefix caching processes the prompt once and decodes it `n` times.
+        Endpoints configured with `supports_n: false`, or that return fewer
+        choices than asked for, get one request per missing sample instead.
+        """
+        extra = self._request_fields(json_schema, task)
+        samples = []
+        if self.supports_n:
+            samples = await self._hedged_complete_async(
+                messages, temperature, max_tokens, top_p, verbose, {**extra, "n": n}, task
+            )
+        
+        missing = n - len(samples)
+        if missing > 0:
+            tasks = [
+                asyncio.ensure_future(
+                    self._hedged_complete_async(messages, temperature, max_tokens, top_p, verbose, extra, task)
+                )
+                for _ in range(missing)
+            ]
+            try:
+                samples += await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+        return samples
+    
+    async def _hedged_complete_async(self,
+                                     messages: List[Dict[str, str]],
+                                     temperature: float,
+                                     max_tokens: int,
+                                     top_p: float,
+                                     verbose: bool,
+                                     extra: Optional[Dict[str, Any]] = None,
+                                     task: Optional[str] = None) -> str:
+        """Run a request, sending a duplicate if it takes longer than usual
+        
+        The first copy to succeed wins and the other one is cancelled. With
+        load balancing the duplicate usually lands on another replica, since
+        the original still counts against its own.
+        """
+        def complete():
+            return asyncio.ensure_future(
+                self._complete_async(messages, temperature, max_tokens, top_p, verbose, extra, task=task)
+            )
+        
+        if self.hedging is None or (self.cassette and self.cassette.replaying):
+            return await complete()
+        
+        delay = self.hedging.delay()
+        started = time.monotonic()
+        primary = complete()
+        tasks = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.hedging.try_hedge():
+                    if verbose:
+                        logger.info(f"Hedging request still running after {delay:.2f}s")
+                    tasks.add(complete())
+            
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedging.hedge_wins += 1
+                        self.hedging.record(time.monotonic() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _complete_async(self,
+                              messages: List[Dict[str, str]],
+                              temperature: float,
+                              max_tokens: int,
+                              top_p: float,
+                              verbose: bool,
+                              extra: Optional[Dict[str, Any]] = None,
+                              on_delta: Optional[Callable[[str], None]] = None,
+                              task: Optional[str] = None) -> str:
+        """Run a single chat completion on the background loop using the selected provider
+        
+        Failed attempts are retried, and each attempt's latency or overload
+        signal is reported to the adaptive concurrency controller. With a
+        cassette, the request is recorded or replayed instead. `extra` holds
+        structured output fields; if the endpoint rejects them the request is
+        sent again without. With `on_delta` the response is streamed and each
+        text fragment passed to it as it arrives. `task` only affects the
+        cassette key (see `_key_max_tokens`).
+        """
+        debug_mode = os.environ.get('SDK_DEBUG', 'false').lower() == 'true'
+        extra = extra or {}
+        max_tokens = self._fit_context(messages, max_tokens)
+        request_data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            **extra
+        }
+        
+        if self.cassette and self.cassette.replaying:
+            content, delay = self.cassette.play(request_data, self._key_request(request_data, task))
+            await asyncio.sleep(delay)
+            if on_delta:
+                on_delta(content)
+            return content
+        
+        estimated_tokens = estimate_message_tokens(messages)
+        requested_at = time.monotonic()
+        delay = None
+        # Text already handed to on_delta cannot be taken back, so a stream
+        # that fails part way through is not retried
+        streamed = []
+        
+        def forward(delta: str):
+            streamed.append(delta)
+            on_delta(delta)
+        
+        for attempt in range(self.max_retries):
+            # Fails fast with DeadlineExceededError once the deadline has passed,
+            # and with CircuitOpenError while the endpoint is down
+            timeout = self._request_timeout(max_tokens)
+            probe = self.circuit_breaker.before_request() if self.circuit_breaker else False
+            
+            epoch = self._concurrency.epoch if self._concurrency else 0
+            try:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire_async(estimated_tokens)
+                async with self._shared_slot_async():
+                    started = time.monotonic()
+                    if self.provider == 'api-endpoint' and on_delta:
+                        content, usage = await self._stream_openai_async(
+                            messages, temperature, max_tokens, top_p, timeout, extra, forward
+                        )
+                    elif self.provider == 'api-endpoint':
+                        content, usage = await self._process_message_async(
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            top_p=top_p,
+                            verbose=verbose,
+                            debug_mode=debug_mode,
+                            timeout=timeout,
+                            **extra
+                        )
+                    else:
+                        self._ensure_health_checks()
+                        with self._endpoint() as api_base:
+                            if on_delta:
+                                content, usage = await self._stream_vllm_async(
+                                    self._get_http_session(), request_data, api_base, timeout, forward
+                                )
+                            else:
+                                content, usage = await self._vllm_request_async(
+                                    self._get_http_session(), request_data, verbose, api_base, timeout
+                                )
                 
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_success()
+                if self.rate_limiter:
+                    await self.rate_limiter.reconcile_async(estimated_tokens, usage)
+                if self._concurrency:
+                    self._concurrency.on_success(epoch, time.monotonic() - started)
+                if self.cassette:
+                    self.cassette.record(request_data, content, time.monotonic() - requested_at,
+                                         self._key_request(request_data, task))
                 return content
-                
+            
             except Exception as e:
+                # Record first: the checks below raise, and a half-open probe
+                # must always report back
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_failure(e)
+                # An over-long prompt fails the same way on every attempt
+                check_context_overflow(e)
+                try:
+                    self._check_structured_output_rejected(e, extra)
+                except StructuredOutputRejected:
+                    # Resend without the schema, keeping the other fields (e.g. n)
+                    extra = {k: v for k, v in extra.items() if k not in STRUCTURED_OUTPUT_FIELDS}
+                    return await self._complete_async(messages, temperature, max_tokens, top_p, verbose, extra,
+                                                      on_delta=on_delta, task=task)
+                overloaded, retry_after = self._overload_signal(e)
+                if overloaded and self._concurrency:
+                    self._concurrency.on_overload(epoch, retry_after)
+                
                 if verbose:
                     logger.error(f"{self.provider} API error (attempt {attempt+1}/{self.max_retries}): {str(e)}")
                 
-                if attempt == self.max_retries - 1:
-                    return f"ERROR: {str(e)}"
+                if attempt == self.max_retries - 1 or streamed:
+                    raise
                 
-                await asyncio.sleep(self.retry_delay * (attempt + 1))  # Exponential backoff
-    
-    def _openai_batch_completion(self,
-                                message_batches: List[List[Dict[str, str]]],
-                                temperature: float,
-                                max_tokens: int,
-                                top_p: float,
-                                batch_size: int,
-                                verbose: bool) -> List[str]:
-        """Process multiple message sets using the OpenAI API or compatible APIs asynchronously"""
-        debug_mode = os.environ.get('SDK_DEBUG', 'false').lower() == 'true'
-        results = []
+                if retry_after is not None:
+                    await asyncio.sleep(retry_after)
+                else:
+                    delay = backoff_delay(delay, self.retry_delay, self.max_retry_delay)
+                    await asyncio.sleep(delay)
+            finally:
+                # A probe cancelled by an early stop or the deadline hands the circuit back
+                if probe:
+                    self.circuit_breaker.release(probe)
+    
+    def _overload_signal(self, error: Exception) -> Tuple[bool, Optional[float]]:
+        """Check whether an error means the endpoint is overloaded
+        
+        Returns:
+            Tuple of (overloaded, seconds from the Retry-After header or None)
+        """
+        if isinstance(error, asyncio.TimeoutError) or 'timeout' in type(error).__name__.lower():
+            return True, None
         
-        # Process message batches in chunks to avoid overloading the API
-        for i in range(0, len(message_batches), batch_size):
-            batch_chunk = message_batches[i:i+batch_size]
+        # aiohttp errors carry `status`, OpenAI errors carry `status_code`
+        status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+        if status not in (429, 503):
+            return False, None
+        
+        headers = getattr(error, 'headers', None)
+        if headers is None and getattr(error, 'response', None) is not None:
+            headers = getattr(error.response, 'headers', None)
+        return True, parse_retry_after((headers or {}).get('Retry-After'))
+    
+    def get_metrics(self, since: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Return run metrics for this client, e.g. rate limit waits and the adaptive concurrency history
+        
+        The client is shared between files, so its counters cover the whole
+        run. Pass an earlier `get_metrics()` result as `since` to get only
+        the work done after it (see `metrics_since`).
+        """
+        if since is not None:
+            return metrics_since(since, self.get_metrics())
+        metrics = {}
+        if self.rate_limiter is not None:
+            metrics["rate_limit"] = self.rate_limiter.snapshot()
+        if self._concurrency is not None:
+            metrics["concurrency"] = self._concurrency.snapshot()
+        if self.response_cache is not None:
+            metrics["cache"] = self.response_cache.snapshot()
+        if self.cassette is not None:
+            metrics["cassette"] = self.cassette.snapshot()
+        if self.endpoint_pool is not None:
+            metrics["endpoints"] = self.endpoint_pool.snapshot()
+        if self.hedging is not None:
+            metrics["hedging"] = self.hedging.snapshot()
+        if self.circuit_breaker is not None:
+            metrics["circuit_breaker"] = self.circuit_breaker.snapshot()
+        if self.output_budget is not None:
+            metrics["output_budget"] = self.output_budget.snapshot()
+        if self.context_window is not None:
+            metrics["context_window"] = self.context_window.snapshot()
+        if self.deadline_cancelled:
+            metrics["deadline"] = {"cancelled_requests": self.deadline_cancelled}
+        if any(self.early_stop.values()):
+            metrics["early_stop"] = dict(self.early_stop)
+        if self.shared_max_in_flight:
+            metrics["shared_slots"] = {
+                "max_in_flight": self.shared_max_in_flight,
+                "in_use": self.coordinator.slots_in_use()
+            }
+        return metrics
+    
+    async def _process_message_async(self, 
+                                    messages: List[Dict[str, str]], 
+                                    temperature: float,
+                                    max_tokens: int,
+                                    top_p: float,
+                                    verbose: bool,
+                                    debug_mode: bool,
+                                    timeout: Optional[float] = None,
+                                    **extra):
+        """Send a single message set asynchronously using the OpenAI API
+        
+        Makes one attempt; retries are handled by `_complete_async`. Keyword
+        arguments in `extra` (e.g. `response_format` or `n`) are passed to the API.
+        
+        Returns:
+            Tuple of (content, usage reported by the API); with `n` > 1 the
+            content is the list of all returned choices
+        """
+        async_client = self._get_async_openai_client()
+        
+        # Asynchronously call the API
+        response = await async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+            timeout=timeout,
+            **extra
+        )
+        
+        if verbose:
+            logger.info(f"Received response from {self.provider}")
+        
+        # Log the full response in debug mode
+        if debug_mode:
+            if hasattr(response, 'model_dump'):
+                logger.debug(f"Full response: {response.model_dump()}")
+            else:
+                logger.debug(f"Response type: {type(response)}")
+                logger.debug(f"Response attributes: {dir(response)}")
+        
+        content = None
+        
+        # Method 1: Try standard OpenAI API response format
+        try:
+            if hasattr(response, 'choices') and response.choices is not None and len(response.choices) > 0:
+                if extra.get('n', 1) > 1:
+                    samples = [choice.message.content for choice in response.choices
+                               if choice.message is not None and choice.message.content is not None]
+                    if samples:
+                        return samples, getattr(response, 'usage', None)
+                choice = response.choices[0]
+                if hasattr(choice, 'message') and choice.message is not None:
+                    if hasattr(choice.message, 'content') and choice.message.content is not None:
+                        content = choice.message.content
+        except Exception as e:
             if verbose:
-                logger.info(f"Processing batch {i//batch_size + 1}/{(len(message_batches) + batch_size - 1) // batch_size} with {len(batch_chunk)} requests")
-            
-            # Import asyncio here to avoid issues if not available
+                logger.info(f"Standard format extraction failed: {e}, trying alternative formats...")
+        
+        # Method 2: Llama API format
+        if content is None:
             try:
-                import asyncio
-            except ImportError:
-                raise ImportError("The 'asyncio' package is required for batch processing. Please ensure you're using Python 3.7+.")
-            
-            # Define async batch processing function
-            async def process_batch():
-                tasks = []
-                for messages in batch_chunk:
-                    task = self._process_message_async(
-                        messages=messages,
-                        temperature=temperature,
-                        max_tokens=max_tokens,
-                        top_p=top_p,
-                        verbose=verbose,
-                        debug_mode=debug_mode
-                    )
-                    tasks.append(task)
+                if hasattr(response, 'completion_message') and response.completion_message is not None:
+                    completion = response.completion_message
+                    # Handle dictionary case
+                    if isinstance(completion, dict) and 'content' in completion:
+                        content_obj = completion['content']
+                        # Different Llama API response formats
+                        if isinstance(content_obj, dict) and 'text' in content_obj:
+                            content = content_obj['text']
+                        elif isinstance(content_obj, str):
+                            content = content_obj
+            except Exception as e:
+                if verbose:
+                    logger.info(f"Llama API format extraction failed: {e}, trying dictionary access...")
+        
+        # Method 3: Try dictionary access for both formats
+        if content is None:
+            try:
+                # Convert to dictionary if possible
+                response_dict = None
+                if hasattr(response, 'model_dump'):
+                    response_dict = response.model_dump()
+                elif hasattr(response, 'dict'):
+                    response_dict = response.dict()
+                elif hasattr(response, '__dict__'):
+                    response_dict = response.__dict__
+                elif isinstance(response, dict):
+                    response_dict = response
                 
-                # Process all messages in the batch concurrently
-                return await asyncio.gather(*tasks)
-            
-            # Run the async batch processing
-            batch_results = asyncio.run(process_batch())
-            results.extend(batch_results)
+                if response_dict is not None:
+                    # Try Llama API format
+                    if 'completion_message' in response_dict and response_dict['completion_message'] is not None:
+                        comp = response_dict['completion_message']
+                        if isinstance(comp, dict) and 'content' in comp:
+                            content_obj = comp['content']
+                            if isinstance(content_obj, dict) and 'text' in content_obj:
+                                content = content_obj['text']
+                            elif isinstance(content_obj, str):
+                                content = content_obj
+                    
+                    # Try OpenAI format
+                    if content is None and 'choices' in response_dict and response_dict['choices'] and len(response_dict['choices']) > 0:
+                        choice = response_dict['choices'][0]
+                        if isinstance(choice, dict) and 'message' in choice:
+                            message = choice['message']
+                            if isinstance(message, dict) and 'content' in message and message['content'] is not None:
+                                content = message['content']
+            except Exception as e:
+                if verbose:
+                    logger.info(f"Dictionary access failed: {e}")
+        
+        # If content is still None, print detailed debug info
+        if content is None:
+            if verbose or debug_mode:
+                logger.error("Could not extract content from response using any known method")
+                logger.error(f"Response: {response}")
+                if isinstance(response, dict):
+                    for k, v in response.items():
+                        logger.error(f"Key: {k}, Value type: {type(v)}, Value: {v}")
+                # Try to find any content-like fields
+                all_attrs = dir(response)
+                content_fields = [attr for attr in all_attrs if 'content' in attr.lower() or 'text' in attr.lower() or 'message' in attr.lower()]
+                for field in content_fields:
+                    try:
+                        logger.error(f"Potential content field '{field}': {getattr(response, field, 'N/A')}")
+                    except:
+                        pass
             
-            # Small delay between batches to avoid rate limits
-            if i + batch_size < len(message_batches):
-                time.sleep(0.5)
-        
-        return results
-    
-    def _vllm_batch_completion(self,
-                             message_batches: List[List[Dict[str, str]]],
-                             temperature: float,
-                             max_tokens: int,
-                             top_p: float,
-                             batch_size: int,
-                             verbose: bool) -> List[str]:
-        """Process multiple message sets in batches using vLLM's API"""
-        results = []
-        
-        # Process message batches in chunks to avoid overloading the server
-        for i in range(0, len(message_batches), batch_size):
-            batch_chunk = message_batches[i:i+batch_size]
+            raise ValueError(f"Could not extract content from response using any known method")
+        
+        # Formats without multiple choices yield a single sample
+        if extra.get('n', 1) > 1:
+            return [content], getattr(response, 'usage', None)
+        return content, getattr(response, 'usage', None)
+    
+    async def _vllm_request_async(self,
+                                  session: 'aiohttp.ClientSession',
+                                  request_data: Dict[str, Any],
+                                  verbose: bool,
+                                  api_base: Optional[str] = None,
+                                  timeout: Optional[float] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Send a single chat completion request to vLLM on a shared session
+        
+        Returns:
+            Tuple of (content, usage reported by the server)
+        """
+        if verbose:
+            logger.info(f"Sending batch request to vLLM model {self.model}...")
+        
+        async with session.post(
+            f"{api_base or self.api_base}/chat/completions",
+            json=request_data,
+            timeout=aiohttp.ClientTimeout(total=timeout) if timeout else None
+        ) as response:
             if verbose:
-                logger.info(f"Processing batch {i//batch_size + 1}/{(len(message_batches) + batch_size - 1) // batch_size} with {len(batch_chunk)} requests")
-            
-            # Create batch request payload for VLLM
-            batch_requests = []
-            for messages in batch_chunk:
-                batch_requests.append({
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "top_p": top_p
-                })
-            
-            try:
-                # For now, we run these in parallel with multiple requests
-                batch_results = []
-                for request_data in batch_requests:
-                    # Only print if verbose mode is enabled
-                    if verbose:
-                        logger.info(f"Sending batch request to vLLM model {self.model}...")
-                    
-                    response = requests.post(
-                        f"{self.api_base}/chat/completions",
-                        headers={"Content-Type": "application/json"},
-                        data=json.dumps(request_data),
-                        timeout=180  # Increased timeout for batch processing
-                    )
-                    
-                    if verbose:
-                        logger.info(f"Received response with status code: {response.status_code}")
-                    
-                    response.raise_for_status()
-                    content = response.json()["choices"][0]["message"]["content"]
-                    batch_results.append(content)
-                
-                results.extend(batch_results)
-                
-            except (requests.exceptions.RequestException, KeyError, IndexError) as e:
-                raise Exception(f"Failed to process vLLM batch: {str(e)}")
+                logger.info(f"Received response with status code: {response.status}")
             
-            # Small delay between batches
-            if i + batch_size < len(message_batches):
-                time.sleep(0.1)
+            await self._check_context_overflow_async(response)
+            response.raise_for_status()
+            data = await response.json()
+            if request_data.get("n", 1) > 1:
+                return [choice["message"]["content"] for choice in data["choices"]], data.get("usage")
+            return data["choices"][0]["message"]["content"], data.get("usage")
+    
+    async def _check_context_overflow_async(self, response: 'aiohttp.ClientResponse'):
+        """Raise `ContextWindowExceeded` if vLLM rejected the prompt as too long
         
-        return results
+        aiohttp errors do not carry the response body, so it is read here.
+        """
+        if response.status == 400:
+            body = await response.text()
+            if is_context_overflow(body):
+                raise ContextWindowExceeded(body)
+    
+    async def _stream_openai_async(self,
+                                   messages: List[Dict[str, str]],
+                                   temperature: float,
+                                   max_tokens: int,
+                                   top_p: float,
+                                   timeout: Optional[float],
+                                   extra: Dict[str, Any],
+                                   on_delta: Callable[[str], None]) -> Tuple[str, Any]:
+        """Stream one completion from the OpenAI API, passing each text fragment to `on_delta`
+        
+        Returns:
+            Tuple of (full content, usage reported in the final chunk)
+        """
+        async_client = self._get_async_openai_client()
+        response = await async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+            timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True},
+            **extra
+        )
+        
+        parts = []
+        usage = None
+        async for chunk in response:
+            usage = getattr(chunk, 'usage', None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                on_delta(parts[-1])
+        return "".join(parts), usage
+    
+    async def _stream_vllm_async(self,
+                                 session: 'aiohttp.ClientSession',
+                                 request_data: Dict[str, Any],
+                                 api_base: Optional[str],
+                                 timeout: Optional[float],
+                                 on_delta: Callable[[str], None]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Stream one completion from vLLM (server-sent events), passing each text fragment to `on_delta`
+        
+        Returns:
+            Tuple of (full content, usage reported in the final event)
+        """
+        parts = []
+        usage = None
+        async with session.post(
+            f"{api_base or self.api_base}/chat/completions",
+            json={**request_data, "stream": True, "stream_options": {"include_usage": True}},
+            timeout=aiohttp.ClientTimeout(total=timeout) if timeout else None
+        ) as response:
+            await self._check_context_overflow_async(response)
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                usage = event.get("usage") or usage
+                choices = event.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+        return "".join(parts), usage
     
     @classmethod
     def from_config(cls, config_path: Path) -> 'LLMClient':
@@ -0,0 +1,171 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Token-bucket rate limiting for LLM requests (requests and tokens per minute)
+import time
+import asyncio
+import threading
+from typing import Dict, Any, Optional
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to one minute of budget"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (requests larger than the bucket only need a full bucket)"""
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets for one provider
+
+    Each request reserves one request and its estimated prompt tokens before
+    it is sent. Once the response arrives, `reconcile` charges the difference
+    between the estimate and the `usage` reported by the server. The token
+    bucket may go negative, which delays later requests until the debt is
+    repaid.
+
+    With a `coordinator` (see `models.coordination`) the buckets live in
+    shared storage, so the budgets apply across processes.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        coordinator=None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.coordinator = coordinator
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+
+    def _shared_requests(self, tokens: int):
+        """Bucket reservations for one request in the coordinator's format"""
+        requests = []
+        if self.requests_per_minute:
+            requests.append(("requests", self.requests_per_minute, 1))
+        if self.tokens_per_minute:
+            requests.append(("tokens", self.tokens_per_minute, tokens))
+        return requests
+
+    def _reserve(self, tokens: int) -> float:
+        """Take the budget for one request if available, else return seconds to wait"""
+        if self.coordinator is not None:
+            return self.coordinator.reserve(self._shared_requests(tokens))
+
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amount))
+            if wait > 0:
+                return wait
+            if self._requests is not None:
+                self._requests.level -= 1
+            if self._tokens is not None:
+                self._tokens.level -= tokens
+            return 0.0
+
+    def _adjust_tokens(self, delta: int):
+        """Charge (positive) or refund (negative) tokens after the fact"""
+        if self._tokens is None:
+            return
+        if self.coordinator is not None:
+            self.coordinator.adjust("tokens", self.tokens_per_minute, delta)
+            return
+        with self._lock:
+            self._tokens.refill(time.monotonic())
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level - delta)
+
+    def acquire(self, tokens: int):
+        """Block the calling thread until the request fits in the budget"""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            self.total_wait += wait
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int):
+        """Wait on the event loop until the request fits in the budget"""
+        while True:
+            if self.coordinator is not None:
+                # Shared buckets live in SQLite, whose lock must not stall the loop
+                wait = await self.coordinator.reserve_async(self._shared_requests(tokens))
+            else:
+                wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            self.total_wait += wait
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens: int, usage: Optional[Dict[str, Any]]):
+        """Correct the token estimate using the usage reported by the server"""
+        actual = usage_total_tokens(usage)
+        if actual is not None:
+            self._adjust_tokens(actual - estimated_tokens)
+
+    async def reconcile_async(self, estimated_tokens: int, usage: Optional[Dict[str, Any]]):
+        """Async variant of `reconcile` for requests on the event loop"""
+        actual = usage_total_tokens(usage)
+        if actual is None or self._tokens is None:
+            return
+        if self.coordinator is not None:
+            await self.coordinator.adjust_async(
+                "tokens", self.tokens_per_minute, actual - estimated_tokens
+            )
+        else:
+            self._adjust_tokens(actual - estimated_tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Configured budgets and time spent waiting, for run metrics"""
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "shared": self.coordinator is not None,
+            "total_wait_seconds": round(self.total_wait, 3),
+        }
+
+
+def usage_total_tokens(usage: Any) -> Optional[int]:
+    """Read total tokens from an OpenAI-style usage object or dict"""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        total = usage.get("total_tokens")
+        if total is None and "prompt_tokens" in usage:
+            total = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+    else:
+        total = getattr(usage, "total_tokens", None)
+    return total if isinstance(total, int) else None
+
+
+def create_rate_limiter(provider_config: Dict[str, Any], coordinator=None) -> Optional[RateLimiter]:
+    """Build a rate limiter from the `rate_limit` section of a provider config"""
+    rate_config = provider_config.get("rate_limit") or {}
+    requests_per_minute = rate_config.get("requests_per_minute")
+    tokens_per_minute = rate_config.get("tokens_per_minute")
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    return RateLimiter(requests_per_minute, tokens_per_minute, coordinator=coordinator)
@@ -0,0 +1,168 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Content-addressed on-disk cache of LLM responses
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join("~", ".cache", "synthetic-data-kit", "responses.sqlite")
+
+
+def cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Hash everything that determines a completion into a cache key
+
+    `extra` holds any further request fields, such as a structured output
+    schema; it only changes the key when non-empty.
+    """
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "top_p": top_p,
+        "max_tokens": max_tokens,
+    }
+    if extra:
+        request["extra"] = extra
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Completions stored in a SQLite file, evicted least-recently-used by size
+
+    Only successful responses are stored. Every hit refreshes the entry's
+    access time, and once the stored responses exceed `max_size_bytes` the
+    least recently used ones are deleted.
+
+    Queries can wait up to 30s for the file lock and `put` scans for
+    eviction, so the `*_async` variants run on one worker thread instead of
+    the event loop.
+    """
+
+    def __init__(self, path: str, max_size_bytes: int):
+        self.path = os.path.expanduser(path)
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT, size INTEGER, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for `key`, or None on a miss"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Store a response and evict old entries beyond the size limit"""
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._evict()
+
+    def _run_async(self, func, *args) -> "asyncio.Future":
+        """Start `func` on the worker thread"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="sdk-response-cache"
+                )
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """Async variant of `get` that keeps the event loop free"""
+        return await self._run_async(self.get, key)
+
+    async def put_async(self, key: str, response: str):
+        """Async variant of `put`; finishes even if the caller is cancelled"""
+        await asyncio.shield(self._run_async(self.put, key, response))
+
+    def _evict(self):
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_size_bytes:
+            return
+        expired = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed ASC"
+        ):
+            if total <= self.max_size_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", expired)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size, for run metrics"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+def create_response_cache(cache_config: Optional[Dict[str, Any]]) -> Optional[ResponseCache]:
+    """Build a response cache from the `llm.cache` section of the config"""
+    cache_config = cache_config or {}
+    if not cache_config.get("enabled"):
+        return None
+    return ResponseCache(
+        cache_config.get("path") or DEFAULT_CACHE_PATH,
+        int(cache_config.get("max_size_mb", 1024) * 1024 * 1024),
+    )
@@ -0,0 +1,146 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Retry backoff and circuit breaking for LLM requests
+import time
+import random
+import threading
+from typing import Dict, Any, Optional
+
+
+def backoff_delay(previous: Optional[float], base: float, cap: float) -> float:
+    """Next retry delay using decorrelated jitter
+
+    Each delay is drawn between `base` and three times the previous delay,
+    capped at `cap`, so clients that failed together do not retry together.
+    Pass None as `previous` for the first retry.
+    """
+    previous = previous if previous is not None else base
+    return min(cap, random.uniform(base, max(base, previous * 3)))
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status code carried by a request error, if any
+
+    aiohttp errors carry `status`, OpenAI errors `status_code` and requests
+    errors a `response` with a `status_code`.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_endpoint_failure(error: Exception) -> bool:
+    """Check whether an error suggests the endpoint is down rather than the request being bad
+
+    Connection errors, timeouts and 5xx responses count; 4xx responses
+    (including 429 rate limiting) and malformed responses do not.
+    """
+    status = error_status(error)
+    if status is not None:
+        return status >= 500
+    name = type(error).__name__.lower()
+    return "connect" in name or "timeout" in name
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Fail fast while an endpoint is clearly down
+
+    After `failure_threshold` consecutive endpoint failures the circuit opens
+    and requests fail immediately with `CircuitOpenError`. After
+    `reset_timeout` seconds one probe request is let through (half-open): if it
+    succeeds the circuit closes, otherwise it opens again. A probe that ends
+    without an outcome (cancelled, or failed before reaching the endpoint) is
+    handed back with `release`, and one that never reports back is replaced
+    after another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.opened = 0
+        self.rejected = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self) -> bool:
+        """Raise `CircuitOpenError` unless a request may be sent now
+
+        Returns:
+            True if the request is the half-open probe; pass it to `release`
+            once the request is over
+        """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            now = time.monotonic()
+            since = now - (self._probe_started if self.state == "half-open" else self._opened_at)
+            if since >= self.reset_timeout:
+                # Let a single probe through
+                self.state = "half-open"
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            raise CircuitOpenError(
+                f"Circuit open after {self._failures} consecutive endpoint failures; "
+                f"next probe in {max(0.0, self.reset_timeout - since):.1f}s"
+            )
+
+    def release(self, probe: bool):
+        """End a request started by `before_request`
+
+        A probe that recorded neither success nor failure leaves the circuit
+        open, with the next probe allowed straight away.
+        """
+        if not probe:
+            return
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = "closed"
+
+    def record_failure(self, error: Exception):
+        """Count a failed request; only endpoint failures can open the circuit"""
+        with self._lock:
+            if not is_endpoint_failure(error):
+                if self.state == "half-open":
+                    # The endpoint answered, so the probe shows it is up
+                    self.state = "closed"
+                return
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Circuit state and counters, for run metrics"""
+        with self._lock:
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected}
+
+
+def create_circuit_breaker(provider_config: Dict[str, Any]) -> Optional[CircuitBreaker]:
+    """Build a circuit breaker from the `circuit_breaker` section of a provider config"""
+    breaker_config = provider_config.get("circuit_breaker") or {}
+    if not breaker_config.get("enabled", True):
+        return None
+    return CircuitBreaker(
+        failure_threshold=breaker_config.get("failure_threshold", 5),
+        reset_timeout=breaker_config.get("reset_timeout", 30.0),
+    )
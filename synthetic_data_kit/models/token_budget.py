@@ -0,0 +1,106 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Per-task output token budgets learned from observed response lengths
+import threading
+from typing import Dict, Any, Optional
+
+from synthetic_data_kit.utils.text import estimate_tokens
+
+# Starting estimates of output tokens per requested item, by prompt name
+DEFAULT_TOKENS_PER_ITEM = {
+    "summary": 250,
+    "qa_generation": 90,
+    "qa_rating": 110,
+    "cot_generation": 350,
+    "cot_enhancement": 500,
+}
+
+# Tasks that answer with a flat JSON array, which ends at a "]" on its own line
+FLAT_JSON_ARRAY_TASKS = ("qa_generation", "qa_rating", "cot_generation")
+
+
+class OutputBudget:
+    """Choose max_tokens per request from the task and the number of items asked for
+
+    The budget is `base_tokens` plus the estimated tokens per item times the
+    item count times `headroom`, kept between `min_tokens` and `max_tokens`.
+    Estimates start from `DEFAULT_TOKENS_PER_ITEM` and follow observed
+    responses (exponentially weighted). A response that used nearly all of
+    its budget was probably cut off, so the estimate grows by `headroom`.
+
+    Tight budgets matter most with vLLM, which reserves KV cache for
+    max_tokens per sequence and so fits more sequences in a batch.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4096,
+        min_tokens: int = 256,
+        base_tokens: int = 64,
+        headroom: float = 1.5,
+        smoothing: float = 0.2,
+    ):
+        self.max_tokens = max_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+        self.base_tokens = base_tokens
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self._tokens_per_item = dict(DEFAULT_TOKENS_PER_ITEM)
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def budget(self, task: str, items: int = 1) -> int:
+        """max_tokens for a request asking for `items` outputs of `task`"""
+        with self._lock:
+            per_item = self._tokens_per_item.get(task)
+        if per_item is None:
+            return self.max_tokens
+        budget = self.base_tokens + per_item * max(1, items) * self.headroom
+        return int(min(self.max_tokens, max(self.min_tokens, budget)))
+
+    def record(self, task: str, items: int, content: str, budget: int):
+        """Update the estimate for `task` from one response"""
+        tokens = estimate_tokens(content)
+        observed = max(0, tokens - self.base_tokens) / max(1, items)
+        truncated = tokens >= 0.9 * budget
+        with self._lock:
+            stats = self._stats.setdefault(
+                task, {"requests": 0, "truncated": 0, "output_tokens": 0}
+            )
+            stats["requests"] += 1
+            stats["output_tokens"] += tokens
+            current = self._tokens_per_item.get(task)
+            if truncated:
+                stats["truncated"] += 1
+                # The response was cut off, so the real length is unknown
+                self._tokens_per_item[task] = max(observed, (current or observed) * self.headroom)
+            elif current is None:
+                self._tokens_per_item[task] = observed
+            else:
+                self._tokens_per_item[task] = (
+                    1 - self.smoothing
+                ) * current + self.smoothing * observed
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current estimates and truncation counts per task, for run metrics"""
+        with self._lock:
+            return {
+                task: {**stats, "tokens_per_item": round(self._tokens_per_item.get(task, 0), 1)}
+                for task, stats in self._stats.items()
+            }
+
+
+def create_output_budget(generation_config: Dict[str, Any]) -> Optional[OutputBudget]:
+    """Build an output budget from the `output_budget` section of the generation config"""
+    budget_config = generation_config.get("output_budget") or {}
+    if not budget_config.get("enabled", False):
+        return None
+    return OutputBudget(
+        max_tokens=generation_config.get("max_tokens", 4096),
+        min_tokens=budget_config.get("min_tokens", 256),
+        base_tokens=budget_config.get("base_tokens", 64),
+        headroom=budget_config.get("headroom", 1.5),
+    )
@@ -14,7 +14,15 @@ from synthetic_data_kit.utils.config import (
     get_prompt,
     merge_configs,
 )
-from synthetic_data_kit.utils.text import split_into_chunks, extract_json_from_text
+from synthetic_data_kit.utils.text import (
+    split_into_chunks,
+    split_oversized_chunks,
+    select_chunks,
+    extract_json_from_text,
+    estimate_tokens,
+    estimate_message_tokens,
+    truncate_to_tokens,
+)
 from synthetic_data_kit.utils.llm_processing import (
     parse_qa_pairs,
     parse_ratings,
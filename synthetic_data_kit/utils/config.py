@@ -4,10 +4,11 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 # Config Utilities
+import copy
 import yaml
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 
 # Default config location relative to the package (original)
 ORIGINAL_CONFIG_PATH = os.path.abspath(
@@ -23,21 +24,35 @@ PACKAGE_CONFIG_PATH = os.path.abspath(
 # Use internal package path as default
 DEFAULT_CONFIG_PATH = PACKAGE_CONFIG_PATH
 
-def load_config(config_path: Optional[str] = None) -> Dict[str, Any]:
-    """Load YAML configuration file"""
+# Parsed config files by (path, modification time), so repeated loads skip the YAML parse
+_CONFIG_CACHE: Dict[tuple, Dict[str, Any]] = {}
+
+def resolve_config_path(config_path: Optional[str] = None) -> str:
+    """Return the config file load_config would read for `config_path`"""
     if config_path is None:
         # Try each path in order until one exists
         for path in [PACKAGE_CONFIG_PATH, ORIGINAL_CONFIG_PATH]:
             if os.path.exists(path):
-                config_path = path
-                break
-        else:
-            # If none exists, use the default (which will likely fail, but with a clear error)
-            config_path = DEFAULT_CONFIG_PATH
+                return path
+        # If none exists, use the default (which will likely fail, but with a clear error)
+        return DEFAULT_CONFIG_PATH
+    return str(config_path)
+
+def load_config(config_path: Optional[str] = None) -> Dict[str, Any]:
+    """Load YAML configuration file
+    
+    Each call returns a fresh copy that the caller may modify; the file
+    itself is only parsed again when it changes.
+    """
+    config_path = resolve_config_path(config_path)
     
     if not os.path.exists(config_path):
         raise FileNotFoundError(f"Configuration file not found at {config_path}")
     
+    cache_key = (os.path.abspath(config_path), os.stat(config_path).st_mtime_ns)
+    if cache_key in _CONFIG_CACHE:
+        return copy.deepcopy(_CONFIG_CACHE[cache_key])
+    
     print(f"Loading config from: {config_path}")
     with open(config_path, 'r') as f:
         config = yaml.safe_load(f)
@@ -48,6 +63,7 @@ def load_config(config_path: Optional[str] = None) -> Dict[str, Any]:
     else:
         print("Config does not have LLM provider set")
     
+    _CONFIG_CACHE[cache_key] = copy.deepcopy(config)
     return config
 
 def get_path_config(config: Dict[str, Any], path_type: str, file_type: Optional[str] = None) -> str:
@@ -95,7 +111,8 @@ def get_vllm_config(config: Dict[str, Any]) -> Dict[str, Any]:
         'port': 8000,
         'model': 'meta-llama/Llama-3.3-70B-Instruct',
         'max_retries': 3,
-        'retry_delay': 1.0
+        'retry_delay': 1.0,
+        'max_concurrent_requests': 32
     })
 
 def get_openai_config(config: Dict[str, Any]) -> Dict[str, Any]:
@@ -141,6 +158,31 @@ def get_prompt(config: Dict[str, Any], prompt_name: str) -> str:
         raise ValueError(f"Prompt '{prompt_name}' not found in configuration")
     return prompts[prompt_name]
 
+def format_text_prompt(template: str, text: str, layout: str = "inline", **fields) -> List[Dict[str, str]]:
+    """Build the messages for a prompt template with a `{text}` placeholder
+    
+    "inline" formats everything into a single system message. "split" sends
+    all instructions, i.e. the template without `{text}`, as the system
+    message and the text as a trailing user message. The leading message is
+    then identical for every chunk of a document wherever the placeholder
+    sits, so it can be served from vLLM's prefix cache or a provider's
+    prompt cache.
+    """
+    if layout == "inline":
+        return [{"role": "system", "content": template.format(text=text, **fields)}]
+    if layout != "split":
+        raise ValueError(f"Unknown prompt_layout '{layout}', expected 'inline' or 'split'")
+    
+    head, _, tail = template.partition("{text}")
+    instructions = head.format(**fields).rstrip()
+    tail = tail.format(**fields).strip()
+    if tail:
+        instructions = f"{instructions}\n\n{tail}"
+    return [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": text}
+    ]
+
 def merge_configs(base_config: Dict[str, Any], override_config: Dict[str, Any]) -> Dict[str, Any]:
     """Merge two configuration dictionaries"""
     result = base_config.copy()
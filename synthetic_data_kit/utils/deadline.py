@@ -0,0 +1,33 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Process-wide deadline for a command (set with the global --deadline option)
+import time
+from typing import Optional
+
+_deadline: Optional[float] = None
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when work would start after the command's deadline"""
+
+
+def set_deadline(seconds: Optional[float]):
+    """Set the deadline to `seconds` from now, or clear it with None"""
+    global _deadline
+    _deadline = time.monotonic() + seconds if seconds is not None else None
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds left before the deadline, or None if no deadline is set"""
+    if _deadline is None:
+        return None
+    return _deadline - time.monotonic()
+
+
+def deadline_exceeded() -> bool:
+    """Check whether a deadline is set and has passed"""
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
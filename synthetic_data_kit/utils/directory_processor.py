@@ -11,6 +11,8 @@ from typing import List, Dict, Any, Optional, Callable
 from rich.console import Console
 from rich.progress import Progress, BarColumn, TextColumn, TimeElapsedColumn
 
+from synthetic_data_kit.utils.deadline import deadline_exceeded
+
 console = Console()
 
 # Supported file extensions for each command
@@ -220,6 +222,7 @@ def process_directory_create(
     provider: Optional[str] = None,
     chunk_size: Optional[int] = None,
     chunk_overlap: Optional[int] = None,
+    summary_strategy: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Process all supported files in directory for content creation
     
@@ -233,6 +236,7 @@ def process_directory_create(
         num_pairs: Target number of QA pairs or examples
         verbose: Show detailed progress
         provider: LLM provider to use
+        summary_strategy: Override generation.summary.strategy (e.g. "extractive")
     
     Returns:
         Dictionary with processing results
@@ -290,6 +294,12 @@ def process_directory_create(
         for file_path in supported_files:
             filename = os.path.basename(file_path)
             
+            # Leave the remaining files for a later run once the deadline passes
+            if deadline_exceeded():
+                results["skipped"] = len(supported_files) - results["successful"] - results["failed"]
+                console.print(f"Deadline reached: skipping {results['skipped']} remaining files", style="yellow")
+                break
+            
             try:
                 # Process individual file
                 output_path = process_file(
@@ -303,7 +313,8 @@ def process_directory_create(
                     verbose,
                     provider=provider,
                     chunk_size=chunk_size,
-                    chunk_overlap=chunk_overlap
+                    chunk_overlap=chunk_overlap,
+                    summary_strategy=summary_strategy
                 )
                 
                 # Record success
@@ -343,6 +354,8 @@ def process_directory_create(
     console.print(f"Total files: {results['total_files']}")
     console.print(f"Successful: {results['successful']}", style="green")
     console.print(f"Failed: {results['failed']}", style="red" if results['failed'] > 0 else "green")
+    if results.get("skipped"):
+        console.print(f"Skipped (deadline): {results['skipped']}", style="yellow")
     console.print("="*50, style="bold")
     
     return results
@@ -421,6 +434,12 @@ def process_directory_curate(
         for file_path in supported_files:
             filename = os.path.basename(file_path)
             
+            # Leave the remaining files for a later run once the deadline passes
+            if deadline_exceeded():
+                results["skipped"] = len(supported_files) - results["successful"] - results["failed"]
+                console.print(f"Deadline reached: skipping {results['skipped']} remaining files", style="yellow")
+                break
+            
             try:
                 # Generate output path for this file
                 base_name = os.path.splitext(filename)[0]
@@ -475,6 +494,8 @@ def process_directory_curate(
     console.print(f"Total files: {results['total_files']}")
     console.print(f"Successful: {results['successful']}", style="green")
     console.print(f"Failed: {results['failed']}", style="red" if results['failed'] > 0 else "green")
+    if results.get("skipped"):
+        console.print(f"Skipped (deadline): {results['skipped']}", style="yellow")
     console.print("="*50, style="bold")
     
     return results
@@ -0,0 +1,110 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# Extractive summaries computed locally (no LLM call)
+import re
+from typing import List
+
+# NumPy does the TF-IDF scoring (a declared dependency; guarded for partial installs)
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(\[])|\n{2,}')
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Frequent words that say nothing about the topic
+_STOPWORDS = frozenset(
+    """
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had has
+have having he her here hers herself him himself his how i if in into is it its itself just me more
+most my myself no nor not now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there these they this those
+through to too under until up very was we were what when where which while who whom why will with
+would you your yours yourself yourselves
+""".split()
+)
+
+
+def content_words(text: str) -> List[str]:
+    """Lowercased words of the text, without stopwords and single letters"""
+    return [
+        word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS and len(word) > 1
+    ]
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences at end punctuation or blank lines"""
+    return [
+        sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence and sentence.strip()
+    ]
+
+
+def extractive_summary(
+    text: str, max_sentences: int = 5, max_chars: int = 600, min_words: int = 5
+) -> str:
+    """Pick the sentences most central to the document, in document order
+
+    Sentences are TF-IDF vectors (sentence frequency as document frequency),
+    scored by cosine similarity to the centroid of all sentences. The
+    vectors are kept sparse as (sentence, term) index arrays, so long
+    documents take milliseconds and little memory. Sentences shorter than
+    `min_words` are skipped.
+
+    Raises:
+        ImportError: If NumPy is not installed
+    """
+    if not NUMPY_AVAILABLE:
+        raise ImportError(
+            "The extractive summary requires numpy. Install it with 'pip install numpy'."
+        )
+
+    sentences = [s for s in split_sentences(text) if len(s.split()) >= min_words]
+    if not sentences:
+        return text.strip()[:max_chars]
+
+    # Sparse term counts as parallel (sentence, term) index arrays
+    vocabulary = {}
+    rows, cols = [], []
+    for row, sentence in enumerate(sentences):
+        for word in content_words(sentence):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word, len(vocabulary)))
+    if not rows:
+        return " ".join(sentences[:max_sentences])[:max_chars]
+
+    num_sentences, num_terms = len(sentences), len(vocabulary)
+    pairs, counts = np.unique(np.array(rows) * num_terms + np.array(cols), return_counts=True)
+    rows, cols = pairs // num_terms, pairs % num_terms
+
+    # TF-IDF weights, with smoothed idf and per-sentence L2 normalization
+    lengths = np.bincount(rows, weights=counts, minlength=num_sentences)
+    df = np.bincount(cols, minlength=num_terms)
+    idf = np.log((1 + num_sentences) / (1 + df)) + 1
+    weights = counts / lengths[rows] * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=num_sentences))
+    weights = weights / norms[rows]
+
+    # Centrality: similarity to the mean sentence vector
+    centroid = np.bincount(cols, weights=weights, minlength=num_terms) / num_sentences
+    scores = np.bincount(rows, weights=weights * centroid[cols], minlength=num_sentences)
+
+    chosen = []
+    seen = set()
+    length = 0
+    for index in np.argsort(-scores, kind="stable"):
+        if len(chosen) >= max_sentences:
+            break
+        # Repeated sentences (e.g. page headers) score alike; keep one
+        if sentences[index] in seen or (chosen and length + len(sentences[index]) + 1 > max_chars):
+            continue
+        chosen.append(index)
+        seen.add(sentences[index])
+        length += len(sentences[index]) + 1
+    return " ".join(sentences[i] for i in sorted(chosen))[:max_chars]
@@ -9,6 +9,84 @@ import json
 import os
 from typing import List, Dict, Any, Optional
 
+def parse_structured_output(text: str, key: str) -> Optional[List[Any]]:
+    """Read the records from a schema-constrained response such as {"qa_pairs": [...]}
+    
+    Returns None if the text is not in that shape, so callers can fall back
+    to the lenient parsers for providers without structured output.
+    """
+    try:
+        parsed = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(parsed, dict) and isinstance(parsed.get(key), list):
+        return parsed[key]
+    return None
+
+class IncrementalJSONArrayParser:
+    """Pull complete objects out of a JSON array while the response is still streaming
+    
+    Feed text fragments in order; each call returns the objects of the first
+    array in the text that closed during that fragment. This works for a bare
+    array and for structured output such as {"qa_pairs": [...]}. Text before
+    the JSON (e.g. "Here are the pairs:") is skipped. Objects that still do
+    not parse after removing trailing commas are counted in `skipped`.
+    """
+    
+    def __init__(self):
+        self.skipped = 0
+        self._depth = 0
+        self._array_depth = None
+        self._in_string = False
+        self._escaped = False
+        self._current = None
+        self._finished = False
+    
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        items = []
+        for char in text:
+            if self._finished:
+                break
+            if self._current is not None:
+                self._current.append(char)
+            
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # Quotes in prose before the JSON starts are not strings
+                self._in_string = self._depth > 0
+            elif char in '[{':
+                if char == '[' and self._array_depth is None:
+                    self._array_depth = self._depth + 1
+                elif char == '{' and self._depth == self._array_depth:
+                    self._current = [char]
+                self._depth += 1
+            elif char in ']}' and self._depth > 0:
+                self._depth -= 1
+                if self._current is not None and self._depth == self._array_depth:
+                    item = self._parse_item("".join(self._current))
+                    if item is not None:
+                        items.append(item)
+                    self._current = None
+                elif self._array_depth is not None and self._depth < self._array_depth:
+                    self._finished = True
+        return items
+    
+    def _parse_item(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                return json.loads(re.sub(r',(\s*\}|\s*\])', r'\1', text))
+            except json.JSONDecodeError:
+                self.skipped += 1
+                return None
+
 def parse_qa_pairs(text: str) -> List[Dict[str, str]]:
     """Parse QA pairs from LLM output with enhanced error handling"""
     verbose = os.environ.get('SDK_VERBOSE', 'false').lower() == 'true'
@@ -16,6 +94,11 @@ def parse_qa_pairs(text: str) -> List[Dict[str, str]]:
     if verbose:
         print(f"Parsing response of length {len(text)}")
     
+    # Structured output needs no repair
+    structured = parse_structured_output(text, "qa_pairs")
+    if structured is not None:
+        return structured
+    
     try:
         # Try direct JSON parsing
         if '[' in text and ']' in text:
@@ -87,6 +170,11 @@ def parse_ratings(text: str, original_items: List[Dict[str, str]] = None) -> Lis
         print(f"Parsing ratings response of length {len(text)}")
         print(f"Raw response: {repr(text[:500])}")
     
+    # Structured output needs no repair
+    structured = parse_structured_output(text, "ratings")
+    if structured is not None:
+        return structured
+    
     # The multiple passes are to for edge cases that emerge when using 8B or smaller models for generating synthetic data. This is to make a comprehensive parser for faster protoyping.
     # With 70B or bigger model, `json.load()` should "just work"
     try:
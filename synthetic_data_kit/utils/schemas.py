@@ -0,0 +1,48 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+# JSON schemas for structured (schema-constrained) LLM output
+from typing import Dict, Any
+
+
+def _record_schema(**properties: str) -> Dict[str, Any]:
+    """Schema for an object whose properties are all required"""
+    return {
+        "type": "object",
+        "properties": {name: {"type": kind} for name, kind in properties.items()},
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def array_output_schema(name: str, item_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Named schema for a response holding a list of records
+
+    The list is wrapped in an object, e.g. {"qa_pairs": [...]}, because
+    OpenAI-compatible `response_format` schemas must have an object at the
+    root. `parse_structured_output` unwraps it again.
+    """
+    return {
+        "name": name,
+        "schema": {
+            "type": "object",
+            "properties": {name: {"type": "array", "items": item_schema}},
+            "required": [name],
+            "additionalProperties": False,
+        },
+    }
+
+
+QA_PAIRS_SCHEMA = array_output_schema(
+    "qa_pairs", _record_schema(question="string", answer="string")
+)
+
+RATINGS_SCHEMA = array_output_schema(
+    "ratings", _record_schema(question="string", answer="string", rating="number")
+)
+
+COT_EXAMPLES_SCHEMA = array_output_schema(
+    "examples", _record_schema(question="string", reasoning="string", answer="string")
+)
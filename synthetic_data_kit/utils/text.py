@@ -6,7 +6,9 @@
 # Text processing utilities
 import re
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
+
+from synthetic_data_kit.utils.extractive import content_words
 
 def split_into_chunks(text: str, chunk_size: int = 4000, overlap: int = 200) -> List[str]:
     """Split text into chunks with optional overlap"""
@@ -34,6 +36,72 @@ def split_into_chunks(text: str, chunk_size: int = 4000, overlap: int = 200) ->
     
     return chunks
 
+def select_chunks(chunks: List[str], count: int, exclude: Iterable[int] = ()) -> List[int]:
+    """Pick `count` chunks spread over the whole document and return their indices in order
+    
+    The chunks not in `exclude` are divided into `count` consecutive strata,
+    and from each the chunk with the most distinct content words is taken, so
+    a small target covers the whole document rather than its first pages and
+    skips near-empty chunks (title pages, separators).
+    """
+    excluded = set(exclude)
+    candidates = [i for i in range(len(chunks)) if i not in excluded]
+    if count >= len(candidates):
+        return candidates
+    selected = []
+    for stratum in range(max(0, count)):
+        start = stratum * len(candidates) // count
+        end = (stratum + 1) * len(candidates) // count
+        # max() keeps the earliest chunk on ties
+        selected.append(max(candidates[start:end], key=lambda i: len(set(content_words(chunks[i])))))
+    return selected
+
+# Rough characters per token used by every token estimate in the kit
+CHARS_PER_TOKEN = 4
+
+def split_oversized_chunks(chunks: List[str], max_chars: int) -> List[str]:
+    """Split any chunk longer than max_chars, preferring sentence then word boundaries
+    
+    `split_into_chunks` only breaks between paragraphs, so a long paragraph
+    (common in PDF extractions) can end up far larger than `chunk_size`.
+    """
+    max_chars = max(1, max_chars)
+    fitted = []
+    for chunk in chunks:
+        while len(chunk) > max_chars:
+            cut = chunk.rfind('. ', 0, max_chars)
+            if cut > max_chars // 2:
+                cut += 1
+            else:
+                cut = chunk.rfind(' ', 0, max_chars)
+                if cut <= max_chars // 2:
+                    cut = max_chars
+            fitted.append(chunk[:cut].strip())
+            chunk = chunk[cut:].strip()
+        if chunk:
+            fitted.append(chunk)
+    return fitted
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in text (about 4 characters per token)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the start of text up to about max_tokens, cut at a paragraph or word boundary"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n\n", 0, max_chars)
+    if cut <= max_chars // 2:
+        cut = text.rfind(" ", 0, max_chars)
+    if cut <= max_chars // 2:
+        cut = max_chars
+    return text[:cut].rstrip()
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Roughly estimate the prompt tokens of a chat message list, including per-message overhead"""
+    return sum(estimate_tokens(message.get("content") or "") + 4 for message in messages) + 2
+
 def extract_json_from_text(text: str) -> Dict[str, Any]:
     """Extract JSON from text that might contain markdown or other content"""
     text = text.strip()
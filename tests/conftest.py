@@ -81,6 +81,14 @@ def sample_qa_pairs_file():
 class MockLLMClientFactory:
     """Factory for creating mock LLM clients with different configurations."""
 
+    @staticmethod
+    def create_client():
+        """Create a bare mock client whose model context length is unknown (no pre-flight fitting)."""
+        mock_client = MagicMock()
+        mock_client.text_token_limit.return_value = None
+        mock_client.early_stop = {"cancelled_in_flight": 0, "not_sent": 0}
+        return mock_client
+
     @staticmethod
     def create_qa_client(qa_pairs=None):
         """Create a mock client for QA generation."""
@@ -96,9 +104,12 @@ class MockLLMClientFactory:
                 },
             ]
 
-        mock_client = MagicMock()
+        mock_client = MockLLMClientFactory.create_client()
         mock_client.chat_completion.return_value = json.dumps(qa_pairs)
         mock_client.batch_completion.return_value = [json.dumps([pair]) for pair in qa_pairs]
+        mock_client.iter_completion.side_effect = lambda *args, **kwargs: (
+            (index, json.dumps([pair])) for index, pair in enumerate(qa_pairs)
+        )
         return mock_client
 
     @staticmethod
@@ -112,17 +123,20 @@ class MockLLMClientFactory:
                 }
             ]
 
-        mock_client = MagicMock()
+        mock_client = MockLLMClientFactory.create_client()
         mock_client.chat_completion.return_value = json.dumps(cot_examples)
         mock_client.batch_completion.return_value = [
             json.dumps([example]) for example in cot_examples
         ]
+        mock_client.iter_completion.side_effect = lambda *args, **kwargs: (
+            (index, json.dumps([example])) for index, example in enumerate(cot_examples)
+        )
         return mock_client
 
     @staticmethod
     def create_summary_client(summary_text="This is a test summary."):
         """Create a mock client for summary generation."""
-        mock_client = MagicMock()
+        mock_client = MockLLMClientFactory.create_client()
         mock_client.chat_completion.return_value = summary_text
         return mock_client
 
@@ -132,7 +146,7 @@ class MockLLMClientFactory:
         if ratings is None:
             ratings = [8, 7, 9]  # Default ratings
 
-        mock_client = MagicMock()
+        mock_client = MockLLMClientFactory.create_client()
         mock_client.chat_completion.return_value = json.dumps(ratings)
         mock_client.batch_completion.return_value = [json.dumps([rating]) for rating in ratings]
         return mock_client
@@ -117,6 +117,37 @@ def test_create_command(patch_config, test_env):
             os.unlink(input_path)
 
 
+@pytest.mark.functional
+def test_create_command_replaying_cassette_skips_server_check(config_factory, tmp_path):
+    """Test that create replays a cassette without a running vLLM server."""
+    runner = CliRunner()
+    config = config_factory.create_vllm_config()
+    config["llm"]["cassette"] = {"path": str(tmp_path / "cassette.jsonl"), "mode": "replay"}
+    input_path = tmp_path / "doc.txt"
+    input_path.write_text("Sample text content for testing.")
+
+    with patch("synthetic_data_kit.cli.load_config", return_value=config), patch(
+        "synthetic_data_kit.cli._vllm_server_available", return_value=False
+    ) as mock_check, patch("synthetic_data_kit.core.create.process_file") as mock_process:
+        mock_process.return_value = str(tmp_path / "doc_qa_pairs.json")
+
+        result = runner.invoke(app, ["create", str(input_path), "--type", "qa"])
+
+        assert result.exit_code == 0
+        assert "not available" not in result.stdout
+        mock_check.assert_not_called()
+        mock_process.assert_called_once()
+
+    # Without the cassette the missing server is still reported
+    config["llm"].pop("cassette")
+    with patch("synthetic_data_kit.cli.load_config", return_value=config), patch(
+        "synthetic_data_kit.cli._vllm_server_available", return_value=False
+    ):
+        result = runner.invoke(app, ["create", str(input_path), "--type", "qa"])
+
+        assert "not available" in result.stdout
+
+
 @pytest.mark.functional
 def test_curate_command(patch_config, test_env):
     """Test the curate command with a JSON file."""
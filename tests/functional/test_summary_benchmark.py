@@ -0,0 +1,62 @@
+"""Benchmark of document summary strategies against a stand-in server.
+
+Run with ``pytest tests/functional/test_summary_benchmark.py -s`` to see the
+wall time and request count of each strategy.
+"""
+
+import time
+
+import pytest
+
+from synthetic_data_kit.generators.qa_generator import QAGenerator
+from synthetic_data_kit.models.llm_client import LLMClient
+from tests.utils import StandInLLMServer
+
+
+def _run_strategy(strategy: str, document: str):
+    """Summarize the document and return (seconds, requests, summary)."""
+    with StandInLLMServer(
+        responder=lambda payload: "A summary of part of the document.",
+        prefill_seconds_per_char=2e-5,
+    ) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        generator = QAGenerator(client)
+        generator.generation_config["summary"] = {
+            "strategy": strategy,
+            "chunk_size": 8000,
+            "fan_in": 8,
+        }
+
+        start = time.monotonic()
+        summary = generator.generate_summary(document)
+        elapsed = time.monotonic() - start
+        client.close()
+        return elapsed, len(server.requests), summary
+
+
+@pytest.mark.functional
+def test_extractive_summary_is_faster_than_llm_summaries(test_env):
+    """Compare LLM summaries (single request and map-reduce) with the extractive summary."""
+    document = "\n\n".join(
+        f"Section {p}. Synthetic data generation turns documents into training examples. "
+        f"Paragraph {p} describes step {p} of the pipeline in some detail. "
+        + "Each step is checked so that generated data stays faithful to the source. "
+        * 4
+        for p in range(120)
+    )
+
+    results = {
+        strategy: _run_strategy(strategy, document)
+        for strategy in ("single", "map_reduce", "extractive")
+    }
+
+    print(f"\ndocument: {len(document)} chars")
+    print("strategy     seconds  requests  summary chars")
+    for strategy, (elapsed, requests, summary) in results.items():
+        print(f"{strategy:<11} {elapsed:>8.3f}  {requests:>8}  {len(summary):>13}")
+
+    extractive_time, extractive_requests, extractive_text = results["extractive"]
+    assert extractive_requests == 0
+    assert extractive_text
+    assert extractive_time < results["single"][0]
+    assert extractive_time < results["map_reduce"][0]
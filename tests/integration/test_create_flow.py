@@ -1,5 +1,7 @@
 """Integration tests for the create workflow."""
 
+import copy
+import json
 import os
 import tempfile
 from unittest.mock import MagicMock, patch
@@ -7,6 +9,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from synthetic_data_kit.core import create
+from synthetic_data_kit.models.llm_client import metrics_since
 
 
 @pytest.mark.integration
@@ -21,10 +24,10 @@ def test_process_file(patch_config, test_env):
 
     try:
         # Mock LLMClient
-        with patch("synthetic_data_kit.core.create.LLMClient") as mock_llm_client_class:
+        with patch("synthetic_data_kit.core.create.get_llm_client") as mock_get_llm_client:
             # Setup mock LLM client
             mock_llm_client = MagicMock()
-            mock_llm_client_class.return_value = mock_llm_client
+            mock_get_llm_client.return_value = mock_llm_client
 
             # Mock QAGenerator with simplified behavior
             with patch("synthetic_data_kit.core.create.QAGenerator") as mock_qa_gen_class:
@@ -63,7 +66,7 @@ def test_process_file(patch_config, test_env):
                         assert output_path is not None
 
                         # Verify the LLM client was created
-                        mock_llm_client_class.assert_called_once()
+                        mock_get_llm_client.assert_called_once()
 
                         # Verify QA generator was created and used
                         mock_qa_gen_class.assert_called_once()
@@ -82,6 +85,42 @@ def test_process_file(patch_config, test_env):
             pass
 
 
+@pytest.mark.integration
+def test_process_file_reports_llm_metrics_per_file(patch_config, test_env, tmp_path):
+    """Test that each output holds only its own file's share of the shared client's counters."""
+    counters = {"hedging": {"requests": 0, "hedges": 0, "hedge_wins": 0, "percentile": 95.0, "max_fraction": 0.05}}
+
+    def get_metrics(since=None):
+        snapshot = copy.deepcopy(counters)
+        return snapshot if since is None else metrics_since(since, snapshot)
+
+    def process_document(document_text, **kwargs):
+        counters["hedging"]["requests"] += 3
+        counters["hedging"]["hedges"] += 1
+        return {"summary": "Summary", "qa_pairs": []}
+
+    mock_llm_client = MagicMock()
+    mock_llm_client.get_metrics.side_effect = get_metrics
+    mock_generator = MagicMock()
+    mock_generator.generation_config = {}
+    mock_generator.process_document.side_effect = process_document
+
+    with patch("synthetic_data_kit.core.create.get_llm_client", return_value=mock_llm_client), \
+            patch("synthetic_data_kit.core.create.QAGenerator", return_value=mock_generator):
+        outputs = []
+        for name in ("first", "second"):
+            input_path = tmp_path / f"{name}.txt"
+            input_path.write_text(f"Sample text for the {name} file.")
+            outputs.append(create.process_file(str(input_path), str(tmp_path / "out"), num_pairs=2))
+
+    for output_path in outputs:
+        with open(output_path) as f:
+            hedging = json.load(f)["metrics"]["llm"]["hedging"]
+        assert hedging["requests"] == 3
+        assert hedging["hedges"] == 1
+        assert hedging["percentile"] == 95.0
+
+
 @pytest.mark.integration
 def test_process_directory(patch_config, test_env):
     """Test processing a directory to generate QA pairs."""
@@ -100,10 +139,10 @@ def test_process_directory(patch_config, test_env):
                 file_paths.append(f.name)
 
         # Mock LLMClient
-        with patch("synthetic_data_kit.core.create.LLMClient") as mock_llm_client_class:
+        with patch("synthetic_data_kit.core.create.get_llm_client") as mock_get_llm_client:
             # Setup mock LLM client
             mock_llm_client = MagicMock()
-            mock_llm_client_class.return_value = mock_llm_client
+            mock_get_llm_client.return_value = mock_llm_client
 
             # Mock QAGenerator
             with patch("synthetic_data_kit.core.create.QAGenerator") as mock_qa_gen_class:
@@ -227,4 +227,33 @@ def test_directory_with_subdirectories():
         os.unlink(os.path.join(sub_dir, "sub.txt"))
         os.rmdir(sub_dir)
         os.unlink(main_file)
-        os.rmdir(temp_dir)
\ No newline at end of file
+        os.rmdir(temp_dir)
+
+
+@pytest.mark.integration
+def test_directory_create_stops_at_deadline(patch_config, tmp_path):
+    """Test that files left when the deadline passes are skipped, not failed."""
+    from synthetic_data_kit.utils.deadline import set_deadline
+    from synthetic_data_kit.utils.directory_processor import process_directory_create
+
+    for i in range(3):
+        (tmp_path / f"doc{i}.txt").write_text(f"Document {i}")
+
+    calls = []
+
+    def process_then_expire(file_path, *args, **kwargs):
+        # The deadline passes while the first file is being processed
+        calls.append(file_path)
+        set_deadline(-1.0)
+        return file_path + ".json"
+
+    try:
+        with patch("synthetic_data_kit.core.create.process_file", side_effect=process_then_expire):
+            results = process_directory_create(directory=str(tmp_path), output_dir=str(tmp_path / "out"))
+    finally:
+        set_deadline(None)
+
+    assert len(calls) == 1
+    assert results["successful"] == 1
+    assert results["failed"] == 0
+    assert results["skipped"] == 2
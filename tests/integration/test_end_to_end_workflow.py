@@ -61,7 +61,7 @@ def test_complete_workflow(patch_config, test_env):
                 dst.write(src.read())
 
         # 2. Create step - mock the LLM client
-        with patch("synthetic_data_kit.core.create.LLMClient") as mock_llm_client_class:
+        with patch("synthetic_data_kit.core.create.get_llm_client") as mock_get_llm_client:
             # Setup mock LLM client with config
             mock_llm_client = MagicMock()
             mock_llm_client.config = {
@@ -69,7 +69,7 @@ def test_complete_workflow(patch_config, test_env):
                     "qa_generation": "Generate question-answer pairs based on this text: {text}",
                 }
             }
-            mock_llm_client_class.return_value = mock_llm_client
+            mock_get_llm_client.return_value = mock_llm_client
 
             # Mock QA Generator
             with patch("synthetic_data_kit.core.create.QAGenerator") as mock_qa_gen_class:
@@ -0,0 +1,139 @@
+"""Unit tests for recording and replaying LLM traffic."""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from synthetic_data_kit.models.cassette import Cassette, CassetteMissError, create_cassette
+from synthetic_data_kit.models.llm_client import LLMClient
+from synthetic_data_kit.utils.config import load_config
+from tests.utils import StandInLLMServer
+
+
+def _request(content, temperature=0.1):
+    return {
+        "model": "test-model",
+        "messages": [{"role": "user", "content": content}],
+        "temperature": temperature,
+        "max_tokens": 100,
+        "top_p": 0.95,
+    }
+
+
+@pytest.mark.unit
+def test_cassette_replays_recordings_in_order(tmp_path):
+    """Test that repeated requests get their recordings back in order."""
+    path = str(tmp_path / "run.jsonl")
+    recorder = Cassette(path, "record")
+    recorder.record(_request("hello"), "first", 0.5)
+    recorder.record(_request("hello"), "second", 1.5)
+
+    player = Cassette(path, "replay", simulate_latency="recorded", latency_scale=0.1)
+    assert player.play(_request("hello")) == ("first", pytest.approx(0.05))
+    assert player.play(_request("hello")) == ("second", pytest.approx(0.15))
+    assert player.play(_request("hello"))[0] == "first"
+
+    # Different sampling parameters are a different request
+    with pytest.raises(CassetteMissError):
+        player.play(_request("hello", temperature=0.7))
+    assert player.snapshot()["misses"] == 1
+
+    sampled = Cassette(path, "replay", simulate_latency="sampled", seed=0)
+    assert sampled.play(_request("hello"))[1] in (0.5, 1.5)
+
+
+@pytest.mark.unit
+def test_create_cassette_from_config(tmp_path):
+    """Test that cassettes are opt-in and validate their settings."""
+    assert create_cassette(None) is None
+    assert create_cassette({"mode": None}) is None
+
+    with pytest.raises(ValueError):
+        create_cassette({"mode": "record"})
+    with pytest.raises(ValueError):
+        create_cassette({"mode": "rewind", "path": str(tmp_path / "run.jsonl")})
+    with pytest.raises(FileNotFoundError):
+        create_cassette({"mode": "replay", "path": str(tmp_path / "missing.jsonl")})
+
+
+@pytest.mark.unit
+def test_llm_client_records_and_replays_without_server(test_env, tmp_path):
+    """Test a full record run against a server, then a replay with the server gone."""
+    path = str(tmp_path / "run.jsonl")
+    config = load_config()
+    message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(4)]
+
+    with StandInLLMServer(delay=0.1) as server:
+        config["llm"]["cassette"] = {"mode": "record", "path": path}
+        with patch("synthetic_data_kit.models.llm_client.load_config", return_value=config):
+            recorder = LLMClient(provider="vllm", api_base=server.api_base)
+        recorded = recorder.batch_completion(message_batches, batch_size=4)
+        summary = recorder.chat_completion([{"role": "user", "content": "summary"}])
+        recorder.close()
+
+    config["llm"]["cassette"] = {"mode": "replay", "path": path, "simulate_latency": "recorded"}
+    with patch("synthetic_data_kit.models.llm_client.load_config", return_value=config):
+        player = LLMClient(provider="vllm", api_base=server.api_base)
+
+    start = time.monotonic()
+    assert player.batch_completion(message_batches, batch_size=4) == recorded
+    elapsed = time.monotonic() - start
+    assert player.chat_completion([{"role": "user", "content": "summary"}]) == summary
+
+    # Recorded latency is re-simulated, with the batch still running concurrently
+    assert 0.1 <= elapsed < 0.4
+    assert player.get_metrics()["cassette"]["replayed"] == 5
+
+
+@pytest.mark.unit
+def test_llm_client_replays_budget_sized_requests(test_env, tmp_path):
+    """Test that replays and cache hits do not depend on the order responses arrived in."""
+    path = str(tmp_path / "run.jsonl")
+    config = load_config()
+    config["generation"]["output_budget"] = {"enabled": True}
+    config["llm"]["cache"] = {"enabled": True, "path": str(tmp_path / "cache.db")}
+    message_batches = [
+        [{"role": "user", "content": f"prompt {i}" + " word" * 40 * i}] for i in range(4)
+    ]
+
+    # Longer prompts get longer answers and finish first, feeding the budget in reverse order
+    with StandInLLMServer(
+        delay=lambda payload: 0.4 - len(payload["messages"][0]["content"]) / 2000
+    ) as server:
+        config["llm"]["cassette"] = {"mode": "record", "path": path}
+        with patch("synthetic_data_kit.models.llm_client.load_config", return_value=config):
+            recorder = LLMClient(provider="vllm", api_base=server.api_base)
+        recorded = recorder.batch_completion(
+            message_batches, batch_size=4, task="summary", cache=True
+        )
+        summary = recorder.chat_completion(
+            [{"role": "user", "content": "summary"}], task="summary", cache=True
+        )
+        recorder.close()
+
+        # A re-run with a different budget is served from the response cache
+        config["llm"]["cassette"] = {"mode": None}
+        with patch("synthetic_data_kit.models.llm_client.load_config", return_value=config):
+            rerun = LLMClient(provider="vllm", api_base=server.api_base)
+        rerun.output_budget.record("summary", 1, "x" * 4000, 2000)
+        sent = len(server.requests)
+        assert (
+            rerun.batch_completion(message_batches, batch_size=4, task="summary", cache=True)
+            == recorded
+        )
+        assert len(server.requests) == sent
+        rerun.close()
+
+    config["llm"]["cache"] = {"enabled": False}
+    config["llm"]["cassette"] = {"mode": "replay", "path": path}
+    with patch("synthetic_data_kit.models.llm_client.load_config", return_value=config):
+        player = LLMClient(provider="vllm", api_base=server.api_base)
+    # The budget differs from the recording run, but the recordings still match
+    player.output_budget.record("summary", 1, "x" * 4000, 2000)
+
+    assert (
+        player.chat_completion([{"role": "user", "content": "summary"}], task="summary") == summary
+    )
+    assert player.batch_completion(message_batches, batch_size=4, task="summary") == recorded
+    assert player.get_metrics()["cassette"]["misses"] == 0
@@ -0,0 +1,48 @@
+"""Unit tests for the shared LLM client registry."""
+
+import pytest
+
+from synthetic_data_kit.models.client_registry import close_llm_clients, get_llm_client
+from tests.utils import StandInLLMServer
+
+
+@pytest.mark.unit
+def test_get_llm_client_reuses_clients(test_env):
+    """Test that identical settings share a client and health checks are cached."""
+    try:
+        with StandInLLMServer() as server:
+            client = get_llm_client(provider="vllm", api_base=server.api_base)
+            assert get_llm_client(provider="vllm", api_base=server.api_base) is client
+            assert (
+                get_llm_client(provider="vllm", api_base=server.api_base, model_name="other")
+                is not client
+            )
+            # One check per new client, none on reuse within the TTL
+            assert server.models_requests == 2
+
+            client.health_check_ttl = 0
+            assert get_llm_client(provider="vllm", api_base=server.api_base) is client
+            assert server.models_requests == 3
+
+        # The server is gone: the reused client fails its check and is dropped
+        with pytest.raises(ConnectionError):
+            get_llm_client(provider="vllm", api_base=server.api_base)
+        with pytest.raises(ConnectionError):
+            get_llm_client(provider="vllm", api_base=server.api_base)
+    finally:
+        close_llm_clients()
+
+
+@pytest.mark.unit
+def test_get_llm_client_accepts_replica_lists(test_env):
+    """Test that a list of replicas (vllm.api_base as a list) is a valid registry key."""
+    try:
+        with StandInLLMServer() as first, StandInLLMServer() as second:
+            replicas = [first.api_base, second.api_base]
+            client = get_llm_client(provider="vllm", api_base=replicas)
+            assert get_llm_client(provider="vllm", api_base=list(replicas)) is client
+            # The comma-separated form from the command line names the same replicas
+            assert get_llm_client(provider="vllm", api_base=",".join(replicas)) is client
+            assert get_llm_client(provider="vllm", api_base=first.api_base) is not client
+    finally:
+        close_llm_clients()
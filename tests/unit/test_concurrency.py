@@ -0,0 +1,53 @@
+"""Unit tests for adaptive concurrency control."""
+
+import pytest
+
+from synthetic_data_kit.models.concurrency import AdaptiveConcurrencyLimiter, parse_retry_after
+
+
+@pytest.mark.unit
+def test_limiter_grows_while_healthy():
+    """Test that the limit increases additively on healthy completions."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=6)
+
+    for _ in range(100):
+        limiter.on_success(limiter.epoch, latency=1.0)
+
+    assert limiter.limit == 6
+    assert limiter.snapshot()["history"][-1]["reason"] == "increase"
+
+
+@pytest.mark.unit
+def test_limiter_holds_when_latency_degrades():
+    """Test that the limit stops growing when latency rises past the tolerance."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, latency_tolerance=2.0)
+    limiter.on_success(limiter.epoch, latency=1.0)
+    start = limiter.limit
+
+    for _ in range(50):
+        limiter.on_success(limiter.epoch, latency=10.0)
+
+    assert limiter.limit <= start + 1
+
+
+@pytest.mark.unit
+def test_limiter_backs_off_once_per_window():
+    """Test multiplicative decrease happens once for a burst of overload signals."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=16, min_limit=2)
+    epoch = limiter.epoch
+
+    for _ in range(5):
+        limiter.on_overload(epoch, retry_after=0.5)
+
+    assert limiter.limit == 8
+    assert limiter.pause_remaining() > 0
+    assert [entry["reason"] for entry in limiter.snapshot()["history"]] == ["initial", "overload"]
+
+
+@pytest.mark.unit
+def test_parse_retry_after():
+    """Test parsing Retry-After headers in seconds and HTTP-date form."""
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("not a date") is None
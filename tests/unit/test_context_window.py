@@ -0,0 +1,57 @@
+"""Unit tests for the context window guard."""
+
+import pytest
+import requests
+
+from synthetic_data_kit.models.context_window import (
+    ContextWindow,
+    ContextWindowExceeded,
+    check_context_overflow,
+    context_length_from_models,
+    create_context_window,
+)
+
+
+@pytest.mark.unit
+def test_context_window_fit_shrinks_then_rejects():
+    """Test that max_tokens shrinks to fit and prompts without room are rejected."""
+    window = ContextWindow(context_length=1000, margin=0.1, min_output_tokens=100)
+    short = [{"role": "user", "content": "x" * 400}]
+    medium = [{"role": "user", "content": "x" * 2400}]
+    long = [{"role": "user", "content": "x" * 3600}]
+
+    assert window.fit(short, 500) == 500
+    # 900 usable tokens minus a ~606-token prompt
+    assert window.fit(medium, 500) == 900 - 606
+    with pytest.raises(ContextWindowExceeded):
+        window.fit(long, 500)
+    assert window.snapshot() == {"context_length": 1000, "shrunk_max_tokens": 1, "rejected": 1}
+    assert window.prompt_limit(500) == 400
+
+
+@pytest.mark.unit
+def test_check_context_overflow_detects_server_rejections():
+    """Test that only 400s about the prompt length become ContextWindowExceeded."""
+    response = requests.Response()
+    response.status_code = 400
+    response._content = (
+        b'{"error": {"message": "This model\'s maximum context length is 8192 tokens."}}'
+    )
+    with pytest.raises(ContextWindowExceeded):
+        check_context_overflow(requests.exceptions.HTTPError("400 Client Error", response=response))
+
+    response._content = b'{"error": {"message": "Invalid schema"}}'
+    check_context_overflow(requests.exceptions.HTTPError("400 Client Error", response=response))
+    check_context_overflow(ConnectionError("maximum context length"))
+
+
+@pytest.mark.unit
+def test_context_length_from_config_or_models():
+    """Test that the configured length wins over the one reported by /models."""
+    info = {"data": [{"id": "other"}, {"id": "model-a", "max_model_len": 8192}]}
+    assert context_length_from_models(info, "model-a") == 8192
+    assert context_length_from_models(["model-a"], "model-a") is None
+
+    assert create_context_window({}) is None
+    assert create_context_window({}, detected=8192).context_length == 8192
+    assert create_context_window({"context_length": 4096}, detected=8192).context_length == 4096
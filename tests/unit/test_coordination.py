@@ -0,0 +1,132 @@
+"""Unit tests for cross-process coordination of rate limits and in-flight slots."""
+
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from synthetic_data_kit.models.coordination import (
+    SQLiteCoordinator,
+    coordination_namespace,
+    create_coordinator,
+)
+from synthetic_data_kit.models.rate_limiter import RateLimiter
+
+
+@pytest.mark.unit
+def test_rate_limiters_share_budget(tmp_path):
+    """Test that two limiters backed by the same file draw from one budget."""
+    path = str(tmp_path / "coordination.sqlite")
+    first = RateLimiter(requests_per_minute=60, coordinator=SQLiteCoordinator(path, "ns"))
+    second = RateLimiter(requests_per_minute=60, coordinator=SQLiteCoordinator(path, "ns"))
+
+    # Drain almost the whole shared bucket through the first limiter
+    for _ in range(59):
+        assert first._reserve(1) == 0
+    assert second._reserve(1) == 0
+
+    # The budget is exhausted for both, so the next request has to wait ~1s
+    assert first._reserve(1) > 0.5
+    assert second._reserve(1) > 0.5
+
+    # A different namespace (another provider or key) has its own budget
+    other = RateLimiter(requests_per_minute=60, coordinator=SQLiteCoordinator(path, "other"))
+    assert other._reserve(1) == 0
+
+
+@pytest.mark.unit
+def test_shared_slots_are_capped_and_reclaimed(tmp_path):
+    """Test the host-wide in-flight cap, including slots left by dead processes."""
+    path = str(tmp_path / "coordination.sqlite")
+    coordinator = SQLiteCoordinator(path, "ns")
+
+    first = coordinator.try_acquire_slot(2)
+    second = coordinator.try_acquire_slot(2)
+    assert first and second
+    assert coordinator.try_acquire_slot(2) is None
+
+    coordinator.release_slot(first)
+    assert coordinator.slots_in_use() == 1
+
+    # A slot taken by a process that has since exited is reclaimed
+    child = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from synthetic_data_kit.models.coordination import SQLiteCoordinator; "
+            "print(SQLiteCoordinator(sys.argv[1], 'ns').try_acquire_slot(2))",
+            path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    )
+    assert child.stdout.strip() != "None"
+    assert coordinator.try_acquire_slot(2) is not None
+
+
+@pytest.mark.unit
+def test_async_coordination_keeps_event_loop_free(tmp_path):
+    """Test that waiting on another process's SQLite lock does not stall the event loop."""
+    path = str(tmp_path / "coordination.sqlite")
+    coordinator = SQLiteCoordinator(path, "ns")
+    limiter = RateLimiter(requests_per_minute=60, coordinator=coordinator)
+    # Stands in for another process holding the write lock
+    blocker = sqlite3.connect(path, isolation_level=None)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        blocker.execute("BEGIN IMMEDIATE")
+        asyncio.get_running_loop().call_later(0.3, blocker.execute, "COMMIT")
+        await limiter.acquire_async(1)
+        holder = await coordinator.try_acquire_slot_async(1)
+        ticks_while_locked = ticks
+
+        # A caller cancelled mid-transaction gets no slot, and none is left behind
+        blocker.execute("BEGIN IMMEDIATE")
+        abandoned = asyncio.create_task(coordinator.try_acquire_slot_async(2))
+        await asyncio.sleep(0.05)
+        abandoned.cancel()
+        blocker.execute("COMMIT")
+        with pytest.raises(asyncio.CancelledError):
+            await abandoned
+        await coordinator.release_slot_async(holder)
+        for _ in range(100):
+            if coordinator.slots_in_use() == 0:
+                break
+            await asyncio.sleep(0.01)
+        ticker.cancel()
+        return ticks_while_locked
+
+    assert asyncio.run(run()) >= 10
+    assert coordinator.slots_in_use() == 0
+    blocker.close()
+
+
+@pytest.mark.unit
+def test_create_coordinator_from_config(tmp_path):
+    """Test that coordination is opt-in and rejects unknown backends."""
+    namespace = coordination_namespace("vllm", "http://localhost:8000/v1", None)
+    assert create_coordinator({}, namespace) is None
+    assert create_coordinator({"coordination": {"backend": None}}, namespace) is None
+
+    coordinator = create_coordinator(
+        {"coordination": {"backend": "sqlite", "path": str(tmp_path / "c.sqlite")}}, namespace
+    )
+    assert isinstance(coordinator, SQLiteCoordinator)
+    assert coordinator.namespace == namespace
+
+    with pytest.raises(ValueError):
+        create_coordinator({"coordination": {"backend": "redis"}}, namespace)
@@ -71,10 +71,10 @@ def test_parse_json_output():
 
 
 @pytest.mark.unit
-def test_generate_cot_examples(patch_config):
+def test_generate_cot_examples(patch_config, llm_client_factory):
     """Test generating chain-of-thought examples."""
     # Create mock LLM client with config
-    mock_client = MagicMock()
+    mock_client = llm_client_factory.create_client()
     mock_client.config = {
         "prompts": {
             "cot_generation": "Generate {num_examples} Chain of Thought reasoning examples from the following text:\n\nText:\n{text}",
@@ -260,10 +260,10 @@ def test_enhance_with_cot(patch_config):
 
 
 @pytest.mark.unit
-def test_process_document(patch_config):
+def test_process_document(patch_config, llm_client_factory):
     """Test processing a document to generate COT examples."""
     # Create mock LLM client with config
-    mock_client = MagicMock()
+    mock_client = llm_client_factory.create_client()
     mock_client.config = {
         "prompts": {
             "cot_generation": "Generate {num_examples} Chain of Thought reasoning examples from the following text:\n\nText:\n{text}",
@@ -317,3 +317,34 @@ def test_process_document(patch_config):
 
     # Check that client was called twice
     assert mock_client.chat_completion.call_count == 2
+
+
+@pytest.mark.unit
+def test_generate_cot_examples_cancels_requests_at_target(patch_config, llm_client_factory):
+    """Test that chunked generation stops at the target and counts the cancelled requests."""
+    mock_client = llm_client_factory.create_client()
+    mock_client.config = {
+        "prompts": {"cot_generation": "Generate {num_examples} examples from:\n{text}"},
+        "generation": {"single_call_max_size": 100, "chunk_size": 50, "overlap": 0},
+    }
+    example = {"question": "Q?", "reasoning": "Because.", "answer": "A."}
+
+    def iter_completion(message_batches, **kwargs):
+        sent = 0
+        try:
+            for index in range(len(message_batches)):
+                sent += 1
+                yield index, json.dumps([example, example])
+        finally:
+            mock_client.early_stop["not_sent"] += len(message_batches) - sent
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = COTGenerator(client=mock_client)
+    document_text = "\n\n".join(f"Paragraph {i} of the document about data." for i in range(6))
+
+    examples = generator.generate_cot_examples(document_text, num_examples=3)
+
+    # Two of the six chunk responses reach the target
+    assert len(examples) == 3
+    assert generator.chunk_stats == {"chunks": 6, "completed": 2, "calls_avoided": 4}
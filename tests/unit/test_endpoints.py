@@ -0,0 +1,46 @@
+"""Unit tests for load balancing across server replicas."""
+
+import pytest
+
+from synthetic_data_kit.models.endpoints import EndpointPool, create_endpoint_pool, parse_endpoints
+
+
+@pytest.mark.unit
+def test_parse_endpoints():
+    """Test the accepted forms of api_base."""
+    assert parse_endpoints(None) == []
+    assert parse_endpoints("http://a:8000/v1") == ["http://a:8000/v1"]
+    assert parse_endpoints("http://a/v1, http://b/v1/") == ["http://a/v1", "http://b/v1"]
+    assert parse_endpoints(["http://a/v1", "http://b/v1"]) == ["http://a/v1", "http://b/v1"]
+
+    assert create_endpoint_pool("http://a/v1", {}) is None
+    assert len(create_endpoint_pool(["http://a/v1", "http://b/v1"], {})) == 2
+
+
+@pytest.mark.unit
+def test_endpoint_pool_ejects_and_readmits_on_probation():
+    """Test least-outstanding dispatch, ejection and probation after readmission."""
+    pool = EndpointPool(["http://a", "http://b"], failure_threshold=2, eject_seconds=0.0)
+    a, b = pool.endpoints
+
+    # Dispatch alternates while both replicas are equally loaded
+    first, second = pool.acquire(), pool.acquire()
+    assert {first.url, second.url} == {"http://a", "http://b"}
+    pool.release(first, latency=0.1)
+    pool.release(second, latency=0.1)
+
+    # Two consecutive failures eject a replica
+    pool.eject_seconds = 60.0
+    for _ in range(2):
+        a.outstanding += 1
+        pool.release(a, failed=True)
+    assert [e["healthy"] for e in pool.snapshot()] == [False, True]
+    assert all(pool.acquire() is b for _ in range(3))
+
+    # A passing health check readmits it, but one more failure ejects it again for longer
+    pool.report_health(a, True)
+    assert pool.snapshot()[0]["healthy"]
+    pool.release(a, failed=True)
+    assert not pool.snapshot()[0]["healthy"]
+    assert a.ejections == 2
+    assert a.ejected_until - b.ejected_until > 100
@@ -132,7 +132,7 @@ def test_create_invalid_content_type(patch_config, test_env):
 
     try:
         # Mock the LLM client
-        with patch("synthetic_data_kit.core.create.LLMClient"):
+        with patch("synthetic_data_kit.core.create.get_llm_client"):
             # Try to create with an invalid content type
             with pytest.raises(ValueError) as excinfo:
                 create.process_file(
@@ -176,7 +176,7 @@ def test_curate_input_validation(patch_config, test_env):
             empty_file_path = f.name
 
         # Mock the LLM client
-        with patch("synthetic_data_kit.core.curate.LLMClient"):
+        with patch("synthetic_data_kit.core.curate.get_llm_client"):
             # Try to curate an empty file
             with pytest.raises(ValueError) as excinfo:
                 curate.curate_qa_pairs(input_path=empty_file_path, output_path=output_path)
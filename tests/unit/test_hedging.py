@@ -0,0 +1,33 @@
+"""Unit tests for the request hedging policy."""
+
+import pytest
+
+from synthetic_data_kit.models.hedging import HedgingPolicy, create_hedging_policy
+
+
+@pytest.mark.unit
+def test_hedging_policy_delay_and_budget():
+    """Test the percentile delay and the cap on hedged traffic."""
+    policy = HedgingPolicy(percentile=90, max_fraction=0.1, min_samples=10)
+
+    # Not enough history yet
+    assert policy.delay() is None
+    for latency in range(1, 11):
+        policy.record(latency / 10)
+    assert policy.delay() == pytest.approx(1.0)
+
+    # Two requests so far: 10% of traffic allows no hedge yet
+    assert not policy.try_hedge()
+    for _ in range(8):
+        policy.delay()
+    assert policy.try_hedge()
+    assert not policy.try_hedge()
+    assert policy.snapshot()["hedges"] == 1
+
+
+@pytest.mark.unit
+def test_create_hedging_policy_from_config():
+    """Test that hedging is opt-in."""
+    assert create_hedging_policy({}) is None
+    assert create_hedging_policy({"hedging": {"enabled": False}}) is None
+    assert create_hedging_policy({"hedging": {"enabled": True, "percentile": 99}}).percentile == 99
@@ -1,10 +1,21 @@
 """Unit tests for LLM client."""
 
+import asyncio
+import json
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from synthetic_data_kit.models.llm_client import LLMClient
+from synthetic_data_kit.models.context_window import ContextWindowExceeded
+from synthetic_data_kit.models.hedging import HedgingPolicy
+from synthetic_data_kit.models.response_cache import ResponseCache
+from synthetic_data_kit.models.retry import CircuitBreaker
+from synthetic_data_kit.models.token_budget import create_output_budget
+from synthetic_data_kit.utils.deadline import DeadlineExceededError, set_deadline
+from synthetic_data_kit.utils.schemas import QA_PAIRS_SCHEMA
+from tests.utils import StandInLLMServer
 
 
 @pytest.mark.unit
@@ -123,3 +134,487 @@ def test_llm_client_vllm_chat_completion(patch_config, test_env):
         assert response == "This is a test response"
         # Check that vLLM API was called
         assert mock_post.called
+
+
+@pytest.mark.unit
+def test_llm_client_vllm_retry_resends_the_request(patch_config, test_env):
+    """Test that a retry after a response without choices resends the original payload."""
+    with patch("requests.post") as mock_post, patch("requests.get") as mock_get:
+        mock_get.return_value = MagicMock(status_code=200)
+        malformed = MagicMock(status_code=200)
+        malformed.json.return_value = {"object": "error"}
+        valid = MagicMock(status_code=200)
+        valid.json.return_value = {"choices": [{"message": {"content": "Recovered"}}]}
+        mock_post.side_effect = [malformed, valid]
+
+        client = LLMClient(provider="vllm")
+        client.retry_delay = 0.01
+        messages = [{"role": "user", "content": "What is synthetic data?"}]
+
+        assert client.chat_completion(messages) == "Recovered"
+        payloads = [json.loads(call.kwargs["data"]) for call in mock_post.call_args_list]
+        assert payloads[0] == payloads[1]
+        assert payloads[1]["messages"] == messages
+
+
+@pytest.mark.unit
+def test_llm_client_vllm_batch_completion_is_concurrent(test_env):
+    """Test that vLLM batch completion sends requests concurrently and keeps order."""
+    with StandInLLMServer(delay=0.2) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.max_concurrent_requests = 8
+
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(8)]
+
+        start = time.monotonic()
+        responses = client.batch_completion(message_batches, batch_size=8)
+        elapsed = time.monotonic() - start
+
+        # Results keep the input order
+        assert responses == [f"prompt {i}" for i in range(8)]
+        # All requests were in flight together rather than one at a time
+        assert server.max_in_flight > 1
+        assert elapsed < 8 * 0.2
+
+
+@pytest.mark.unit
+def test_llm_client_batch_completion_reuses_async_client(patch_config, test_env):
+    """Test that batches share one async client and work inside a running event loop."""
+    with patch("synthetic_data_kit.models.llm_client.OpenAI"), patch(
+        "openai.AsyncOpenAI"
+    ) as mock_async_openai:
+
+        async def fake_create(**kwargs):
+            mock_choice = MagicMock()
+            mock_choice.message.content = kwargs["messages"][-1]["content"]
+            mock_response = MagicMock()
+            mock_response.choices = [mock_choice]
+            return mock_response
+
+        mock_async_client = MagicMock()
+        mock_async_client.chat.completions.create = fake_create
+        mock_async_openai.return_value = mock_async_client
+
+        client = LLMClient(provider="api-endpoint")
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(3)]
+
+        first = client.batch_completion(message_batches, batch_size=3)
+
+        # Calling from inside a running loop (as in Jupyter) must not fail
+        async def call_from_running_loop():
+            return client.batch_completion(message_batches, batch_size=3)
+
+        second = asyncio.run(call_from_running_loop())
+
+        assert first == second == ["prompt 0", "prompt 1", "prompt 2"]
+        # One long-lived async client serves every batch
+        assert mock_async_openai.call_count == 1
+
+
+@pytest.mark.unit
+def test_llm_client_iter_completion_sliding_window(test_env):
+    """Test that a slow request does not hold back the rest of the window."""
+    slow_prompt = "prompt 0"
+    with StandInLLMServer(
+        delay=lambda payload: 1.0 if payload["messages"][-1]["content"] == slow_prompt else 0.05
+    ) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(6)]
+
+        order = [index for index, _ in client.iter_completion(message_batches, max_in_flight=2)]
+
+        # The other slot kept working while the straggler was in flight
+        assert sorted(order) == list(range(6))
+        assert order[-1] == 0
+        assert server.max_in_flight <= 2
+
+
+@pytest.mark.unit
+def test_llm_client_iter_completion_cancels_on_close(test_env):
+    """Test that closing the iterator early stops scheduling new requests."""
+
+    def first_is_fast(payload):
+        return 0.01 if payload["messages"][-1]["content"] == "prompt 0" else 1.0
+
+    with StandInLLMServer(delay=first_is_fast) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(20)]
+
+        results = client.iter_completion(message_batches, max_in_flight=2)
+        first = next(results)
+        results.close()
+
+        assert first == (0, "prompt 0")
+        # The dropped requests are reported as soon as close() returns
+        early_stop = client.get_metrics()["early_stop"]
+        # prompt 0 finished; prompts 1 and 2 (started when 0 finished) were in flight
+        assert early_stop == {"cancelled_in_flight": 2, "not_sent": 17}
+        time.sleep(0.3)
+        assert len(server.requests) < len(message_batches)
+
+
+@pytest.mark.unit
+def test_llm_client_adaptive_concurrency_backs_off_on_429(test_env):
+    """Test that 429 responses shrink the in-flight limit and are retried."""
+    rejected = []
+
+    def reject_first_requests(payload):
+        if len(rejected) < 4:
+            rejected.append(payload)
+            return 429, {"Retry-After": "0.1"}
+        return None
+
+    with StandInLLMServer(error=reject_first_requests) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.adaptive_concurrency = {"enabled": True, "min_concurrency": 1, "max_concurrency": 16}
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(8)]
+
+        responses = client.batch_completion(message_batches, batch_size=8)
+
+        assert responses == [f"prompt {i}" for i in range(8)]
+        concurrency = client.get_metrics()["concurrency"]
+        assert "overload" in [entry["reason"] for entry in concurrency["history"]]
+        assert concurrency["limit"] < 8
+
+
+@pytest.mark.unit
+def test_llm_client_response_cache_coalesces_and_reuses(test_env, tmp_path):
+    """Test that identical requests share one call and re-runs are served from the cache."""
+    with StandInLLMServer(delay=0.2) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.response_cache = ResponseCache(str(tmp_path / "responses.sqlite"), 1024 * 1024)
+
+        # Two distinct prompts, each requested three times concurrently
+        message_batches = [[{"role": "user", "content": f"prompt {i % 2}"}] for i in range(6)]
+
+        first = client.batch_completion(message_batches, batch_size=6, cache=True)
+        assert first == [f"prompt {i % 2}" for i in range(6)]
+        assert len(server.requests) == 2
+        after_first = client.get_metrics()
+
+        second = client.batch_completion(message_batches, batch_size=6, cache=True)
+        assert second == first
+        assert len(server.requests) == 2
+        # Counters since a snapshot cover only the second batch
+        assert client.get_metrics(since=after_first)["cache"] == {
+            **after_first["cache"],
+            "hits": 6,
+            "misses": 0,
+            "coalesced": 0,
+            "hit_rate": 1.0,
+        }
+
+        # Sampled requests bypass the cache unless asked for
+        client.batch_completion(message_batches[:1], temperature=0.7, batch_size=1)
+        assert len(server.requests) == 3
+
+        stats = client.get_metrics()["cache"]
+        assert stats["coalesced"] == 4
+        assert stats["hits"] == 6
+
+
+@pytest.mark.unit
+def test_llm_client_load_balances_across_replicas(test_env):
+    """Test least-outstanding dispatch over replicas and ejection of a failing one."""
+
+    def always_fail(payload):
+        return 500, {}
+
+    with StandInLLMServer(delay=0.1) as first, StandInLLMServer(
+        delay=0.1
+    ) as second, StandInLLMServer(error=always_fail) as broken:
+        client = LLMClient(provider="vllm", api_base=f"{first.api_base},{second.api_base}")
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(8)]
+
+        responses = client.batch_completion(message_batches, batch_size=2)
+
+        assert responses == [f"prompt {i}" for i in range(8)]
+        # Both replicas were kept busy, each with its own window of two
+        assert len(first.requests) == len(second.requests) == 4
+        assert first.max_in_flight == second.max_in_flight == 2
+        stats = {entry["url"]: entry for entry in client.get_metrics()["endpoints"]}
+        assert stats[first.api_base]["requests"] == 4
+        assert stats[first.api_base]["latency_ewma"] > 0
+
+        # A replica that keeps failing is ejected and its requests retried elsewhere
+        client = LLMClient(provider="vllm", api_base=[first.api_base, broken.api_base])
+        client.retry_delay = 0.01
+        client.max_retries = 5
+        responses = client.batch_completion(message_batches, batch_size=1)
+
+        assert responses == [f"prompt {i}" for i in range(8)]
+        stats = {entry["url"]: entry for entry in client.get_metrics()["endpoints"]}
+        assert stats[broken.api_base]["healthy"] is False
+        assert stats[broken.api_base]["ejections"] == 1
+
+
+@pytest.mark.unit
+def test_llm_client_hedges_slow_requests(test_env):
+    """Test that a straggler is duplicated after the latency percentile and the fast copy wins."""
+    seen = []
+
+    def straggler_once(payload):
+        content = payload["messages"][-1]["content"]
+        seen.append(content)
+        return 1.5 if content == "prompt 9" and seen.count(content) == 1 else 0.02
+
+    with StandInLLMServer(delay=straggler_once) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.hedging = HedgingPolicy(percentile=90, max_fraction=0.5, min_samples=5)
+        # A hedge delay far from both latencies, so scheduler jitter on a fast
+        # request cannot cross it
+        client.hedging._latencies.extend([0.3] * 20)
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(10)]
+
+        start = time.monotonic()
+        responses = client.batch_completion(message_batches, batch_size=1)
+        elapsed = time.monotonic() - start
+
+        assert responses == [f"prompt {i}" for i in range(10)]
+        assert elapsed < 1.0
+        assert seen.count("prompt 9") == 2
+        hedging = client.get_metrics()["hedging"]
+        assert hedging["hedges"] == 1
+        assert hedging["hedge_wins"] == 1
+
+
+@pytest.mark.unit
+def test_llm_client_circuit_breaker_fails_fast(test_env):
+    """Test that requests stop hitting a failing server once the circuit opens."""
+
+    def always_unavailable(payload):
+        return 500, {}
+
+    with StandInLLMServer(error=always_unavailable) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.retry_delay = 0.01
+        client.circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60.0)
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(10)]
+
+        responses = client.batch_completion(message_batches, batch_size=1)
+
+        # Every item reports its own error, and most never reached the server
+        assert all(response.startswith("ERROR:") for response in responses)
+        assert "Circuit open" in responses[-1]
+        assert len(server.requests) == 3
+        assert client.get_metrics()["circuit_breaker"]["state"] == "open"
+
+
+@pytest.mark.unit
+def test_llm_client_cancelled_probe_releases_circuit(test_env):
+    """Test that closing iter_completion while the half-open probe runs does not wedge the circuit."""
+    with StandInLLMServer(delay=0.3) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.hedging = None
+        client.circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        client.circuit_breaker.record_failure(ConnectionError("refused"))
+        time.sleep(0.15)
+
+        # The first request probes; the second fails fast while the probe runs
+        results = client.iter_completion(
+            [[{"role": "user", "content": f"prompt {i}"}] for i in range(2)], max_in_flight=2
+        )
+        index, content = next(results)
+        assert (index, content.startswith("ERROR: Circuit open")) == (1, True)
+        results.close()
+        time.sleep(0.1)
+
+        assert client.circuit_breaker.state == "open"
+        assert client.chat_completion([{"role": "user", "content": "hello"}]) == "hello"
+        assert client.circuit_breaker.state == "closed"
+        client.close()
+
+
+@pytest.mark.unit
+def test_llm_client_request_timeout_scales_with_max_tokens(test_env):
+    """Test that timeouts grow with max_tokens and are capped by the deadline."""
+    with StandInLLMServer() as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+    client.timeout_config = {"base": 10.0, "min_tokens_per_second": 10.0, "max": 100.0}
+
+    assert client._request_timeout(100) == pytest.approx(20.0)
+    assert client._request_timeout(10000) == pytest.approx(100.0)
+
+    try:
+        set_deadline(5.0)
+        assert client._request_timeout(100) <= 5.0
+        set_deadline(-1.0)
+        with pytest.raises(DeadlineExceededError):
+            client._request_timeout(100)
+    finally:
+        set_deadline(None)
+
+
+@pytest.mark.unit
+def test_llm_client_deadline_cancels_batch(test_env):
+    """Test that requests stop at the deadline and finished results are kept."""
+    with StandInLLMServer(delay=0.2) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(10)]
+
+        try:
+            set_deadline(0.5)
+            start = time.monotonic()
+            responses = client.batch_completion(message_batches, batch_size=1)
+            elapsed = time.monotonic() - start
+        finally:
+            set_deadline(None)
+
+        assert elapsed < 0.8
+        finished = [r for r in responses if not r.startswith("ERROR:")]
+        assert finished == [f"prompt {i}" for i in range(len(finished))]
+        assert 1 <= len(finished) < 10
+        assert responses[-1] == "ERROR: Deadline exceeded"
+        assert client.get_metrics()["deadline"]["cancelled_requests"] == 10 - len(finished)
+
+
+@pytest.mark.unit
+def test_llm_client_structured_output_sends_schema(test_env):
+    """Test that structured output sends guided_json and falls back when rejected."""
+
+    def reject_guided_json(payload):
+        return (400, {}) if "guided_json" in payload else None
+
+    with StandInLLMServer(responder=lambda payload: '{"qa_pairs": []}') as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.structured_output = True
+        message_batches = [[{"role": "user", "content": "prompt"}]]
+
+        responses = client.batch_completion(message_batches, json_schema=QA_PAIRS_SCHEMA)
+
+        assert responses == ['{"qa_pairs": []}']
+        assert server.requests[0]["guided_json"] == QA_PAIRS_SCHEMA["schema"]
+
+    with StandInLLMServer(error=reject_guided_json) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.structured_output = True
+        message_batches = [[{"role": "user", "content": "prompt"}]]
+
+        responses = client.batch_completion(message_batches, json_schema=QA_PAIRS_SCHEMA)
+
+        # The rejected request is resent once without the schema
+        assert responses == ["prompt"]
+        assert ["guided_json" in payload for payload in server.requests] == [True, False]
+        assert client.structured_output is False
+
+
+@pytest.mark.unit
+def test_llm_client_iter_completion_streams_and_cancels(test_env):
+    """Test that streamed text arrives in fragments and closing the iterator stops the streams."""
+    with StandInLLMServer(stream_chunk=4, stream_interval=0.02) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        message_batches = [[{"role": "user", "content": f"streamed prompt {i}"}] for i in range(2)]
+
+        text = {}
+        finished = []
+        for index, delta, done in client.iter_completion(message_batches, stream=True):
+            if done:
+                finished.append((index, delta))
+            else:
+                text[index] = text.get(index, "") + delta
+
+        assert sorted(finished) == [(0, ""), (1, "")]
+        assert text == {0: "streamed prompt 0", 1: "streamed prompt 1"}
+        assert all(payload["stream"] for payload in server.requests)
+
+        server.streamed_events = 0
+        long_prompt = [[{"role": "user", "content": "x" * 400}]]
+        stream = client.iter_completion(long_prompt, stream=True)
+        next(stream)
+        stream.close()
+        time.sleep(0.2)
+
+        # Far fewer than the 100 events of the full response were sent
+        assert server.streamed_events < 50
+        # The cut-off stream had already yielded text, so it saved nothing
+        assert client.early_stop == {"cancelled_in_flight": 0, "not_sent": 0}
+
+
+@pytest.mark.unit
+def test_llm_client_batch_completion_samples_n(test_env):
+    """Test that n samples come from one request, or one request each without n support."""
+    with StandInLLMServer() as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        message_batches = [[{"role": "user", "content": f"prompt {i}"}] for i in range(2)]
+
+        responses = client.batch_completion(message_batches, n=3)
+
+        assert responses == [["prompt 0"] * 3, ["prompt 1"] * 3]
+        assert [payload["n"] for payload in server.requests] == [3, 3]
+
+        server.requests.clear()
+        client.supports_n = False
+        responses = client.batch_completion(message_batches, n=3)
+
+        assert responses == [["prompt 0"] * 3, ["prompt 1"] * 3]
+        assert len(server.requests) == 6
+        assert all("n" not in payload for payload in server.requests)
+
+    # A schema rejection resends the request without the schema but still with n
+    with StandInLLMServer(
+        error=lambda payload: (400, {}) if "guided_json" in payload else None
+    ) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        client.structured_output = True
+
+        responses = client.batch_completion(
+            message_batches, n=3, json_schema=QA_PAIRS_SCHEMA, batch_size=1
+        )
+
+        assert responses == [["prompt 0"] * 3, ["prompt 1"] * 3]
+        assert [payload.get("n") for payload in server.requests] == [3, 3, 3]
+
+
+@pytest.mark.unit
+def test_llm_client_output_budget_sets_max_tokens_and_stop(test_env):
+    """Test that task requests get a sized max_tokens and a stop after the JSON array."""
+    with StandInLLMServer() as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        # Opt-in
+        assert client.output_budget is None
+        client.output_budget = create_output_budget(
+            {"output_budget": {"enabled": True}, "max_tokens": 4096}
+        )
+        messages = [{"role": "user", "content": "prompt"}]
+
+        client.chat_completion(messages, task="qa_generation", items=5)
+        client.chat_completion(messages, max_tokens=100, task="qa_generation", items=5)
+        client.structured_output = True
+        client.chat_completion(messages, task="qa_generation", items=5, json_schema=QA_PAIRS_SCHEMA)
+
+        first, explicit, structured = server.requests
+        # 64 base tokens + 90 tokens per pair * 5 pairs * 1.5 headroom
+        assert first["max_tokens"] == 739
+        assert first["stop"] == ["\n]"]
+        assert first["include_stop_str_in_output"] is True
+        assert explicit["max_tokens"] == 100
+        # Schema-constrained output ends on its own
+        assert "stop" not in structured
+        assert client.get_metrics()["output_budget"]["qa_generation"]["requests"] == 3
+
+
+@pytest.mark.unit
+def test_llm_client_context_window_guard(test_env):
+    """Test that over-long prompts fail before sending, and server rejections are not retried."""
+    with StandInLLMServer(max_model_len=2000) as server:
+        client = LLMClient(provider="vllm", api_base=server.api_base)
+        assert client.context_window.context_length == 2000
+        too_long = [{"role": "user", "content": "x" * 8000}]
+
+        with pytest.raises(ContextWindowExceeded):
+            client.chat_completion(too_long, max_tokens=100)
+        responses = client.batch_completion(
+            [too_long, [{"role": "user", "content": "fits"}]], max_tokens=100
+        )
+        assert responses[0].startswith("ERROR:")
+        assert responses[1] == "fits"
+        assert len(server.requests) == 1
+
+        # Without the guard the server's 400 is recognized and not retried
+        client.context_window = None
+        server.requests.clear()
+        with pytest.raises(ContextWindowExceeded):
+            client.chat_completion(too_long, max_tokens=100)
+        responses = client.batch_completion([too_long], max_tokens=100)
+        assert responses[0].startswith("ERROR:")
+        assert len(server.requests) == 2
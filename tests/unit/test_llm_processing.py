@@ -55,6 +55,44 @@ def test_parse_qa_pairs_with_regex():
     assert result[1]["question"] == "Why use synthetic data?"
 
 
+@pytest.mark.unit
+def test_parse_structured_output():
+    """Test unwrapping schema-constrained output."""
+    text = '{"qa_pairs": [{"question": "What is synthetic data?", "answer": "Generated data."}]}'
+
+    assert llm_processing.parse_structured_output(text, "qa_pairs") == [
+        {"question": "What is synthetic data?", "answer": "Generated data."}
+    ]
+    assert llm_processing.parse_qa_pairs(text)[0]["answer"] == "Generated data."
+    # Free-form output is left to the other parsing strategies
+    assert llm_processing.parse_structured_output("Here is the result: []", "qa_pairs") is None
+    assert llm_processing.parse_structured_output('{"ratings": 5}', "ratings") is None
+
+
+@pytest.mark.unit
+def test_incremental_json_array_parser():
+    """Test that objects are returned as soon as they close in a streamed response."""
+    text = (
+        'Here are "the" pairs: {"qa_pairs": ['
+        '{"question": "Why [not] {this}?", "answer": "A \\"quoted\\" answer.",}, '
+        '{"question": "Second?", "answer": "Yes."}]} [{"question": "ignored"}]'
+    )
+    parser = llm_processing.IncrementalJSONArrayParser()
+
+    items = []
+    for position, char in enumerate(text):
+        for item in parser.feed(char):
+            items.append((position, item))
+
+    assert [item for _, item in items] == [
+        {"question": "Why [not] {this}?", "answer": 'A "quoted" answer.'},
+        {"question": "Second?", "answer": "Yes."},
+    ]
+    # The first object is available before the second has started
+    assert items[0][0] < text.index('{"question": "Second?"')
+    assert parser.skipped == 0
+
+
 @pytest.mark.unit
 def test_convert_to_conversation_format():
     """Test converting QA pairs to conversation format."""
@@ -1,10 +1,13 @@
 """Unit tests for QA generator."""
 
 import json
-from unittest.mock import MagicMock
+import os
+from unittest.mock import MagicMock, patch
 
 import pytest
+import yaml
 
+from synthetic_data_kit.generators import qa_generator
 from synthetic_data_kit.generators.qa_generator import QAGenerator
 
 
@@ -25,10 +28,10 @@ def test_qa_generator_initialization(patch_config):
 
 
 @pytest.mark.unit
-def test_generate_summary(patch_config):
+def test_generate_summary(patch_config, llm_client_factory):
     """Test generating summary."""
     # Create mock LLM client
-    mock_client = MagicMock()
+    mock_client = llm_client_factory.create_client()
     mock_client.chat_completion.return_value = "This is a summary of the document."
 
     # Initialize generator
@@ -44,11 +47,11 @@ def test_generate_summary(patch_config):
 
 
 @pytest.mark.unit
-def test_generate_qa_pairs(patch_config):
+def test_generate_qa_pairs(patch_config, llm_client_factory):
     """Test generating QA pairs."""
     # Create mock LLM client
-    mock_client = MagicMock()
-    mock_client.batch_completion.return_value = [
+    mock_client = llm_client_factory.create_client()
+    responses = [
         json.dumps(
             [
                 {
@@ -66,13 +69,18 @@ def test_generate_qa_pairs(patch_config):
             ]
         ),
     ]
+    # One response per chunk request
+    mock_client.iter_completion.side_effect = lambda message_batches, **kwargs: (
+        (index, responses[index]) for index in range(len(message_batches))
+    )
 
     # Initialize generator
     generator = QAGenerator(client=mock_client)
+    generator.generation_config["chunk_size"] = 40
 
-    # Generate QA pairs
+    # Generate QA pairs from two chunks
     qa_pairs = generator.generate_qa_pairs(
-        document_text="This is a document to generate QA pairs from.",
+        document_text="This is a document to generate QA pairs from.\n\nIt has a second paragraph.",
         summary="This is a summary of the document.",
         num_pairs=2,
     )
@@ -82,7 +90,7 @@ def test_generate_qa_pairs(patch_config):
     assert qa_pairs[0]["question"] == "What is synthetic data?"
     assert qa_pairs[1]["question"] == "Why use synthetic data?"
     # Check that client was called
-    assert mock_client.batch_completion.called
+    assert mock_client.iter_completion.called
 
 
 @pytest.mark.unit
@@ -140,12 +148,12 @@ def test_rate_qa_pairs(patch_config):
 
 
 @pytest.mark.unit
-def test_process_document(patch_config):
+def test_process_document(patch_config, llm_client_factory):
     """Test processing a document end-to-end."""
     # Create mock LLM client
-    mock_client = MagicMock()
+    mock_client = llm_client_factory.create_client()
     mock_client.chat_completion.return_value = "This is a summary of the document."
-    mock_client.batch_completion.return_value = [
+    responses = [
         json.dumps(
             [
                 {
@@ -163,13 +171,20 @@ def test_process_document(patch_config):
             ]
         ),
     ]
+    # One response per chunk request
+    mock_client.iter_completion.side_effect = lambda message_batches, **kwargs: (
+        (index, responses[index]) for index in range(len(message_batches))
+    )
 
     # Initialize generator
     generator = QAGenerator(client=mock_client)
+    generator.generation_config["chunk_size"] = 40
 
-    # Process document
+    # Process a document of two chunks
     result = generator.process_document(
-        document_text="This is a document to process.", num_pairs=2, verbose=False
+        document_text="This is a document to process.\n\nIt has a second paragraph.",
+        num_pairs=2,
+        verbose=False,
     )
 
     # Check that the result contains summary and QA pairs
@@ -177,3 +192,476 @@ def test_process_document(patch_config):
     assert "qa_pairs" in result
     assert result["summary"] == "This is a summary of the document."
     assert len(result["qa_pairs"]) == 2
+
+
+@pytest.mark.unit
+def test_generate_qa_pairs_keeps_document_order(patch_config, llm_client_factory):
+    """Test that pairs follow chunk order even when responses finish out of order."""
+    mock_client = llm_client_factory.create_client()
+    # Chunks complete in reverse order
+    mock_client.iter_completion.side_effect = lambda messages, **kwargs: (
+        (index, json.dumps([{"question": f"Q{index}?", "answer": f"A{index}."}]))
+        for index in reversed(range(len(messages)))
+    )
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["chunk_size"] = 20
+    document_text = "\n\n".join(f"Paragraph number {i} of the document." for i in range(3))
+
+    qa_pairs = generator.generate_qa_pairs(document_text, summary="Summary", num_pairs=3)
+
+    assert [pair["question"] for pair in qa_pairs] == ["Q0?", "Q1?", "Q2?"]
+
+
+@pytest.mark.unit
+def test_generate_qa_pairs_repairs_unparseable_chunks(patch_config, llm_client_factory):
+    """Test that only chunks with unparseable responses are re-asked."""
+    mock_client = llm_client_factory.create_client()
+    calls = []
+
+    def iter_completion(messages, **kwargs):
+        calls.append(messages)
+        if len(calls) == 1:
+            # The second chunk's output is cut off mid-object
+            responses = [
+                json.dumps([{"question": "Q0?", "answer": "A0."}]),
+                '[{"question": "Q1?", "ans',
+            ]
+        else:
+            responses = [json.dumps([{"question": "Q1?", "answer": "A1."}])]
+        return ((index, response) for index, response in enumerate(responses))
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config.update(
+        {"chunk_size": 20, "repair_retries": 2, "repair_mode": "fix"}
+    )
+    generator.config.setdefault("prompts", {})["qa_repair"] = "Fix this JSON: {output}"
+    document_text = "\n\n".join(f"Paragraph number {i} of the document." for i in range(2))
+
+    qa_pairs = generator.generate_qa_pairs(document_text, summary="Summary", num_pairs=2)
+
+    assert [pair["question"] for pair in qa_pairs] == ["Q0?", "Q1?"]
+    # One repair request, carrying the broken output instead of the chunk
+    assert len(calls) == 2
+    assert calls[1] == [[{"role": "system", "content": 'Fix this JSON: [{"question": "Q1?", "ans'}]]
+    assert generator.repair_stats == {
+        "failed": 1,
+        "repaired": 1,
+        "repair_requests": 1,
+        "repair_rate": 1.0,
+    }
+
+
+@pytest.mark.unit
+def test_generate_qa_pairs_repair_uses_shipped_prompt(patch_config, llm_client_factory):
+    """Test that the shipped qa_repair prompt shows valid JSON and carries the broken output."""
+    with open(os.path.join(os.path.dirname(qa_generator.__file__), "..", "config.yaml")) as f:
+        shipped_prompt = yaml.safe_load(f)["prompts"]["qa_repair"]
+    broken = '[{"question": "Q1?", "ans'
+    mock_client = llm_client_factory.create_client()
+    calls = []
+
+    def iter_completion(messages, **kwargs):
+        calls.append(messages)
+        if len(calls) == 1:
+            responses = [broken]
+        else:
+            responses = [json.dumps([{"question": "Q1?", "answer": "A1."}])]
+        return ((index, response) for index, response in enumerate(responses))
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config.update({"repair_retries": 1, "repair_mode": "fix"})
+    generator.config.setdefault("prompts", {})["qa_repair"] = shipped_prompt
+
+    qa_pairs = generator.generate_qa_pairs("A short document.", summary="Summary", num_pairs=1)
+
+    assert [pair["question"] for pair in qa_pairs] == ["Q1?"]
+    prompt = calls[1][0][0]["content"]
+    assert "{{" not in prompt and "{output}" not in prompt
+    assert prompt.rstrip().endswith(broken)
+    # The example array in the prompt is itself valid JSON
+    example = prompt[prompt.index("[") : prompt.index("]") + 1]
+    assert json.loads(example) == [{"question": "Question 1?", "answer": "Answer 1."}]
+
+
+@pytest.mark.unit
+def test_generate_qa_pairs_streaming_stops_mid_response(patch_config, llm_client_factory):
+    """Test that streamed pairs count toward the target before responses finish."""
+    mock_client = llm_client_factory.create_client()
+    response = json.dumps([{"question": f"Q{i}?", "answer": f"A{i}."} for i in range(5)])
+    consumed = []
+
+    def iter_completion(messages, **kwargs):
+        assert kwargs["stream"] is True
+        for position in range(0, len(response), 10):
+            consumed.append(position)
+            yield 0, response[position : position + 10], False
+        yield 0, "", True
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["stream"] = True
+
+    qa_pairs = generator.generate_qa_pairs("A short document.", summary="Summary", num_pairs=2)
+
+    assert [pair["question"] for pair in qa_pairs] == ["Q0?", "Q1?"]
+    # The stream was abandoned right after the second object closed
+    assert len(consumed) < len(response) // 10 / 2
+
+
+@pytest.mark.unit
+def test_generate_qa_pairs_samples_chunk_for_large_targets(patch_config, llm_client_factory):
+    """Test that a chunk is sampled n times when one response cannot hold all its pairs."""
+    mock_client = llm_client_factory.create_client()
+    samples = [
+        json.dumps([{"question": f"Q{i}?", "answer": "A."} for i in range(start, start + 3)])
+        for start in (0, 2, 4)
+    ]
+
+    def iter_completion(messages, **kwargs):
+        assert kwargs["n"] == 3
+        assert "Create 3 question-answer pairs" in messages[0][0]["content"]
+        return ((0, samples) for _ in range(1))
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["max_pairs_per_response"] = 3
+    generator.config["prompts"]["qa_generation"] = (
+        "Create {num_pairs} question-answer pairs. {summary} {text}"
+    )
+
+    qa_pairs = generator.generate_qa_pairs("A short document.", summary="Summary", num_pairs=9)
+
+    # Questions repeated across samples are kept once
+    assert [pair["question"] for pair in qa_pairs] == [f"Q{i}?" for i in range(7)]
+
+
+@pytest.mark.unit
+def test_generation_fits_context_window(patch_config):
+    """Test that oversized chunks are split and long documents truncated for a single-call summary."""
+    mock_client = MagicMock()
+    # Room for about 50 tokens (200 characters) of text per request
+    mock_client.text_token_limit.return_value = 50
+    mock_client.chat_completion.return_value = "Summary"
+    calls = []
+
+    def iter_completion(messages, **kwargs):
+        calls.append(messages)
+        return ((index, "[]") for index in range(len(messages)))
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config.update(
+        {"chunk_size": 4000, "prompt_layout": "split", "summary": {"strategy": "single"}}
+    )
+    # One long paragraph, which paragraph-based chunking cannot split
+    document_text = " ".join(f"Sentence {i} of the document." for i in range(40))
+
+    generator.generate_summary(document_text)
+    summary_text = mock_client.chat_completion.call_args[0][0][1]["content"]
+    assert len(summary_text) <= 200
+    assert document_text.startswith(summary_text)
+
+    generator.generate_qa_pairs(document_text, summary="Summary", num_pairs=5)
+    chunk_texts = [messages[-1]["content"] for messages in calls[0]]
+    assert len(chunk_texts) > 1
+    assert all(len(chunk) <= 200 for chunk in chunk_texts)
+
+
+@pytest.mark.unit
+def test_generate_summary_map_reduce(patch_config, llm_client_factory):
+    """Test that long documents are summarized per chunk, then reduced in a tree."""
+    mock_client = llm_client_factory.create_client()
+    batches = []
+
+    def batch_completion(message_batches, **kwargs):
+        batches.append(message_batches)
+        return [f"S{len(batches)}.{i}" for i in range(len(message_batches))]
+
+    mock_client.batch_completion.side_effect = batch_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config.update(
+        {
+            "single_call_max_size": 100,
+            "summary": {"strategy": "auto", "chunk_size": 100, "fan_in": 3},
+        }
+    )
+    document_text = "\n\n".join(f"Paragraph {i} " + "x" * 80 for i in range(7))
+
+    summary = generator.generate_summary(document_text)
+
+    # 7 chunks -> groups of 3, 3 and 1 (carried up unchanged) -> 1
+    assert [len(batch) for batch in batches] == [7, 2, 1]
+    assert summary == "S3.0"
+    assert batches[1][0][1]["content"] == "Part 1: S1.0\n\nPart 2: S1.1\n\nPart 3: S1.2"
+    assert batches[2][0][1]["content"] == "Part 1: S2.0\n\nPart 2: S2.1\n\nPart 3: S1.6"
+    assert not mock_client.chat_completion.called
+    assert generator.summarizer.stats == {
+        "strategy": "map_reduce",
+        "map_requests": 7,
+        "reduce_requests": 3,
+        "levels": 2,
+    }
+
+
+@pytest.mark.unit
+def test_generate_summary_map_reduce_survives_failed_reduce(patch_config, llm_client_factory):
+    """Test that a failed reduce request carries its group's parts up instead of breaking the tree."""
+    mock_client = llm_client_factory.create_client()
+    batches = []
+
+    def batch_completion(message_batches, **kwargs):
+        batches.append(message_batches)
+        if len(batches) == 2:
+            # The first group's reduce request fails
+            return ["ERROR: Deadline exceeded"] + [
+                f"S2.{i}" for i in range(1, len(message_batches))
+            ]
+        return [f"S{len(batches)}.{i}" for i in range(len(message_batches))]
+
+    mock_client.batch_completion.side_effect = batch_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config.update(
+        {
+            "single_call_max_size": 100,
+            "summary": {"strategy": "auto", "chunk_size": 100, "fan_in": 3},
+        }
+    )
+    document_text = "\n\n".join(f"Paragraph {i} " + "x" * 80 for i in range(7))
+
+    summary = generator.generate_summary(document_text)
+
+    assert summary == "S3.0"
+    assert (
+        batches[2][0][1]["content"]
+        == "Part 1: S1.0\n\nS1.1\n\nS1.2\n\nPart 2: S2.1\n\nPart 3: S1.6"
+    )
+
+
+@pytest.mark.unit
+def test_generate_summary_extractive(patch_config):
+    """Test that the extractive summary strategy makes no LLM request."""
+    mock_client = MagicMock()
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["summary"] = {"strategy": "extractive", "extractive_sentences": 2}
+    document_text = " ".join(
+        f"Sentence {i} explains how synthetic data supports model training." for i in range(20)
+    )
+
+    summary = generator.generate_summary(document_text)
+
+    assert summary.startswith("Sentence")
+    assert len(summary) <= 600
+    assert not mock_client.chat_completion.called
+    assert not mock_client.batch_completion.called
+    assert generator.summarizer.stats["strategy"] == "extractive"
+
+
+@pytest.mark.unit
+def test_process_document_overlaps_summary_and_chunks(patch_config, llm_client_factory):
+    """Test that chunk requests start while the summary is still being generated."""
+    import threading
+
+    mock_client = llm_client_factory.create_client()
+    chunks_started = threading.Event()
+
+    def chat_completion(*args, **kwargs):
+        # The summary only finishes once the chunk requests have started
+        assert chunks_started.wait(timeout=5)
+        return "LLM summary of the document."
+
+    def iter_completion(message_batches, **kwargs):
+        chunks_started.set()
+        prompts.extend(message_batches)
+        pair = {"question": "What is synthetic data?", "answer": "Generated data."}
+        return ((index, json.dumps([pair])) for index in range(len(message_batches)))
+
+    prompts = []
+    mock_client.chat_completion.side_effect = chat_completion
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["summary"] = {"strategy": "single", "concurrent": True}
+    generator.config["prompts"]["qa_generation"] = (
+        "Summary: {summary}\nMake {num_pairs} pairs from: {text}"
+    )
+    document_text = "Synthetic data generation creates training examples for language models."
+
+    result = generator.process_document(document_text, num_pairs=1)
+
+    assert result["summary"] == "LLM summary of the document."
+    assert len(result["qa_pairs"]) == 1
+    # Chunk prompts carry the provisional extractive summary
+    assert prompts[0][0]["content"].startswith(f"Summary: {document_text}\n")
+
+
+@pytest.mark.unit
+def test_generate_qa_pairs_selects_chunks_for_target(patch_config, llm_client_factory):
+    """Test that only the chunks the target needs are requested, topping up when yields fall short."""
+    mock_client = llm_client_factory.create_client()
+    requests = []
+
+    def iter_completion(message_batches, **kwargs):
+        requests.append([messages[0]["content"] for messages in message_batches])
+        for index, prompt in enumerate(requests[-1]):
+            # Chunks of even paragraphs yield a pair, odd ones nothing
+            paragraph = int(prompt.split("Paragraph ")[1].split(" ")[0])
+            pairs = [{"question": f"Q{paragraph}?", "answer": "A."}] if paragraph % 2 == 0 else []
+            yield index, json.dumps(pairs)
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config.update({"chunk_size": 50, "overlap": 0})
+    # Paragraphs 5, 15, 25 and 35 have the most distinct words
+    document_text = "\n\n".join(
+        f"Paragraph {i} of the document about data."
+        + (" Richer wording here." if i % 10 == 5 else "")
+        for i in range(40)
+    )
+
+    qa_pairs = generator.generate_qa_pairs(document_text, summary="Summary", num_pairs=4)
+
+    # The richest chunk of each quarter first; none yields, so 4 more are requested
+    assert [len(batch) for batch in requests] == [4, 4]
+    assert [f"Paragraph {i} " in p for i, p in zip((5, 15, 25, 35), requests[0])] == [True] * 4
+    assert [pair["question"] for pair in qa_pairs] == ["Q0?", "Q10?", "Q20?", "Q30?"]
+    assert generator.selection_stats == {
+        "chunks": 40,
+        "requested": 8,
+        "top_up_rounds": 1,
+        "calls_avoided": 0,
+    }
+
+
+@pytest.mark.unit
+def test_generate_qa_pairs_cancels_requests_at_target(patch_config, llm_client_factory):
+    """Test that outstanding chunk requests are cancelled once the target is met, and counted."""
+    mock_client = llm_client_factory.create_client()
+    closed = []
+
+    def iter_completion(message_batches, **kwargs):
+        sent = 0
+        try:
+            for index in range(len(message_batches)):
+                pairs = [{"question": f"Q{index}.{i}?", "answer": "A."} for i in range(3)]
+                sent += 1
+                yield index, json.dumps(pairs)
+        finally:
+            closed.append(True)
+            mock_client.early_stop["not_sent"] += len(message_batches) - sent
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config.update({"chunk_size": 50, "overlap": 0})
+    document_text = "\n\n".join(f"Paragraph {i} of the document about data." for i in range(5))
+
+    result = generator.process_document(document_text, num_pairs=5)
+
+    # Two of the five chunk responses reach the target; the other three are cancelled
+    assert len(result["qa_pairs"]) == 5
+    assert closed == [True]
+    assert result["metrics"]["chunk_selection"] == {
+        "chunks": 5,
+        "requested": 5,
+        "top_up_rounds": 0,
+        "calls_avoided": 3,
+    }
+
+
+@pytest.mark.unit
+def test_process_document_summarizes_first_without_numpy(patch_config, llm_client_factory):
+    """Test that concurrent summaries fall back to the sequential path when NumPy is missing."""
+    mock_client = llm_client_factory.create_client()
+    mock_client.chat_completion.return_value = "LLM summary of the document."
+    pair = {"question": "What is synthetic data?", "answer": "Generated data."}
+    prompts = []
+
+    def iter_completion(message_batches, **kwargs):
+        prompts.extend(message_batches)
+        return ((index, json.dumps([pair])) for index in range(len(message_batches)))
+
+    mock_client.iter_completion.side_effect = iter_completion
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["summary"] = {"strategy": "single", "concurrent": True}
+    generator.config["prompts"]["qa_generation"] = (
+        "Summary: {summary}\nMake {num_pairs} pairs from: {text}"
+    )
+
+    with patch("synthetic_data_kit.generators.qa_generator.NUMPY_AVAILABLE", False):
+        result = generator.process_document("Synthetic data trains language models.", num_pairs=1)
+
+    assert result["summary"] == "LLM summary of the document."
+    assert prompts[0][0]["content"].startswith("Summary: LLM summary of the document.\n")
+
+
+@pytest.mark.unit
+def test_process_document_keeps_pairs_when_concurrent_summary_fails(
+    patch_config, llm_client_factory
+):
+    """Test that a summary cut off by the deadline does not discard the generated pairs."""
+    from synthetic_data_kit.utils.deadline import DeadlineExceededError
+
+    mock_client = llm_client_factory.create_client()
+    mock_client.chat_completion.side_effect = DeadlineExceededError(
+        "Deadline exceeded before the request was sent"
+    )
+    pair = {"question": "What is synthetic data?", "answer": "Generated data."}
+    mock_client.iter_completion.side_effect = lambda message_batches, **kwargs: (
+        (index, json.dumps([pair])) for index in range(len(message_batches))
+    )
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["summary"] = {"strategy": "single", "concurrent": True}
+    document_text = "Synthetic data generation creates training examples for language models."
+
+    result = generator.process_document(document_text, num_pairs=1)
+
+    assert result["qa_pairs"] == [pair]
+    assert result["summary"] == document_text
+    assert result["metrics"]["summary"]["strategy"] == "provisional"
+
+
+@pytest.mark.unit
+def test_process_document_saves_partial_result_when_deadline_hits_summary(
+    patch_config, llm_client_factory
+):
+    """Test that the sequential path stops cleanly when the deadline passes during the summary."""
+    from synthetic_data_kit.utils.deadline import DeadlineExceededError, set_deadline
+
+    mock_client = llm_client_factory.create_client()
+    mock_client.chat_completion.side_effect = DeadlineExceededError(
+        "Deadline exceeded before the request was sent"
+    )
+    mock_client.iter_completion.side_effect = lambda message_batches, **kwargs: (
+        (index, "ERROR: Deadline exceeded") for index in range(len(message_batches))
+    )
+
+    generator = QAGenerator(client=mock_client)
+    generator.generation_config["summary"] = {"strategy": "single", "concurrent": False}
+    document_text = "Synthetic data generation creates training examples for language models."
+
+    set_deadline(-1)
+    try:
+        result = generator.process_document(document_text, num_pairs=1)
+    finally:
+        set_deadline(None)
+
+    assert result["qa_pairs"] == []
+    assert result["summary"] == document_text
+    assert result["metrics"]["summary"] == {
+        "strategy": "provisional",
+        "error": "Deadline exceeded before the request was sent",
+    }
@@ -0,0 +1,55 @@
+"""Unit tests for the token-bucket rate limiter."""
+
+import asyncio
+import time
+
+import pytest
+
+from synthetic_data_kit.models.rate_limiter import RateLimiter, create_rate_limiter
+
+
+@pytest.mark.unit
+def test_rate_limiter_enforces_requests_per_minute():
+    """Test that requests beyond the RPM budget wait for the bucket to refill."""
+    # 600 RPM = 10 requests per second, with a burst of 600
+    limiter = RateLimiter(requests_per_minute=600)
+    limiter._requests.level = 2
+
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire(tokens=10)
+    elapsed = time.monotonic() - start
+
+    # Two requests were free, the other two needed ~0.1s each
+    assert 0.15 <= elapsed < 1.0
+    assert limiter.snapshot()["total_wait_seconds"] > 0
+
+
+@pytest.mark.unit
+def test_rate_limiter_reconciles_with_usage():
+    """Test that the token estimate is corrected with the reported usage."""
+    limiter = RateLimiter(tokens_per_minute=1000)
+
+    asyncio.run(limiter.acquire_async(100))
+    assert limiter._tokens.level == pytest.approx(900, abs=1)
+
+    # The server reports more tokens than estimated, so the difference is charged
+    limiter.reconcile(100, {"prompt_tokens": 120, "completion_tokens": 380, "total_tokens": 500})
+    assert limiter._tokens.level == pytest.approx(500, abs=1)
+
+    # Unknown usage leaves the estimate in place
+    limiter.reconcile(100, None)
+    assert limiter._tokens.level == pytest.approx(500, abs=1)
+
+
+@pytest.mark.unit
+def test_create_rate_limiter_from_config():
+    """Test that a limiter is only created when a budget is configured."""
+    assert create_rate_limiter({}) is None
+    assert create_rate_limiter({"rate_limit": {"requests_per_minute": None}}) is None
+
+    limiter = create_rate_limiter(
+        {"rate_limit": {"requests_per_minute": 60, "tokens_per_minute": 1000}}
+    )
+    assert limiter.requests_per_minute == 60
+    assert limiter.tokens_per_minute == 1000
@@ -0,0 +1,89 @@
+"""Unit tests for the on-disk LLM response cache."""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from synthetic_data_kit.models.response_cache import ResponseCache, cache_key, create_response_cache
+
+
+@pytest.mark.unit
+def test_cache_key_covers_request_parameters():
+    """Test that every sampling parameter changes the key."""
+    messages = [{"role": "user", "content": "hello"}]
+    base = cache_key("model", messages, 0.1, 0.95, 100)
+
+    assert base == cache_key("model", [{"content": "hello", "role": "user"}], 0.1, 0.95, 100)
+    assert base != cache_key("other", messages, 0.1, 0.95, 100)
+    assert base != cache_key("model", messages, 0.2, 0.95, 100)
+    assert base != cache_key("model", messages, 0.1, 0.9, 100)
+    assert base != cache_key("model", messages, 0.1, 0.95, 200)
+
+
+@pytest.mark.unit
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    """Test that entries beyond the size limit are evicted in LRU order."""
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_size_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+
+    # Touch "a" so that "b" becomes the least recently used entry
+    assert cache.get("a") == "x" * 10
+    cache.put("c", "z" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
+    assert cache.get("c") == "z" * 10
+
+    stats = cache.snapshot()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+    # Entries survive reopening the file
+    cache.close()
+    assert ResponseCache(str(tmp_path / "responses.sqlite"), 25).get("c") == "z" * 10
+
+
+@pytest.mark.unit
+def test_create_response_cache_from_config(tmp_path):
+    """Test that the cache is opt-in."""
+    assert create_response_cache(None) is None
+    assert create_response_cache({"enabled": False}) is None
+
+    cache = create_response_cache(
+        {"enabled": True, "path": str(tmp_path / "r.sqlite"), "max_size_mb": 1}
+    )
+    assert cache.max_size_bytes == 1024 * 1024
+
+
+@pytest.mark.unit
+def test_response_cache_async_keeps_event_loop_free(tmp_path):
+    """Test that a write waiting on another process's lock does not stall the event loop."""
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path, max_size_bytes=1024)
+    # Stands in for another process writing to the same cache
+    blocker = sqlite3.connect(path, isolation_level=None)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        blocker.execute("BEGIN IMMEDIATE")
+        asyncio.get_running_loop().call_later(0.3, blocker.execute, "COMMIT")
+        await cache.put_async("a", "response")
+        ticker.cancel()
+        return ticks, await cache.get_async("a")
+
+    ticks, cached = asyncio.run(run())
+    assert ticks >= 10
+    assert cached == "response"
+    blocker.close()
+    cache.close()
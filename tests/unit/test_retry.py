@@ -0,0 +1,113 @@
+"""Unit tests for retry backoff and the circuit breaker."""
+
+import pytest
+
+from synthetic_data_kit.models.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    backoff_delay,
+    create_circuit_breaker,
+    is_endpoint_failure,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class ConnectTimeout(Exception):
+    pass
+
+
+@pytest.mark.unit
+def test_backoff_delay_is_jittered_and_capped():
+    """Test that delays stay within the decorrelated jitter bounds."""
+    delay = None
+    delays = []
+    for _ in range(50):
+        previous = delay if delay is not None else 1.0
+        delay = backoff_delay(delay, 1.0, 10.0)
+        assert 1.0 <= delay <= min(10.0, previous * 3)
+        delays.append(delay)
+    # Delays are spread out rather than lock-step
+    assert len(set(delays)) > 1
+    assert max(delays) <= 10.0
+
+
+@pytest.mark.unit
+def test_is_endpoint_failure():
+    """Test which errors count against the endpoint."""
+    assert is_endpoint_failure(StatusError(503))
+    assert is_endpoint_failure(ConnectTimeout())
+    assert not is_endpoint_failure(StatusError(429))
+    assert not is_endpoint_failure(StatusError(400))
+    assert not is_endpoint_failure(KeyError("choices"))
+
+
+@pytest.mark.unit
+def test_circuit_breaker_opens_and_recovers():
+    """Test the closed, open and half-open transitions."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+
+    # Bad requests never open the circuit
+    for _ in range(5):
+        breaker.record_failure(StatusError(400))
+    breaker.before_request()
+
+    breaker.record_failure(StatusError(500))
+    breaker.record_failure(StatusError(500))
+    assert breaker.state == "open"
+
+    # After the timeout a single probe is allowed; a failure reopens the circuit
+    breaker.before_request()
+    assert breaker.state == "half-open"
+    breaker.record_failure(StatusError(502))
+    assert breaker.state == "open"
+
+    breaker.reset_timeout = 60.0
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.reset_timeout = 0.0
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.snapshot() == {"state": "closed", "opened": 2, "rejected": 1}
+
+
+@pytest.mark.unit
+def test_create_circuit_breaker_from_config():
+    """Test that the breaker is on by default and can be disabled."""
+    assert isinstance(create_circuit_breaker({}), CircuitBreaker)
+    assert create_circuit_breaker({"circuit_breaker": {"enabled": False}}) is None
+    assert (
+        create_circuit_breaker({"circuit_breaker": {"failure_threshold": 2}}).failure_threshold == 2
+    )
+
+
+@pytest.mark.unit
+def test_circuit_breaker_releases_abandoned_probe():
+    """Test that a probe ending without an outcome does not leave the circuit half-open."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure(StatusError(503))
+    breaker._opened_at -= 60.0
+
+    # The probe is cancelled: the circuit stays open, with the next probe due at once
+    probe = breaker.before_request()
+    assert probe and breaker.state == "half-open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.release(probe)
+    assert breaker.state == "open"
+    assert breaker.before_request()
+    breaker.record_success()
+    breaker.release(True)
+    assert breaker.state == "closed"
+
+    # A probe that never reports back is replaced after reset_timeout
+    breaker.record_failure(StatusError(503))
+    breaker._opened_at -= 60.0
+    assert breaker.before_request()
+    breaker._probe_started -= 60.0
+    assert breaker.before_request()
@@ -0,0 +1,47 @@
+"""Unit tests for per-task output token budgets."""
+
+import pytest
+
+from synthetic_data_kit.models.token_budget import OutputBudget, create_output_budget
+
+
+@pytest.mark.unit
+def test_output_budget_scales_with_items():
+    """Test that budgets grow with the item count and stay within bounds."""
+    budget = OutputBudget(max_tokens=4096, min_tokens=256, base_tokens=64, headroom=1.5)
+
+    assert budget.budget("qa_generation", 5) == 64 + 90 * 5 * 1.5
+    assert budget.budget("qa_generation", 1) == 256
+    assert budget.budget("qa_generation", 100) == 4096
+    # Unknown tasks get the full max_tokens
+    assert budget.budget("custom_prompt", 5) == 4096
+
+
+@pytest.mark.unit
+def test_output_budget_follows_observed_lengths():
+    """Test that estimates move towards observed output and grow after truncation."""
+    budget = OutputBudget(
+        max_tokens=4096, min_tokens=256, base_tokens=64, headroom=1.5, smoothing=0.2
+    )
+
+    # 5 items of 40 tokens each on top of the base allowance
+    budget.record("qa_generation", 5, "x" * (264 * 4), 739)
+    assert budget.snapshot()["qa_generation"]["tokens_per_item"] == pytest.approx(
+        0.8 * 90 + 0.2 * 40
+    )
+    assert budget.budget("qa_generation", 5) < 64 + 90 * 5 * 1.5
+
+    # A response that fills its budget was cut off
+    budget.record("qa_generation", 5, "x" * (300 * 4), 300)
+    snapshot = budget.snapshot()["qa_generation"]
+    assert snapshot["truncated"] == 1
+    assert snapshot["tokens_per_item"] == pytest.approx(80 * 1.5)
+
+
+@pytest.mark.unit
+def test_create_output_budget_from_config():
+    """Test that budgets are opt-in and capped by generation.max_tokens."""
+    assert create_output_budget({}) is None
+    assert create_output_budget({"output_budget": {"enabled": False}}) is None
+    budget = create_output_budget({"max_tokens": 1024, "output_budget": {"enabled": True}})
+    assert budget.budget("cot_enhancement", 10) == 1024
@@ -159,3 +159,97 @@ def test_get_path_config():
     empty_config = {}
     default_path = config.get_path_config(empty_config, "output", "default")
     assert default_path == "data/output"
+
+
+@pytest.mark.unit
+def test_format_text_prompt_layouts():
+    """Test that the split layout keeps the instructions identical across chunks."""
+    template = "Create {num_pairs} pairs.\n\nText:\n{text}\n\nReturn JSON {{}} only."
+
+    inline = config.format_text_prompt(template, "Chunk one.", num_pairs=3)
+    assert inline == [
+        {
+            "role": "system",
+            "content": "Create 3 pairs.\n\nText:\nChunk one.\n\nReturn JSON {} only.",
+        }
+    ]
+
+    first = config.format_text_prompt(template, "Chunk one.", layout="split", num_pairs=3)
+    second = config.format_text_prompt(template, "Chunk two.", layout="split", num_pairs=3)
+    assert first[0] == second[0]
+    assert first[0]["content"] == "Create 3 pairs.\n\nText:\n\nReturn JSON {} only."
+    assert first[1] == {"role": "user", "content": "Chunk one."}
+
+    with pytest.raises(ValueError):
+        config.format_text_prompt(template, "Chunk one.", layout="interleaved", num_pairs=3)
+
+
+@pytest.mark.unit
+def test_fit_text_to_token_limits():
+    """Test splitting oversized chunks and truncating text to a token limit."""
+    paragraph = " ".join(f"Sentence {i} is here." for i in range(40))
+
+    chunks = text.split_oversized_chunks(["short", paragraph], max_chars=200)
+    assert chunks[0] == "short"
+    assert len(chunks) > 2
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks[1:])
+    assert " ".join(chunks[1:]) == paragraph
+
+    truncated = text.truncate_to_tokens(paragraph, 50)
+    assert len(truncated) <= 50 * text.CHARS_PER_TOKEN
+    assert paragraph.startswith(truncated)
+    assert text.truncate_to_tokens("short", 50) == "short"
+
+
+@pytest.mark.unit
+def test_load_config_returns_independent_copies(tmpdir):
+    """Test that cached configs can be modified without affecting later loads."""
+    config_path = tmpdir.join("config.yaml")
+    config_path.write("generation:\n  chunk_size: 1000\n")
+
+    first = config.load_config(str(config_path))
+    first["generation"]["chunk_size"] = 50
+
+    assert config.load_config(str(config_path))["generation"]["chunk_size"] == 1000
+
+
+@pytest.mark.unit
+def test_extractive_summary():
+    """Test that the extractive summary keeps central sentences in document order."""
+    from synthetic_data_kit.utils.extractive import extractive_summary, split_sentences
+
+    document = (
+        "Page 1 of 3. "
+        "Synthetic data generation creates training examples for language models. "
+        "The weather in the office was pleasant that morning, with a light breeze. "
+        "Language models learn from synthetic training examples generated from documents. "
+        "Generated examples are filtered so that synthetic training data stays accurate. "
+        "Page 1 of 3."
+    )
+
+    assert split_sentences("One. Two!\n\nThree?") == ["One.", "Two!", "Three?"]
+
+    summary = extractive_summary(document, max_sentences=2, max_chars=1000)
+    assert summary == (
+        "Synthetic data generation creates training examples for language models. "
+        "Language models learn from synthetic training examples generated from documents."
+    )
+
+    # The character budget is respected; at least one sentence is always kept
+    assert len(extractive_summary(document, max_sentences=5, max_chars=100)) <= 100
+    assert "weather" not in extractive_summary(document, max_sentences=3, max_chars=1000)
+
+
+@pytest.mark.unit
+def test_select_chunks():
+    """Test that chunks are picked across the whole document."""
+    chunks = [f"Chunk {i} about data." for i in range(10)]
+    chunks[6] = "Chunk 6 covers synthetic training data, evaluation and filtering."
+
+    # One chunk per stretch of the document, the richest one in each
+    assert text.select_chunks(chunks, 2) == [0, 6]
+    assert text.select_chunks(chunks, 5) == [0, 2, 4, 6, 8]
+    # Top-up rounds pick from the chunks not requested yet
+    assert text.select_chunks(chunks, 2, exclude=[0, 6]) == [1, 5]
+    assert text.select_chunks(chunks, 20) == list(range(10))
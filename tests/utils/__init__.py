@@ -6,6 +6,7 @@ from .test_helpers import (
     DirectoryStatsHelper,
     MockConfigHelper,
     TempDirectoryManager,
+    StandInLLMServer,
     SAMPLE_QA_PAIRS,
     SAMPLE_TEXT_CONTENT,
     SAMPLE_FILE_SPECS,
@@ -18,6 +19,7 @@ __all__ = [
     'DirectoryStatsHelper',
     'MockConfigHelper',
     'TempDirectoryManager',
+    'StandInLLMServer',
     'SAMPLE_QA_PAIRS',
     'SAMPLE_TEXT_CONTENT',
     'SAMPLE_FILE_SPECS',
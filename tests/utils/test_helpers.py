@@ -267,4 +267,189 @@ SAMPLE_JSON_SPECS = {
             {"question": "What is testing?", "answer": "Quality assurance process"}
         ]
     }
-}
\ No newline at end of file
+}
+
+class StandInLLMServer:
+    """Minimal OpenAI-compatible chat server running on localhost.
+    
+    Used in place of a real vLLM deployment so that the HTTP transport of
+    LLMClient can be exercised without a GPU. By default every completion
+    echoes the content of the last message. ``delay`` is either a number of
+    seconds or a callable taking the request payload. ``error`` may return a
+    ``(status, headers)`` tuple for a payload to answer it with an HTTP error.
+    Streaming requests get the content as server-sent events of
+    ``stream_chunk`` characters, ``stream_interval`` seconds apart.
+    
+    With ``prefill_seconds_per_char`` set, the server also simulates
+    automatic prefix caching: the rendered prompt is hashed in blocks of
+    ``prefix_block`` characters, blocks already seen at the same position
+    cost nothing, and every other character adds prefill time.
+    
+    With ``max_model_len`` set, ``/models`` reports it the way vLLM does and
+    requests whose prompt (about 4 characters per token) plus ``max_tokens``
+    exceed it are rejected with vLLM's 400 error.
+    """
+    
+    def __init__(self, delay: float = 0.0, responder=None, error=None,
+                 stream_chunk: int = 8, stream_interval: float = 0.0,
+                 prefill_seconds_per_char: float = 0.0, prefix_block: int = 64,
+                 max_model_len: Optional[int] = None):
+        import threading
+        from http.server import ThreadingHTTPServer
+        
+        self.delay = delay
+        self.responder = responder or (lambda payload: payload["messages"][-1]["content"])
+        self.error = error or (lambda payload: None)
+        self.stream_chunk = stream_chunk
+        self.stream_interval = stream_interval
+        self.prefill_seconds_per_char = prefill_seconds_per_char
+        self.prefix_block = prefix_block
+        self.max_model_len = max_model_len
+        self.prompt_chars = 0
+        self.cached_prompt_chars = 0
+        self._cached_blocks = set()
+        self.streamed_events = 0
+        self.models_requests = 0
+        self.requests: List[Dict[str, Any]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def api_base(self) -> str:
+        """Base URL to pass to LLMClient as ``api_base``."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    @property
+    def prefix_cache_hit_rate(self) -> float:
+        """Share of prompt characters served from the simulated prefix cache."""
+        return self.cached_prompt_chars / self.prompt_chars if self.prompt_chars else 0.0
+    
+    def _prefill_delay(self, payload: Dict[str, Any]) -> float:
+        """Record prefix cache hits for a request and return its prefill time."""
+        import hashlib
+        
+        # Render roughly the way a chat template would
+        prompt = "".join(f"<|{m.get('role')}|>{m.get('content') or ''}" for m in payload.get("messages", []))
+        block_hash = b""
+        cached = 0
+        with self._lock:
+            for start in range(0, len(prompt) - self.prefix_block + 1, self.prefix_block):
+                block = prompt[start:start + self.prefix_block].encode("utf-8")
+                block_hash = hashlib.sha256(block_hash + block).digest()
+                if block_hash in self._cached_blocks and cached == start:
+                    cached += self.prefix_block
+                self._cached_blocks.add(block_hash)
+            self.prompt_chars += len(prompt)
+            self.cached_prompt_chars += cached
+        return (len(prompt) - cached) * self.prefill_seconds_per_char
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def _make_handler(self):
+        import time
+        from http.server import BaseHTTPRequestHandler
+        
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def _send_stream(self, content: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                pieces = [content[i:i + server.stream_chunk] for i in range(0, len(content), server.stream_chunk)]
+                try:
+                    for piece in pieces:
+                        event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                        with server._lock:
+                            server.streamed_events += 1
+                        time.sleep(server.stream_interval)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the stream
+                    pass
+            
+            def do_GET(self):
+                with server._lock:
+                    server.models_requests += 1
+                model = {"id": "stand-in-model"}
+                if server.max_model_len:
+                    model["max_model_len"] = server.max_model_len
+                self._send_json(200, {"data": [model]})
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                prompt_tokens = sum(len(m.get("content") or "") for m in payload.get("messages", [])) // 4
+                with server._lock:
+                    server.requests.append(payload)
+                if server.max_model_len and prompt_tokens + payload.get("max_tokens", 0) > server.max_model_len:
+                    self._send_json(400, {"error": {"message": (
+                        f"This model's maximum context length is {server.max_model_len} tokens. However, "
+                        f"you requested {prompt_tokens + payload.get('max_tokens', 0)} tokens."
+                    )}})
+                    return
+                with server._lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    delay = server.delay(payload) if callable(server.delay) else server.delay
+                    if server.prefill_seconds_per_char:
+                        delay += server._prefill_delay(payload)
+                    if delay:
+                        time.sleep(delay)
+                    error = server.error(payload)
+                    content = None if error else server.responder(payload)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                if error:
+                    status, headers = error
+                    self._send_json(status, {"error": {"message": "stand-in error"}}, headers)
+                    return
+                completion_tokens = len(content) // 4
+                if payload.get("stream"):
+                    self._send_stream(content)
+                    return
+                self._send_json(200, {
+                    "choices": [
+                        {"index": i, "message": {"role": "assistant", "content": content}}
+                        for i in range(payload.get("n", 1))
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    }
+                })
+        
+        return Handler